@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+'''
+计时精度校准
+
+功能说明：
+- 启动一个按精确时间表输出token的本地mock服务器（mock_server.py --trace），服务端逐请求记录
+  写完响应头、第一个内容token、最后一个token和结束标记的时刻，作为真实值
+- 逐个（串行，避免相互干扰）通过每条测量路径发送请求，把测得的网络延迟、首token、输出耗时、总耗时
+  和平均token间隔与真实值比较，报告每条路径的偏差（误差均值）、标准差和最大误差
+- 测量路径：stream_client（loadgen.py等异步工具使用的流式客户端）、complete_chat（非流式），
+  以及run_tests.py调用的6个单平台脚本（通过<前缀>_API_KEY、<前缀>_BASE_URL、<前缀>_MODEL_ID环境变量指向mock服务器）；
+  缺少依赖无法运行的脚本标记为跳过
+- 首token偏差接近负的--ttft时，说明把只含role的第一个数据块当成了首token；
+  单平台脚本只输出两位小数，其分辨率为10毫秒
+- --save把各路径的固定偏差写入calibration.json；loadgen.py和run_tests.py启动时自动读取，
+  从测得的网络延迟、首token、输出耗时和总耗时中扣除（绝对值小于MIN_CORRECTION的偏差不修正，
+  单平台脚本为SCRIPT_RESOLUTION），可用--no-calibration关闭
+
+运行命令：
+python calibrate.py
+python calibrate.py --requests 30 --paths stream_client,deepseek_test.py --save
+
+配置参数：
+⭐ --requests：每条路径的请求数（另有--warmup个预热请求不计入统计）
+⭐ --ttft / --itl / --tokens：mock服务器的时间表
+⭐ --paths：要校准的路径，逗号分隔，默认全部
+⭐ --save：把偏差写入校准文件（默认calibration.json）
+'''
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stream_client import ConnectionPool, complete_chat, stream_chat
+
+CALIBRATION_FILE = 'calibration.json'
+
+# 偏差小于1毫秒时不修正，避免把噪声当成系统误差
+MIN_CORRECTION = 0.001
+
+# 单平台脚本只输出两位小数；时间表固定时舍入误差也是固定的（最大5毫秒），
+# 只有超过分辨率的偏差才视为脚本本身的计时误差
+SCRIPT_RESOLUTION = 0.01
+
+# 参与校准的指标（stream_client样本字段名）及报告中的名称
+METRICS = {
+    'network_latency': '网络延迟',
+    'first_token_time': '首token',
+    'output_time': '输出耗时',
+    'total_time': '总耗时',
+    'itl': '平均token间隔'
+}
+
+# 会被自动修正的指标；token间隔由输出耗时决定，不单独修正
+CORRECTED = ['network_latency', 'first_token_time', 'output_time', 'total_time']
+
+# 单平台脚本输出中对应的指标名称（与run_tests.extract_metrics一致）
+SCRIPT_KEYS = {
+    'network_latency': '网络延迟',
+    'first_token_time': '首token响应',
+    'output_time': '输出耗时',
+    'total_time': '总耗时'
+}
+
+# run_tests.py调用的单平台脚本及其读取的平台配置
+SCRIPTS = {
+    'aliyun_test.py': 'aliyun',
+    'huoshanyinqing.py': 'ark',
+    'tencent_test.py': 'tencent',
+    'siliconflow_test.py': 'siliconflow',
+    'openrout.py': 'openrouter',
+    'deepseek_test.py': 'deepseek'
+}
+
+PATHS = ['stream_client', 'complete_chat'] + list(SCRIPTS)
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def load_calibration(filename=CALIBRATION_FILE):
+    """读取校准文件中各路径的修正量 {路径: {指标: 偏差秒数}}，文件不存在时返回空字典"""
+    if not filename or not os.path.exists(filename):
+        return {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f).get('corrections', {})
+
+
+def correct_sample(sample, corrections):
+    """从stream_chat样本中扣除固定偏差（结果不小于0），并重新计算输出速率"""
+    if not corrections or not sample['ok']:
+        return sample
+    for field, bias in corrections.items():
+        if sample.get(field):
+            sample[field] = max(0.0, sample[field] - bias)
+    if sample['output_time'] > 0:
+        sample['output_speed'] = sample['output_tokens'] / sample['output_time']
+    return sample
+
+
+def correct_metrics(metrics, corrections):
+    """从单平台脚本的指标（run_tests.extract_metrics的结果）中扣除固定偏差，并重新计算输出token/s"""
+    if not corrections:
+        return metrics
+    for field, key in SCRIPT_KEYS.items():
+        bias = corrections.get(field)
+        if bias and metrics.get(key) is not None:
+            metrics[key] = round(max(0.0, metrics[key] - bias), 4)
+    if metrics.get('输出Token') and metrics.get('输出耗时'):
+        metrics['输出token/s'] = round(metrics['输出Token'] / metrics['输出耗时'], 2)
+    return metrics
+
+
+def describe_corrections(corrections):
+    """如“首token -1.8毫秒、总耗时 +0.6毫秒”，表示从测得值中扣除的量"""
+    return '、'.join(f'{METRICS[field]} {bias * 1000:+.1f}毫秒' for field, bias in corrections.items())
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(port, ttft, itl, tokens, trace):
+    """以子进程启动mock服务器，端口可连接后返回"""
+    process = subprocess.Popen(
+        [sys.executable, 'mock_server.py', '--port', str(port), '--ttft', str(ttft), '--itl', str(itl),
+         '--tokens', str(tokens), '--trace', trace],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.perf_counter() + 10
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('mock服务器启动失败')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('等待mock服务器启动超时')
+
+
+class TraceReader:
+    """逐行读取mock服务器写入的trace文件；请求是串行发送的，第k行对应第k个到达服务器的请求"""
+
+    def __init__(self, filename):
+        self.file = open(filename, 'r', encoding='utf-8')
+        self.buffer = ''
+
+    async def next(self, timeout=2.0):
+        """等待下一条记录，超时（请求没有到达服务器）返回None"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            self.buffer += self.file.read()
+            if '\n' in self.buffer:
+                line, self.buffer = self.buffer.split('\n', 1)
+                return json.loads(line)
+            if time.perf_counter() >= deadline:
+                return None
+            await asyncio.sleep(0.01)
+
+    async def drain(self):
+        while await self.next(0.3) is not None:
+            pass
+
+    def close(self):
+        self.file.close()
+
+
+def truth_of(record):
+    """服务端记录的真实值；输出耗时为第一个到最后一个内容token"""
+    truth = {
+        'network_latency': record['headers'],
+        'first_token_time': record['first'],
+        'output_time': record['last'] - record['first'],
+        'total_time': record['end']
+    }
+    if record['stream'] and record['tokens'] > 1:
+        truth['itl'] = (record['last'] - record['first']) / (record['tokens'] - 1)
+    return truth
+
+
+class PathResult:
+    def __init__(self, path):
+        self.path = path
+        self.errors = {field: [] for field in METRICS}
+        self.truth = {field: [] for field in METRICS}
+        self.samples = 0
+        self.skipped = None
+
+    def add(self, measured, truth):
+        self.samples += 1
+        for field, value in measured.items():
+            if field in truth:
+                self.errors[field].append(value - truth[field])
+                self.truth[field].append(truth[field])
+
+    def bias(self):
+        return {field: statistics.fmean(errors) for field, errors in self.errors.items() if errors}
+
+    def corrections(self):
+        threshold = SCRIPT_RESOLUTION if self.path in SCRIPTS else MIN_CORRECTION
+        return {field: round(bias, 6) for field, bias in self.bias().items()
+                if field in CORRECTED and abs(bias) >= threshold}
+
+    def summary(self):
+        """{指标: (样本数, 真实值均值, 偏差, 标准差, 最大误差)}"""
+        result = {}
+        for field, errors in self.errors.items():
+            if errors:
+                spread = statistics.pstdev(errors) if len(errors) > 1 else 0.0
+                result[field] = (len(errors), statistics.fmean(self.truth[field]), statistics.fmean(errors),
+                                 spread, max(abs(error) for error in errors))
+        return result
+
+
+async def measure_client(pool, provider, path):
+    """通过stream_client发送一个请求，返回(测得值, 失败原因)"""
+    if path == 'stream_client':
+        sample = await stream_chat(pool, provider, MESSAGES, max_tokens=4096)
+    else:
+        sample = await complete_chat(pool, provider, MESSAGES, max_tokens=4096)
+    if not sample['ok']:
+        return None, f"{sample['error_type']}: {sample['error']}"
+    measured = {field: sample[field] for field in SCRIPT_KEYS}
+    if path == 'stream_client':
+        if sample['itl']:
+            measured['itl'] = statistics.fmean(sample['itl'])
+    else:
+        # 非流式响应只有总耗时有意义
+        measured = {'total_time': sample['total_time']}
+    return measured, None
+
+
+async def measure_script(script):
+    """运行单平台脚本，返回(测得值, 失败原因)"""
+    from run_tests import describe_failure, extract_metrics, is_failed, run_test
+    output = await run_test(script, 60)
+    if not output.strip():
+        # run_test不保留stderr，没有任何输出通常是导入失败
+        return None, f'脚本没有输出，可能缺少依赖（可运行 python {script} 查看）'
+    metrics = extract_metrics(output)
+    if is_failed(metrics) or metrics['首token响应'] is None:
+        return None, describe_failure(metrics) if is_failed(metrics) else '未能解析脚本输出'
+    return {field: metrics[key] for field, key in SCRIPT_KEYS.items() if metrics[key] is not None}, None
+
+
+def point_scripts_at(base_url):
+    """让所有单平台脚本通过环境变量连接mock服务器（子进程继承）"""
+    from config import PROVIDERS
+    for name in SCRIPTS.values():
+        spec = PROVIDERS[name]
+        url = base_url
+        if spec.get('suffix') and url.endswith(spec['suffix']):
+            # 硅基流动脚本自行拼接/v1
+            url = url[:-len(spec['suffix'])]
+        os.environ[f"{spec['prefix']}_API_KEY"] = 'mock'
+        os.environ[f"{spec['prefix']}_BASE_URL"] = url
+        os.environ[f"{spec['prefix']}_MODEL_ID"] = 'mock-model'
+
+
+async def calibrate_path(path, pool, provider, trace, requests, warmup):
+    result = PathResult(path)
+    for index in range(warmup + requests):
+        if path in SCRIPTS:
+            measured, error = await measure_script(path)
+        else:
+            measured, error = await measure_client(pool, provider, path)
+        if error:
+            # mock服务器上不应出现失败，失败说明这条路径无法运行，跳过其余请求
+            result.skipped = error
+            await trace.drain()
+            return result
+        record = await trace.next()
+        if record is None:
+            result.skipped = '服务器没有收到请求'
+            return result
+        if index >= warmup:
+            result.add(measured, truth_of(record))
+    return result
+
+
+def print_results(results, ttft):
+    from tabulate import tabulate
+    rows = []
+    for result in results:
+        if result.skipped:
+            rows.append([result.path, '跳过', '', '', '', '', '', result.skipped])
+            continue
+        for field, (count, truth, bias, spread, worst) in result.summary().items():
+            rows.append([result.path, METRICS[field], count, f'{truth * 1000:.1f}', f'{bias * 1000:+.2f}',
+                         f'{spread * 1000:.2f}', f'{worst * 1000:.2f}', ''])
+    headers = ['路径', '指标', '样本数', '真实值(ms)', '偏差(ms)', '标准差(ms)', '最大误差(ms)', '说明']
+    print(tabulate(rows, headers=headers, tablefmt='grid', disable_numparse=True))
+    for result in results:
+        bias = result.bias().get('first_token_time')
+        if bias is not None and bias < -ttft / 2:
+            print(f'⚠️ {result.path} 的首token提前了{-bias * 1000:.0f}毫秒，可能把只含role的数据块当成了首token')
+    if any(result.path in SCRIPTS and not result.skipped for result in results):
+        print('注意: 单平台脚本只输出两位小数（10毫秒分辨率），偏差中包含最大5毫秒的固定舍入误差，'
+              f'保存时只修正超过{SCRIPT_RESOLUTION * 1000:.0f}毫秒的偏差')
+
+
+def save_calibration(results, args, filename):
+    data = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'schedule': {'ttft': args.ttft, 'itl': args.itl, 'tokens': args.tokens},
+        'requests': args.requests,
+        'paths': {
+            result.path: {field: {'samples': count, 'bias': bias, 'std': spread, 'max_error': worst}
+                          for field, (count, truth, bias, spread, worst) in result.summary().items()}
+            for result in results if not result.skipped
+        },
+        'corrections': {result.path: result.corrections() for result in results
+                        if not result.skipped and result.corrections()}
+    }
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f'\n校准结果已保存到文件: {filename}')
+    for path, corrections in data['corrections'].items():
+        print(f'- {path}: {describe_corrections(corrections)}')
+
+
+async def run(args):
+    from loadgen import resolve_provider
+    paths = [path.strip() for path in args.paths.split(',') if path.strip()] if args.paths else PATHS
+    unknown = [path for path in paths if path not in PATHS]
+    if unknown:
+        raise SystemExit(f"未知的路径: {', '.join(unknown)}（可选: {', '.join(PATHS)}）")
+
+    handle, trace_file = tempfile.mkstemp(suffix='.jsonl', prefix='calibrate-')
+    os.close(handle)
+    port = free_port()
+    mock = start_mock(port, args.ttft, args.itl, args.tokens, trace_file)
+    trace = TraceReader(trace_file)
+    base_url = f'http://127.0.0.1:{port}/v1'
+    point_scripts_at(base_url)
+    provider = resolve_provider('mock', base_url)
+    pool = ConnectionPool()
+    results = []
+    try:
+        for path in paths:
+            print(f'正在校准 {path} ...')
+            results.append(await calibrate_path(path, pool, provider, trace, args.requests, args.warmup))
+    finally:
+        await pool.close()
+        trace.close()
+        mock.kill()
+        mock.wait()
+        os.remove(trace_file)
+
+    print(f'\nmock时间表: 首token {args.ttft}秒, token间隔 {args.itl}秒, {args.tokens}个token; 偏差 = 测得值 - 真实值')
+    print_results(results, args.ttft)
+    if args.save:
+        save_calibration(results, args, args.save)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='计时精度校准')
+    parser.add_argument('--requests', type=int, default=20, help='每条路径的请求数')
+    parser.add_argument('--warmup', type=int, default=1, help='每条路径不计入统计的预热请求数')
+    parser.add_argument('--ttft', type=float, default=0.3, help='mock服务器的首token延迟（秒）')
+    parser.add_argument('--itl', type=float, default=0.02, help='mock服务器的token间隔（秒）')
+    parser.add_argument('--tokens', type=int, default=20, help='mock服务器每个请求输出的token数')
+    parser.add_argument('--paths', help=f"要校准的路径，逗号分隔（可选: {', '.join(PATHS)}）")
+    parser.add_argument('--save', nargs='?', const=CALIBRATION_FILE, help='把偏差写入校准文件')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+'''
+最大可持续并发搜索工具
+
+功能说明：
+- 针对每个平台，自动寻找p95首token延迟和p95 token间隔均满足SLO的最高并发（或QPS）
+- 搜索过程：先倍增探测上限，出现违约后在最后一个达标值与首个违约值之间二分
+- 每一档采用统计停止规则：按分位数的无分布置信区间判断，
+  区间整体低于目标即判定达标，整体高于目标即判定违约，否则继续采样直到上限时长
+- 输出每个平台的单一容量数值，可直接作为生产路由权重的输入
+- 某一档违约时若压测客户端自身受限（事件循环滞后或CPU占满），该档记为“客户端受限”，
+  搜索在此停止，结果只代表客户端能测到的下限，不归咎于平台
+
+运行命令：
+python capacity_search.py --providers ark,aliyun --ttft-slo 2.0 --itl-slo 0.1
+python capacity_search.py --providers mock --mode qps --ttft-slo 0.5 --itl-slo 0.05
+
+配置参数：
+⭐ --ttft-slo / --itl-slo：p95首token延迟和p95 token间隔的目标（秒）
+⭐ --mode：concurrency（闭环并发）或 qps（开环请求速率）
+⭐ --window：每次采样的时长（秒），每档至少采样一个窗口
+⭐ --max-step：每档的最长采样时长（秒）
+⭐ --max-error-rate：允许的最大失败率，超过即判定违约
+'''
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+
+from histogram import ProviderStats, RunStats
+from loadgen import DEFAULT_MESSAGES, MOCK_BASE_URL, make_plan, resolve_provider, run_load, run_multiprocess
+from stream_client import ConnectionPool
+
+# 95%置信度对应的正态分位数
+Z_95 = 1.96
+
+
+def quantile_bounds(hist, p, z=Z_95):
+    """分位数的无分布置信区间：基于二项分布的秩区间(正态近似)"""
+    n = hist.count
+    q = p / 100.0
+    spread = z * math.sqrt(n * q * (1 - q))
+    lower = hist.value_at_rank(math.floor(n * q - spread))
+    upper = hist.value_at_rank(math.ceil(n * q + spread) + 1)
+    return lower, upper
+
+
+def judge(stats, slo, final=False):
+    """判断一档的结果：返回 'pass'、'fail' 或 None（尚不能确定）"""
+    if stats.requests and sum(stats.errors.values()) / stats.requests > slo['max_error_rate']:
+        return 'fail'
+    checks = [
+        (stats.hists['first_token_time'], slo['ttft']),
+        (stats.hists['itl'], slo['itl'])
+    ]
+    if any(hist.count < slo['min_samples'] for hist, _ in checks):
+        return 'fail' if final else None
+
+    verdict = 'pass'
+    for hist, target in checks:
+        if final:
+            # 达到最长采样时长后按点估计判断
+            if hist.percentile(95) > target:
+                return 'fail'
+            continue
+        lower, upper = quantile_bounds(hist, 95)
+        if lower > target:
+            return 'fail'
+        if upper > target:
+            verdict = None
+    return verdict
+
+
+class CapacitySearch:
+    def __init__(self, provider, slo, mode='concurrency', start=1, limit=1024,
+                 window=10.0, max_step=60.0, processes=1, messages=None, max_tokens=512):
+        self.provider = provider
+        self.slo = slo
+        self.mode = mode
+        self.start = start
+        self.limit = limit
+        self.window = window
+        self.max_step = max_step
+        self.processes = processes
+        self.messages = messages or DEFAULT_MESSAGES
+        self.max_tokens = max_tokens
+        self.history = []
+        self.client_limited = False
+
+    def _plan(self, level):
+        return make_plan(
+            [self.provider],
+            concurrency=int(level) if self.mode == 'concurrency' else 0,
+            qps=float(level) if self.mode == 'qps' else 0.0,
+            duration=self.window,
+            messages=self.messages,
+            max_tokens=self.max_tokens
+        )
+
+    async def _window(self, plan, pool):
+        if self.processes > 1:
+            loop = asyncio.get_running_loop()
+            run = await loop.run_in_executor(None, run_multiprocess, plan, self.processes)
+        else:
+            run = await run_load(plan, pool)
+        return run
+
+    async def evaluate(self, level, pool):
+        """对一档负载持续采样，直到可以做出统计判断"""
+        stats = ProviderStats()
+        run = RunStats()
+        elapsed = 0.0
+        verdict = None
+        plan = self._plan(level)
+        while verdict is None:
+            window = await self._window(plan, pool)
+            stats.merge(window.get(self.provider['name']))
+            run.merge(window)
+            elapsed += self.window
+            verdict = judge(stats, self.slo, final=elapsed >= self.max_step)
+        client_bound = run.resources.client_bound() if run.resources else []
+        if verdict == 'fail' and client_bound:
+            # 违约可能由压测客户端自身造成，不能据此判定平台的容量
+            verdict = 'client_bound'
+
+        ttft = stats.hists['first_token_time'].percentile(95)
+        itl = stats.hists['itl'].percentile(95)
+        self.history.append({
+            'level': level,
+            'verdict': verdict,
+            'seconds': elapsed,
+            'requests': stats.requests,
+            'ttft_p95': ttft,
+            'itl_p95': itl,
+            'client_bound': client_bound
+        })
+        label = {'pass': '✅ 达标', 'fail': '❌ 违约', 'client_bound': '⚠️ 客户端受限'}[verdict]
+        print(f"  {self.provider['name']} {self.mode}={level}: {label} "
+              f"(p95首token {ttft:.2f}秒, p95 token间隔 {itl * 1000:.1f}毫秒, {stats.requests}个请求, {elapsed:.0f}秒)")
+        if client_bound:
+            print(f"    客户端资源: {'；'.join(client_bound)}")
+        return verdict
+
+    def _midpoint(self, good, bad):
+        if self.mode == 'concurrency':
+            return (good + bad) // 2
+        return round((good + bad) / 2, 2)
+
+    def _resolved(self, good, bad):
+        # 并发精确到1，QPS精确到5%
+        if self.mode == 'concurrency':
+            return bad - good <= 1
+        return bad - good <= max(0.1, good * 0.05)
+
+    async def run(self):
+        """倍增探测 + 二分搜索，返回满足SLO的最高负载（无一档达标时为0）
+
+        客户端受限的档与违约同样视为上界；若最终的上界是客户端受限的档，
+        self.client_limited为True，返回值只是客户端能测到的下限。
+        """
+        pool = ConnectionPool()
+        try:
+            good, bad = 0, None
+            level = self.start
+            while bad is None:
+                verdict = await self.evaluate(level, pool)
+                if verdict == 'pass':
+                    good = level
+                    if level >= self.limit:
+                        return good
+                    level = min(level * 2, self.limit)
+                else:
+                    bad = level
+                    self.client_limited = verdict == 'client_bound'
+
+            while not self._resolved(good, bad):
+                level = self._midpoint(good, bad)
+                if level <= good:
+                    break
+                verdict = await self.evaluate(level, pool)
+                if verdict == 'pass':
+                    good = level
+                else:
+                    bad = level
+                    self.client_limited = verdict == 'client_bound'
+            return good
+        finally:
+            await pool.close()
+
+
+async def search_all(providers, slo, args):
+    results = {}
+    for provider in providers:
+        print(f"\n开始搜索 {provider['name']} 的最大可持续{'并发' if args.mode == 'concurrency' else 'QPS'}...")
+        search = CapacitySearch(
+            provider, slo,
+            mode=args.mode,
+            start=args.start,
+            limit=args.limit,
+            window=args.window,
+            max_step=args.max_step,
+            processes=args.processes,
+            messages=[{"role": "user", "content": args.prompt}],
+            max_tokens=args.max_tokens
+        )
+        capacity = await search.run()
+        results[provider['name']] = {
+            'capacity': capacity,
+            'client_limited': search.client_limited,
+            'history': search.history
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='最大可持续并发搜索工具')
+    parser.add_argument('--providers', default='mock', help='平台名称，逗号分隔')
+    parser.add_argument('--mode', choices=['concurrency', 'qps'], default='concurrency')
+    parser.add_argument('--ttft-slo', type=float, required=True, help='p95首token延迟目标（秒）')
+    parser.add_argument('--itl-slo', type=float, required=True, help='p95 token间隔目标（秒）')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='允许的最大失败率')
+    parser.add_argument('--min-samples', type=int, default=20, help='做出判断所需的最少样本数')
+    parser.add_argument('--start', type=float, default=1, help='初始并发/QPS')
+    parser.add_argument('--limit', type=float, default=1024, help='搜索上限')
+    parser.add_argument('--window', type=float, default=10.0, help='每次采样的时长（秒）')
+    parser.add_argument('--max-step', type=float, default=60.0, help='每档的最长采样时长（秒）')
+    parser.add_argument('--processes', type=int, default=1, help='worker进程数量')
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--prompt', default=DEFAULT_MESSAGES[0]['content'], help='测试消息')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    args = parser.parse_args()
+    if args.mode == 'concurrency':
+        args.start, args.limit = int(args.start), int(args.limit)
+
+    slo = {
+        'ttft': args.ttft_slo,
+        'itl': args.itl_slo,
+        'max_error_rate': args.max_error_rate,
+        'min_samples': args.min_samples
+    }
+    providers = [resolve_provider(name.strip(), args.mock_url) for name in args.providers.split(',') if name.strip()]
+
+    print("===== 最大可持续并发搜索 =====")
+    print(f"SLO: p95首token ≤ {slo['ttft']}秒, p95 token间隔 ≤ {slo['itl'] * 1000:.0f}毫秒, 失败率 ≤ {slo['max_error_rate']:.1%}")
+    results = asyncio.run(search_all(providers, slo, args))
+
+    unit = '并发' if args.mode == 'concurrency' else 'QPS'
+    rows = []
+    for name, result in results.items():
+        passed = [step for step in result['history'] if step['verdict'] == 'pass' and step['level'] == result['capacity']]
+        step = passed[-1] if passed else {'ttft_p95': 0.0, 'itl_p95': 0.0}
+        capacity = f"≥{result['capacity']}（客户端受限）" if result['client_limited'] else result['capacity']
+        rows.append([name, capacity, step['ttft_p95'], step['itl_p95'] * 1000, len(result['history'])])
+    from tabulate import tabulate
+
+    print("\n各平台容量：")
+    print(tabulate(rows, headers=['平台', f'最大{unit}', 'p95首token(秒)', 'p95 token间隔(毫秒)', '搜索档数'],
+                   tablefmt='grid', floatfmt=".2f"))
+
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'capacity_{timestamp}.json'
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({
+            'mode': args.mode,
+            'slo': slo,
+            'capacity': {name: result['capacity'] for name, result in results.items()},
+            'client_limited': [name for name, result in results.items() if result['client_limited']],
+            'history': {name: result['history'] for name, result in results.items()}
+        }, f, ensure_ascii=False, indent=2)
+    print(f'\n容量结果已保存到文件: {filename}')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,70 +5,128 @@
 
 功能说明：
 - 集中管理所有API配置
-- 自动加载环境变量
-- 提供配置验证功能
+- 首次访问某个平台的配置时才加载环境变量并解析，导入本模块几乎没有开销
+- 只验证实际用到的平台的API密钥，缺少其他平台的密钥不影响单平台测试
+- 统一管理流式请求各阶段的超时时间，可通过环境变量 STREAM_<阶段>_TIMEOUT 覆盖
 '''
 
 import os
-from dotenv import load_dotenv
+
+# 各平台的环境变量前缀和默认配置
+# API密钥读取 <前缀>_API_KEY；<前缀>_BASE_URL、<前缀>_MODEL_ID 存在时覆盖默认的地址和模型，
+# 与各单平台测试脚本读取的环境变量保持一致
+# embedding_model为OpenAI兼容/embeddings接口使用的模型，可用<前缀>_EMBEDDING_MODEL_ID覆盖
+PROVIDERS = {
+    # 方舟API配置
+    'ark': {
+        'prefix': 'ARK',
+        'base_url': 'https://ark.cn-beijing.volces.com/api/v3',
+        'model': 'deepseek-v3-241226'
+    },
+    # 阿里云API配置
+    'aliyun': {
+        'prefix': 'ALIYUN',
+        'base_url': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
+        'model': 'deepseek-r1',
+        'embedding_model': 'text-embedding-v3'
+    },
+    # 腾讯云API配置
+    'tencent': {
+        'prefix': 'TENCENT',
+        'base_url': 'https://api.lkeap.cloud.tencent.com/v1',
+        'model': 'deepseek-r1'
+    },
+    # 硅基流动平台API配置（SILICONFLOW_BASE_URL按siliconflow_test.py的约定不含/v1）
+    'siliconflow': {
+        'prefix': 'SILICONFLOW',
+        'base_url': 'https://api.siliconflow.cn/v1',
+        'model': 'deepseek-ai/DeepSeek-R1',
+        'embedding_model': 'BAAI/bge-m3',
+        'suffix': '/v1'
+    },
+    # OpenRouter API配置
+    'openrouter': {
+        'prefix': 'OPENAI',
+        'base_url': 'https://openrouter.ai/api/v1',
+        'model': 'deepseek/deepseek-r1'
+    },
+    # DeepSeek官方API配置
+    'deepseek': {
+        'prefix': 'DEEPSEEK',
+        'base_url': 'https://api.deepseek.com',
+        'model': 'deepseek-reasoner'
+    }
+}
+
+# 流式请求各阶段的默认超时（秒），0表示不限制
+# connect：建立连接；ttft：发送请求到首token；idle：相邻数据块的间隔；total：整个请求
+TIMEOUTS = {
+    'connect': 10.0,
+    'ttft': 60.0,
+    'idle': 30.0,
+    'total': 300.0
+}
+
 
 class APIConfig:
     def __init__(self):
-        # 加载环境变量
-        load_dotenv()
-        
-        # 验证必要的环境变量
-        self._validate_env_vars()
-        
-        # 初始化配置
-        self.init_configs()
-    
-    def _validate_env_vars(self):
-        """验证必要的环境变量是否存在"""
-        required_vars = [
-            'ARK_API_KEY',
-            'ALIYUN_API_KEY',
-            'TENCENT_API_KEY',
-            'SILICONFLOW_API_KEY'
-        ]
-        
-        missing_vars = [var for var in required_vars if not os.getenv(var)]
-        if missing_vars:
-            raise ValueError(f'缺少必要的环境变量: {", ".join(missing_vars)}')
-    
-    def init_configs(self):
-        """初始化各API配置"""
-        # 方舟API配置
-        self.ark = {
-            'api_key': os.getenv('ARK_API_KEY'),
-            'base_url': 'https://ark.cn-beijing.volces.com/api/v3',
-            'model': 'deepseek-v3-241226',
-            'stream': True
-        }
-        
-        # 阿里云API配置
-        self.aliyun = {
-            'api_key': os.getenv('ALIYUN_API_KEY'),
-            'base_url': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
-            'model': 'deepseek-r1',
-            'stream': True
-        }
-        
-        # 腾讯云API配置
-        self.tencent = {
-            'api_key': os.getenv('TENCENT_API_KEY'),
-            'base_url': 'https://api.lkeap.cloud.tencent.com/v1',
-            'model': 'deepseek-r1',
+        self._env_loaded = False
+
+    def _load_env(self):
+        """加载.env中的环境变量（只执行一次）"""
+        if not self._env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            self._env_loaded = True
+
+    def getenv(self, name, default=None):
+        """读取环境变量（首次调用时加载.env）"""
+        self._load_env()
+        return os.getenv(name, default)
+
+    def _resolve(self, name):
+        """解析单个平台的配置，缺少该平台的API密钥时抛出ValueError"""
+        spec = PROVIDERS[name]
+        key_var = f"{spec['prefix']}_API_KEY"
+        api_key = self.getenv(key_var)
+        if not api_key:
+            raise ValueError(f'缺少必要的环境变量: {key_var}')
+        base_url = self.getenv(f"{spec['prefix']}_BASE_URL") or spec['base_url']
+        suffix = spec.get('suffix')
+        if suffix and not base_url.rstrip('/').endswith(suffix):
+            base_url = base_url.rstrip('/') + suffix
+        return {
+            'api_key': api_key,
+            'base_url': base_url,
+            'model': self.getenv(f"{spec['prefix']}_MODEL_ID") or spec['model'],
+            'embedding_model': self.getenv(f"{spec['prefix']}_EMBEDDING_MODEL_ID") or spec.get('embedding_model'),
             'stream': True
         }
-        
-        # 硅基流动平台API配置
-        self.siliconflow = {
-            'api_key': os.getenv('SILICONFLOW_API_KEY'),
-            'base_url': 'https://api.siliconflow.com/v1',
-            'model': 'deepseek-ai/DeepSeek-R1',
-            'stream': True
+
+    def __getattr__(self, name):
+        # 仅在普通属性查找失败时调用：首次访问config.ark等平台配置时解析并缓存
+        if name not in PROVIDERS:
+            raise AttributeError(name)
+        value = self._resolve(name)
+        setattr(self, name, value)
+        return value
+
+    def timeouts(self):
+        """返回各阶段超时（秒），环境变量STREAM_CONNECT_TIMEOUT等存在时覆盖默认值"""
+        return {
+            phase: float(self.getenv(f'STREAM_{phase.upper()}_TIMEOUT', default))
+            for phase, default in TIMEOUTS.items()
         }
 
-# 创建全局配置实例
-config = APIConfig()
\ No newline at end of file
+    def providers(self):
+        """返回已配置API密钥的平台配置，键为平台名称"""
+        result = {}
+        for name in PROVIDERS:
+            try:
+                result[name] = getattr(self, name)
+            except ValueError:
+                continue
+        return result
+
+# 创建全局配置实例（不会立即读取环境变量）
+config = APIConfig()
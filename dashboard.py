@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+'''
+压测实时看板
+
+功能说明：
+- 基于flask-socketio + gevent，在浏览器中实时查看压测进度
+- 显示各平台的在途请求数、滚动窗口内的首token延迟与输出速度分位数、错误率
+- 压测进程（loadgen.py / distributed.py 加 --dashboard 参数）通过UDP周期性上报汇总数据，
+  聚合全部在服务端完成
+- 服务端按固定周期（--tick）向浏览器推送，只发送与上一次推送相比发生变化的字段，
+  浏览器不会收到逐请求/逐token事件，观察上千并发的压测也不会拖慢压测本身
+- 页面不加载任何外部脚本：内置一个最小的Socket.IO客户端（Engine.IO v4长轮询），
+  在离线或有防火墙的测试机上同样可用
+
+运行命令：
+python dashboard.py --port 5000 --feed-port 5001
+python loadgen.py --providers ark,aliyun --concurrency 200 --duration 300 --processes 4 --dashboard 127.0.0.1:5001
+然后在浏览器打开 http://127.0.0.1:5000
+
+配置参数：
+⭐ --tick：向浏览器推送的周期（秒）
+⭐ --window：滚动统计窗口长度（秒）
+'''
+
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import collections
+import json
+import time
+
+from flask import Flask, render_template_string
+from flask_socketio import SocketIO, emit
+from gevent.server import DatagramServer
+
+from histogram import LatencyHistogram
+
+# 超过该时间没有收到上报的压测进程视为已结束，不再计入在途请求数
+SOURCE_TIMEOUT = 5.0
+
+
+class _Slot:
+    """一秒内完成的请求"""
+
+    def __init__(self, second):
+        self.second = second
+        self.ttft = LatencyHistogram()
+        self.speed = LatencyHistogram()
+        self.ok = 0
+        self.errors = {}
+
+
+class LiveAggregator:
+    """汇总各压测进程上报的数据，计算滚动窗口统计和推送增量"""
+
+    def __init__(self, window=30):
+        self.window = window
+        self.sources = {}
+        self.slots = {}
+        self.totals = {}
+        self._last = {}
+
+    def ingest(self, packet, now=None):
+        now = now or time.time()
+        self.sources[packet['source']] = (now, packet['inflight'])
+        second = int(now)
+        for provider, ok, error_type, ttft, speed in packet['samples']:
+            slots = self.slots.setdefault(provider, collections.deque())
+            if not slots or slots[-1].second != second:
+                slots.append(_Slot(second))
+            slot = slots[-1]
+            totals = self.totals.setdefault(provider, {'requests': 0, 'errors': 0})
+            totals['requests'] += 1
+            if ok:
+                slot.ok += 1
+                slot.ttft.record(ttft)
+                if speed > 0:
+                    slot.speed.record(speed)
+            else:
+                totals['errors'] += 1
+                slot.errors[error_type] = slot.errors.get(error_type, 0) + 1
+        for provider in packet['inflight']:
+            self.slots.setdefault(provider, collections.deque())
+
+    def summary(self, now=None):
+        now = now or time.time()
+        for source, (seen, _) in list(self.sources.items()):
+            if now - seen > SOURCE_TIMEOUT:
+                del self.sources[source]
+
+        result = {}
+        for provider, slots in self.slots.items():
+            while slots and slots[0].second <= now - self.window:
+                slots.popleft()
+            ttft = LatencyHistogram()
+            speed = LatencyHistogram()
+            ok = 0
+            errors = {}
+            for slot in slots:
+                ttft.merge(slot.ttft)
+                speed.merge(slot.speed)
+                ok += slot.ok
+                for kind, count in slot.errors.items():
+                    errors[kind] = errors.get(kind, 0) + count
+            failed = sum(errors.values())
+            finished = ok + failed
+            span = min(self.window, max(1.0, now - slots[0].second)) if slots else self.window
+            totals = self.totals.get(provider, {'requests': 0, 'errors': 0})
+            result[provider] = {
+                'inflight': sum(inflight.get(provider, 0) for _, inflight in self.sources.values()),
+                'rps': round(finished / span, 2),
+                'ttft_p50': round(ttft.percentile(50), 3),
+                'ttft_p95': round(ttft.percentile(95), 3),
+                'ttft_p99': round(ttft.percentile(99), 3),
+                'speed_p50': round(speed.percentile(50), 1),
+                'speed_p5': round(speed.percentile(5), 1),
+                'error_rate': round(failed / finished, 4) if finished else 0.0,
+                'errors': errors,
+                'total_requests': totals['requests'],
+                'total_errors': totals['errors']
+            }
+        return result
+
+    def delta(self, now=None):
+        """返回与上一次推送相比发生变化的字段，没有变化时返回空字典"""
+        current = self.summary(now)
+        changes = {}
+        for provider, fields in current.items():
+            previous = self._last.get(provider, {})
+            changed = {key: value for key, value in fields.items() if previous.get(key) != value}
+            if changed:
+                changes[provider] = changed
+        self._last = current
+        return changes
+
+    def snapshot(self):
+        """新连接的浏览器先收到上一次推送后的完整状态，之后的增量以此为基础"""
+        return self._last
+
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>压测实时看板</title>
+<style>
+body { font-family: sans-serif; margin: 24px; }
+table { border-collapse: collapse; }
+th, td { border: 1px solid #ccc; padding: 6px 10px; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+.bad { color: #c00; font-weight: bold; }
+#status { color: #888; margin-bottom: 12px; }
+</style>
+</head>
+<body>
+<h2>压测实时看板</h2>
+<div id="status">等待数据...</div>
+<table>
+<thead><tr>
+<th>平台</th><th>在途请求</th><th>完成/秒</th>
+<th>首token p50(秒)</th><th>首token p95(秒)</th><th>首token p99(秒)</th>
+<th>输出速度 p50(token/s)</th><th>输出速度 p5(token/s)</th>
+<th>错误率</th><th>错误分布</th><th>累计请求</th><th>累计失败</th>
+</tr></thead>
+<tbody id="rows"></tbody>
+</table>
+<p>滚动窗口: {{ window }}秒，推送周期: {{ tick }}秒</p>
+<script>
+var state = {};
+var columns = ['inflight', 'rps', 'ttft_p50', 'ttft_p95', 'ttft_p99', 'speed_p50', 'speed_p5',
+               'error_rate', 'errors', 'total_requests', 'total_errors'];
+
+function format(key, value) {
+  if (key === 'error_rate') return (value * 100).toFixed(1) + '%';
+  if (key === 'errors') return Object.keys(value).map(function (k) { return k + ': ' + value[k]; }).join(', ');
+  return value;
+}
+
+function cell(tr, text, cls) {
+  var td = document.createElement('td');
+  // 平台名称来自UDP上报，只以文本写入，不解析为HTML
+  td.textContent = text;
+  if (cls) td.className = cls;
+  tr.appendChild(td);
+}
+
+function render() {
+  var rows = document.getElementById('rows');
+  rows.textContent = '';
+  Object.keys(state).sort().forEach(function (name) {
+    var row = state[name];
+    var tr = document.createElement('tr');
+    cell(tr, name);
+    columns.forEach(function (key) {
+      cell(tr, row[key] === undefined ? '-' : format(key, row[key]),
+           key === 'error_rate' && row[key] > 0.05 ? 'bad' : '');
+    });
+    rows.appendChild(tr);
+  });
+  document.getElementById('status').textContent = '最后更新: ' + new Date().toLocaleTimeString();
+}
+
+// 最小的Socket.IO客户端（Engine.IO v4长轮询）：只接收服务端事件并应答心跳
+function listen(handlers) {
+  var base = '/socket.io/?EIO=4&transport=polling&t=';
+  var url = null;
+  function send(packet) { return fetch(url + Date.now(), {method: 'POST', body: packet}); }
+  function text(response) {
+    if (!response.ok) throw new Error('HTTP ' + response.status);
+    return response.text();
+  }
+  function dispatch(packet) {
+    if (packet === '2') {
+      send('3');
+    } else if (packet.slice(0, 2) === '42') {
+      var event = JSON.parse(packet.slice(2));
+      if (handlers[event[0]]) handlers[event[0]](event[1]);
+    }
+  }
+  function poll() {
+    fetch(url + Date.now()).then(text).then(function (payload) {
+      // 一次响应可能包含多个数据包，以记录分隔符（0x1e）分隔
+      payload.split('\\x1e').forEach(dispatch);
+      poll();
+    }).catch(retry);
+  }
+  function retry() {
+    document.getElementById('status').textContent = '连接已断开，正在重连...';
+    setTimeout(function () { listen(handlers); }, 2000);
+  }
+  fetch(base + Date.now()).then(text).then(function (payload) {
+    var open = JSON.parse(payload.slice(payload.indexOf('{')));
+    url = '/socket.io/?EIO=4&transport=polling&sid=' + open.sid + '&t=';
+    return send('40').then(text);
+  }).then(poll).catch(retry);
+}
+
+listen({
+  snapshot: function (data) { state = data; render(); },
+  update: function (delta) {
+    Object.keys(delta).forEach(function (name) {
+      state[name] = Object.assign(state[name] || {}, delta[name]);
+    });
+    render();
+  }
+});
+</script>
+</body>
+</html>
+'''
+
+
+def create_app(aggregator, tick=1.0):
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='gevent')
+
+    @app.route('/')
+    def index():
+        return render_template_string(PAGE, window=aggregator.window, tick=tick)
+
+    @socketio.on('connect')
+    def connect():
+        emit('snapshot', aggregator.snapshot())
+
+    def broadcast():
+        while True:
+            socketio.sleep(tick)
+            changes = aggregator.delta()
+            if changes:
+                socketio.emit('update', changes)
+
+    socketio.start_background_task(broadcast)
+    return app, socketio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='压测实时看板')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000, help='网页端口')
+    parser.add_argument('--feed-port', type=int, default=5001, help='接收压测数据的UDP端口')
+    parser.add_argument('--tick', type=float, default=1.0, help='推送周期（秒）')
+    parser.add_argument('--window', type=float, default=30, help='滚动统计窗口（秒）')
+    args = parser.parse_args()
+
+    aggregator = LiveAggregator(args.window)
+
+    def handle(data, address):
+        try:
+            aggregator.ingest(json.loads(data))
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    DatagramServer((args.host, args.feed_port), handle).start()
+    app, socketio = create_app(aggregator, args.tick)
+    print(f"实时看板: http://{args.host}:{args.port}")
+    print(f"数据接收地址: {args.host}:{args.feed_port}（压测时使用 --dashboard {args.host}:{args.feed_port}）")
+    socketio.run(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
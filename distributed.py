@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+'''
+分布式压测：协调器/工作节点模式
+
+功能说明：
+- 在多台机器上运行agent，由coordinator通过TCP下发压测计划（平台、消息、并发/QPS、时长）
+- 协议为逐行JSON，消息类型：ping/pong、plan/ready、result
+- coordinator通过多次ping估算各agent的时钟偏差，按统一时刻同时启动所有节点
+- 各节点回传可合并的直方图和错误计数，由coordinator合并为一份报告
+- API密钥只保存在各agent本地，计划中只传递平台名称
+
+运行命令：
+# 在每台压测机上启动agent
+python distributed.py agent --port 9100 --processes 4
+
+# 在控制机上下发计划
+python distributed.py coordinator --agents 10.0.0.1:9100,10.0.0.2:9100 --providers ark --concurrency 256 --duration 120
+
+# 本机验证：启动3个本地agent，对模拟服务器压测
+python distributed.py coordinator --spawn-local 3 --providers mock --qps 100 --duration 10
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from histogram import RunStats
+from loadgen import MOCK_BASE_URL, add_load_arguments, plan_from_args, print_report, resolve_provider, run_multiprocess, save_stats, split_plan
+
+DEFAULT_PORT = 9100
+
+
+async def send_message(writer, message):
+    writer.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+    await writer.drain()
+
+
+async def read_message(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('对端关闭了连接')
+    return json.loads(line)
+
+
+class Agent:
+    """工作节点：接收计划，在约定时刻开始压测并回传结果"""
+
+    def __init__(self, processes=1):
+        self.processes = processes
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                message = await read_message(reader)
+                if message['type'] == 'ping':
+                    await send_message(writer, {'type': 'pong', 'time': time.time()})
+                elif message['type'] == 'plan':
+                    plan = message['plan']
+                    try:
+                        plan['providers'] = [resolve_provider(name, plan.get('mock_url') or MOCK_BASE_URL) for name in plan['providers']]
+                    except Exception as e:
+                        # 本机缺少平台配置（如API密钥）时直接回复错误结果，由coordinator报告
+                        print(f"无法执行来自 {peer} 的压测计划: {e}")
+                        await send_message(writer, {'type': 'result', 'host': socket.gethostname(), 'error': str(e)})
+                        continue
+                    plan['start_at'] = message['start_at']
+                    await send_message(writer, {'type': 'ready', 'host': socket.gethostname()})
+                    print(f"收到来自 {peer} 的压测计划，将在 {plan['start_at'] - time.time():.2f} 秒后开始")
+
+                    loop = asyncio.get_running_loop()
+                    try:
+                        stats = await loop.run_in_executor(None, run_multiprocess, plan, self.processes)
+                        await send_message(writer, {'type': 'result', 'host': socket.gethostname(), 'stats': stats.to_dict()})
+                    except Exception as e:
+                        await send_message(writer, {'type': 'result', 'host': socket.gethostname(), 'error': str(e)})
+                    print("压测完成，结果已回传")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"agent已启动，监听 {host}:{port}，worker进程数: {self.processes}")
+        async with server:
+            await server.serve_forever()
+
+
+async def estimate_clock_offset(reader, writer, rounds=8):
+    """NTP式估算：取往返时间最短的一次测量，返回(agent时钟 - 本地时钟, 往返时间)"""
+    best = None
+    for _ in range(rounds):
+        sent = time.time()
+        await send_message(writer, {'type': 'ping'})
+        reply = await read_message(reader)
+        received = time.time()
+        rtt = received - sent
+        offset = reply['time'] - (sent + received) / 2
+        if best is None or rtt < best[1]:
+            best = (offset, rtt)
+    return best
+
+
+async def coordinate(agents, plan, lead=3.0):
+    """向所有agent下发计划并合并结果，agents为(host, port)列表"""
+    connections = []
+    for host, port in agents:
+        reader, writer = await asyncio.open_connection(host, port)
+        offset, rtt = await estimate_clock_offset(reader, writer)
+        print(f"- agent {host}:{port} 时钟偏差 {offset * 1000:+.1f}毫秒, 往返 {rtt * 1000:.1f}毫秒")
+        connections.append((f'{host}:{port}', reader, writer, offset))
+
+    parts = split_plan(plan, len(connections))
+    start = time.time() + lead
+    active = []
+    for (name, reader, writer, offset), part in zip(connections, parts):
+        # 换算为各agent本地时钟下的开始时刻
+        await send_message(writer, {'type': 'plan', 'plan': part, 'start_at': start + offset})
+        reply = await read_message(reader)
+        if reply['type'] == 'result':
+            # agent无法执行计划（如缺少平台配置），其余agent照常运行
+            print(f"❌ agent {name} 运行失败: {reply['error']}")
+            writer.close()
+            continue
+        active.append((name, reader, writer))
+
+    async def collect(name, reader, writer):
+        result = await read_message(reader)
+        writer.close()
+        return name, result
+
+    stats = RunStats(plan.get('slo'))
+    for name, result in await asyncio.gather(*[collect(*conn) for conn in active]):
+        if 'error' in result:
+            print(f"❌ agent {name} 运行失败: {result['error']}")
+            continue
+        node = RunStats.from_dict(result['stats'])
+        requests = sum(p.requests for p in node.providers.values())
+        print(f"- agent {name} ({result['host']}) 完成 {requests} 个请求")
+        stats.merge(node)
+    # 计划拆分后没有分到任务的agent
+    for name, reader, writer, offset in connections[len(parts):]:
+        writer.close()
+    return stats
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_local_agents(count, processes):
+    """在本机启动若干agent子进程，用于本地验证"""
+    agents = []
+    children = []
+    script = os.path.abspath(__file__)
+    for _ in range(count):
+        port = _free_port()
+        children.append(subprocess.Popen([
+            sys.executable, script, 'agent', '--host', '127.0.0.1', '--port', str(port), '--processes', str(processes)
+        ]))
+        agents.append(('127.0.0.1', port))
+
+    # 等待所有agent开始监听
+    deadline = time.time() + 10
+    for host, port in agents:
+        while True:
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError(f'本地agent {host}:{port} 启动超时')
+                time.sleep(0.1)
+    return agents, children
+
+
+def parse_agents(value):
+    agents = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            host, _, port = item.partition(':')
+            agents.append((host, int(port or DEFAULT_PORT)))
+    return agents
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分布式API压测工具')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    agent_parser = commands.add_parser('agent', help='启动工作节点')
+    agent_parser.add_argument('--host', default='0.0.0.0')
+    agent_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    agent_parser.add_argument('--processes', type=int, default=1, help='本节点的worker进程数量')
+
+    coordinator_parser = add_load_arguments(commands.add_parser('coordinator', help='下发压测计划并汇总结果'))
+    coordinator_parser.add_argument('--agents', default='', help='agent地址列表，如 10.0.0.1:9100,10.0.0.2:9100')
+    coordinator_parser.add_argument('--spawn-local', type=int, default=0, help='在本机启动的agent数量')
+    coordinator_parser.add_argument('--lead', type=float, default=3.0, help='下发计划到统一开始的提前量（秒）')
+
+    args = parser.parse_args()
+    if args.command == 'agent':
+        asyncio.run(Agent(args.processes).serve(args.host, args.port))
+        return
+
+    agents = parse_agents(args.agents)
+    children = []
+    if args.spawn_local:
+        local, children = spawn_local_agents(args.spawn_local, args.processes)
+        agents += local
+    if not agents:
+        parser.error('请通过 --agents 或 --spawn-local 指定agent')
+
+    # 计划中只包含平台名称，由各agent使用本地配置解析
+    names = [name.strip() for name in args.providers.split(',') if name.strip()]
+    plan = plan_from_args(args, names)
+    plan['mock_url'] = args.mock_url
+
+    print("===== 分布式API压测 =====")
+    print(f"agent数量: {len(agents)}, 平台: {', '.join(names)}")
+    try:
+        stats = asyncio.run(coordinate(agents, plan, args.lead))
+    finally:
+        for child in children:
+            child.terminate()
+    print_report(stats)
+    if args.output:
+        save_stats(stats, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+'''
+Embeddings接口吞吐基准测试
+
+功能说明：
+- 对支持OpenAI兼容/embeddings接口的平台（硅基流动、阿里云百炼兼容模式等）按“批大小 × 输入长度”扫描
+- 每个格子以固定并发发送一组请求，统计每秒向量数、每秒输入token数和请求延迟分位数
+- 默认请求encoding_format=base64，响应中的向量直接按float32字节解码到NumPy数组，
+  避免在客户端解析大量JSON浮点数；报告中单列解码耗时，确认客户端不是瓶颈
+- 每条输入文本带有唯一编号，避免平台对相同输入的缓存影响结果
+
+运行命令：
+python embeddings_bench.py --providers siliconflow,aliyun --batch-sizes 1,8,32 --lengths 64,512
+python embeddings_bench.py --providers mock --batch-sizes 1,16,64,256 --concurrency 8 --requests 50
+
+配置参数：
+⭐ --batch-sizes：每个请求包含的文本数，逗号分隔
+⭐ --lengths：每条文本的长度（字符数），逗号分隔
+⭐ --requests / --concurrency：每个格子的请求数和并发数
+⭐ --encoding-format：base64（默认）或float
+⭐ --model：覆盖config.py中各平台的embedding模型（<前缀>_EMBEDDING_MODEL_ID）
+'''
+
+import argparse
+import asyncio
+import time
+
+from histogram import LatencyHistogram
+from loadgen import MOCK_BASE_URL, add_timeout_arguments, describe_errors, resolve_provider, timeouts_from_args
+from stream_client import ConnectionPool, embed
+
+FILLER = '大模型推理平台的向量检索性能测试文本。'
+
+
+def resolve_embedding_provider(name, mock_url=MOCK_BASE_URL, model=None):
+    """返回embedding模型的平台配置；平台未配置embedding模型时抛出ValueError"""
+    provider = resolve_provider(name, mock_url)
+    if name == 'mock':
+        provider['model'] = model or 'mock-embedding'
+        return provider
+    from config import config
+    provider['model'] = model or getattr(config, name).get('embedding_model')
+    if not provider['model']:
+        raise ValueError(f'平台{name}未配置embedding模型，请设置环境变量或使用--model')
+    return provider
+
+
+def make_inputs(batch, length, offset):
+    """生成batch条长度为length个字符的文本，开头的编号保证各条文本互不相同"""
+    texts = []
+    for index in range(batch):
+        prefix = f'#{offset + index} '
+        body = FILLER * (length // len(FILLER) + 1)
+        texts.append((prefix + body)[:max(length, len(prefix))])
+    return texts
+
+
+class CellStats:
+    """一个“平台 × 批大小 × 输入长度”格子的汇总"""
+
+    def __init__(self, name, batch, length):
+        self.name = name
+        self.batch = batch
+        self.length = length
+        self.latency = LatencyHistogram()
+        self.attempts = 0
+        self.ok = 0
+        self.vectors = 0
+        self.input_tokens = 0
+        self.dim = 0
+        self.decode_time = 0.0
+        self.bytes_received = 0
+        self.duration = 0.0
+        self.errors = {}
+
+    def record(self, sample):
+        self.attempts += 1
+        if not sample['ok']:
+            kind = sample['error_type'] or 'error'
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            return
+        self.ok += 1
+        self.latency.record(sample['total_time'])
+        self.vectors += sample['vectors']
+        self.input_tokens += sample['input_tokens']
+        self.dim = sample['dim']
+        self.decode_time += sample['decode_time']
+        self.bytes_received += sample['bytes_received']
+
+
+async def run_cell(pool, provider, batch, length, requests, concurrency, encoding_format, dimensions, timeouts):
+    stats = CellStats(provider['name'], batch, length)
+    queue = list(range(requests))
+
+    async def worker():
+        while queue:
+            index = queue.pop()
+            inputs = make_inputs(batch, length, index * batch)
+            stats.record(await embed(pool, provider, inputs, encoding_format, dimensions, timeouts))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(max(1, min(concurrency, requests)))])
+    stats.duration = time.perf_counter() - start
+    return stats
+
+
+async def sweep(providers, batch_sizes, lengths, requests, concurrency, encoding_format='base64', dimensions=None,
+                timeouts=None):
+    """依次测量每个格子，返回CellStats列表"""
+    # decode_embeddings按需导入NumPy；预先导入，避免第一个请求的decode_time包含导入耗时
+    import numpy  # noqa: F401
+    pool = ConnectionPool()
+    cells = []
+    try:
+        for provider in providers:
+            for length in lengths:
+                for batch in batch_sizes:
+                    stats = await run_cell(pool, provider, batch, length, requests, concurrency, encoding_format,
+                                           dimensions, timeouts)
+                    cells.append(stats)
+                    rate = f'{stats.vectors / stats.duration:.1f}向量/秒' if stats.duration else '-'
+                    print(f"{provider['name']} 批大小{batch} 长度{length}: 成功{stats.ok}/{stats.attempts}, {rate}")
+    finally:
+        await pool.close()
+    return cells
+
+
+def cell_rows(cells):
+    rows = []
+    for cell in cells:
+        ok = cell.ok or 1
+        rows.append([
+            cell.name, cell.batch, cell.length, f'{cell.ok}/{cell.attempts}', cell.dim or '-',
+            f'{cell.vectors / cell.duration:.1f}' if cell.duration and cell.ok else '-',
+            f'{cell.input_tokens / cell.duration:.0f}' if cell.duration and cell.ok else '-',
+            '/'.join(f'{cell.latency.percentile(p) * 1000:.0f}' for p in (50, 95, 99)) if cell.ok else '-',
+            f'{cell.decode_time / ok * 1000:.2f}' if cell.ok else '-',
+            f'{cell.bytes_received / cell.vectors / 1024:.1f}' if cell.vectors else '-'
+        ])
+    return rows
+
+
+CELL_HEADERS = [
+    '平台', '批大小', '输入长度(字符)', '成功', '维度', '向量/秒', '输入token/秒',
+    '延迟 p50/p95/p99(毫秒)', '解码(毫秒/请求)', '接收KB/向量'
+]
+
+
+def _parse_ints(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embeddings接口吞吐基准测试')
+    parser.add_argument('--providers', default='mock', help='平台名称，逗号分隔')
+    parser.add_argument('--batch-sizes', default='1,8,32,128', help='每个请求的文本数，逗号分隔')
+    parser.add_argument('--lengths', default='64,512', help='每条文本的字符数，逗号分隔')
+    parser.add_argument('--requests', type=int, default=20, help='每个格子的请求数')
+    parser.add_argument('--concurrency', type=int, default=4, help='每个格子的并发数')
+    parser.add_argument('--encoding-format', choices=['base64', 'float'], default='base64')
+    parser.add_argument('--dimensions', type=int, help='请求的向量维度（平台支持时）')
+    parser.add_argument('--model', help='覆盖各平台配置的embedding模型')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    add_timeout_arguments(parser)
+    args = parser.parse_args()
+
+    providers = []
+    for name in args.providers.split(','):
+        if not name.strip():
+            continue
+        try:
+            providers.append(resolve_embedding_provider(name.strip(), args.mock_url, args.model))
+        except ValueError as e:
+            print(f"跳过平台{name.strip()}: {e}")
+    if not providers:
+        return
+
+    names = ', '.join(f"{provider['name']}({provider['model']})" for provider in providers)
+    print("===== Embeddings吞吐基准测试 =====")
+    print(f"平台: {names}, "
+          f"批大小 {args.batch_sizes}, 输入长度 {args.lengths}, 每格{args.requests}个请求, 并发{args.concurrency}\n")
+    cells = asyncio.run(sweep(providers, _parse_ints(args.batch_sizes), _parse_ints(args.lengths), args.requests,
+                              args.concurrency, args.encoding_format, args.dimensions, timeouts_from_args(args)))
+
+    from tabulate import tabulate
+
+    print("\n扫描结果：")
+    print(tabulate(cell_rows(cells), headers=CELL_HEADERS, tablefmt='grid', disable_numparse=True))
+    for cell in cells:
+        if cell.errors:
+            print(f"- {cell.name} 批大小{cell.batch} 长度{cell.length} 错误分布: {describe_errors(cell.errors)}")
+    print("\n说明：延迟为收到完整响应的时间，不含客户端解码；输入token/秒使用平台返回的usage（未返回时按字节估算）")
+
+
+if __name__ == '__main__':
+    main()
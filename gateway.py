@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+'''
+本地OpenAI兼容网关
+
+功能说明：
+- 在本地提供OpenAI格式的 /v1/chat/completions 接口，转发到已配置的各平台
+- 每个平台使用独立的requests连接池，保持keep-alive长连接
+- 流式响应按上游到达的数据块原样转发，不做重新缓冲
+- 转发过程中顺带记录每个请求的各阶段耗时（响应头、首token、总耗时），
+  写入JSONL日志，并可通过 /stats 查看各平台的延迟分位数
+- 基于flask + gevent，单进程即可承载大量并发流
+
+平台选择规则（按优先级）：
+1. 请求头 X-Provider: ark
+2. model字段带平台前缀，如 "ark/deepseek-v3-241226" 或 "ark"
+3. model字段与某个平台配置的模型名称一致
+4. 启动参数 --default-provider 指定的平台
+
+运行命令：
+python gateway.py --port 8080 --default-provider ark
+
+调用示例：
+    client = OpenAI(api_key='unused', base_url='http://127.0.0.1:8080/v1')
+    client.chat.completions.create(model='aliyun', messages=[...], stream=True)
+'''
+
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import datetime
+import json
+import time
+
+import requests
+from flask import Flask, Response, jsonify, request
+from gevent.pywsgi import WSGIServer
+from requests.adapters import HTTPAdapter
+
+from histogram import RunStats
+from stream_client import SSEParser, calculate_input_tokens, classify_error, http_error_type, new_sample
+
+# 上游连接超时和读取超时（秒）
+UPSTREAM_TIMEOUT = (10, 300)
+
+
+class Gateway:
+    def __init__(self, providers, default_provider=None, pool_size=100, log_file=None):
+        self.providers = providers
+        self.default_provider = default_provider
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.stats = RunStats()
+        self.log = open(log_file, 'a', encoding='utf-8') if log_file else None
+
+    def session(self, name):
+        # 每个平台一个Session，连接池大小与网关并发能力匹配
+        if name not in self.sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self.sessions[name] = session
+        return self.sessions[name]
+
+    def select(self, headers, body):
+        """返回(平台名称, 上游使用的模型名称)"""
+        model = body.get('model') or ''
+        name = headers.get('X-Provider')
+        if name in self.providers:
+            return name, model or self.providers[name]['model']
+        prefix, _, rest = model.partition('/')
+        if prefix in self.providers:
+            return prefix, rest or self.providers[prefix]['model']
+        for name, provider in self.providers.items():
+            if provider['model'] == model:
+                return name, model
+        if self.default_provider:
+            return self.default_provider, model or self.providers[self.default_provider]['model']
+        return None, model
+
+    def record(self, sample):
+        self.stats.record(sample)
+        if self.log:
+            entry = {key: value for key, value in sample.items() if key not in ('itl', 'content', 'rate_limit_headers')}
+            entry['time'] = datetime.datetime.now().isoformat()
+            self.log.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.log.flush()
+
+    def forward(self, name, body):
+        provider = self.providers[name]
+        url = provider['base_url'].rstrip('/') + '/chat/completions'
+        headers = {
+            'Authorization': f"Bearer {provider['api_key']}",
+            'Content-Type': 'application/json',
+            # 禁止压缩，保证数据块可以逐个转发
+            'Accept-Encoding': 'identity'
+        }
+        sample = new_sample({'name': name, 'model': body['model']}, time.perf_counter())
+        sample['input_tokens'] = calculate_input_tokens(body.get('messages', []))
+        start = sample['start']
+        try:
+            upstream = self.session(name).post(url, json=body, headers=headers,
+                                               stream=True, timeout=UPSTREAM_TIMEOUT)
+        except requests.RequestException as e:
+            sample['error'] = str(e)
+            sample['error_type'] = classify_error(e, 'connect')
+            sample['total_time'] = time.perf_counter() - start
+            self.record(sample)
+            return jsonify({'error': {'message': f'上游平台连接失败: {e}', 'type': 'upstream_error'}}), 502
+
+        sample['network_latency'] = time.perf_counter() - start
+        sample['http_status'] = upstream.status_code
+        content_type = upstream.headers.get('Content-Type', 'application/json')
+
+        if upstream.status_code != 200 or not body.get('stream'):
+            data = upstream.content
+            sample['total_time'] = time.perf_counter() - start
+            sample['ok'] = upstream.status_code == 200
+            if not sample['ok']:
+                sample['error_type'] = http_error_type(upstream.status_code)
+            else:
+                sample['first_token_time'] = sample['total_time']
+                usage = (json.loads(data).get('usage') or {}) if data else {}
+                sample['output_tokens'] = usage.get('completion_tokens', 0)
+            self.record(sample)
+            return Response(data, status=upstream.status_code, content_type=content_type)
+
+        def relay():
+            first_token = None
+            last_chunk = None
+            content_events = 0
+            # 数据块按TCP读取划分，一个SSE事件可能跨越多个数据块，由SSEParser保留未完成的行
+            parser = SSEParser()
+            try:
+                for chunk in upstream.iter_content(chunk_size=None):
+                    now = time.perf_counter()
+                    # 只按含有内容的事件计时：只有role的首个事件、finish_reason和[DONE]不计入首token和token间隔
+                    events = 0
+                    for data in parser.feed(chunk):
+                        has_content, usage = _parse_event(data)
+                        events += has_content
+                        if usage:
+                            sample['input_tokens'] = usage.get('prompt_tokens', sample['input_tokens'])
+                            sample['output_tokens'] = usage.get('completion_tokens', 0)
+                            sample['usage_reported'] = True
+                    if events:
+                        if first_token is None:
+                            first_token = now
+                        else:
+                            sample['itl'].append(now - last_chunk)
+                        last_chunk = now
+                        content_events += events
+                    yield chunk
+                sample['ok'] = first_token is not None
+                if not sample['ok']:
+                    sample['error_type'] = 'empty'
+            except GeneratorExit:
+                sample['error'] = '客户端提前断开'
+                sample['error_type'] = 'client_disconnect'
+                raise
+            except Exception as e:
+                sample['error'] = str(e)
+                sample['error_type'] = classify_error(e)
+                raise
+            finally:
+                # 客户端提前断开时同样关闭上游连接
+                upstream.close()
+                end = time.perf_counter()
+                sample['total_time'] = end - start
+                if first_token is not None:
+                    sample['first_token_time'] = first_token - start
+                    sample['output_time'] = last_chunk - first_token
+                    if not sample['output_tokens']:
+                        # 上游未返回usage时按含有内容的事件数估算
+                        sample['output_tokens'] = content_events
+                    if sample['output_time'] > 0:
+                        sample['output_speed'] = sample['output_tokens'] / sample['output_time']
+                self.record(sample)
+
+        return Response(relay(), status=200, headers={
+            'Content-Type': content_type,
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'X-Provider': name
+        })
+
+    def stats_summary(self):
+        summary = {}
+        for name, provider in self.stats.providers.items():
+            summary[name] = {
+                'requests': provider.requests,
+                'ok': provider.ok,
+                'errors': provider.errors,
+                'ttft_p50': provider.hists['first_token_time'].percentile(50),
+                'ttft_p95': provider.hists['first_token_time'].percentile(95),
+                'total_p50': provider.hists['total_time'].percentile(50),
+                'total_p95': provider.hists['total_time'].percentile(95),
+                'itl_p50': provider.hists['itl'].percentile(50),
+                'output_tokens': provider.output_tokens
+            }
+        return summary
+
+
+def _parse_event(data):
+    """解析一个SSE事件的data字段，返回(是否含有非空内容, usage)；[DONE]和无法解析的事件返回(False, None)"""
+    if data == '[DONE]':
+        return False, None
+    try:
+        event = json.loads(data)
+        delta = (event.get('choices') or [{}])[0].get('delta') or {}
+    except (ValueError, AttributeError):
+        return False, None
+    return bool(delta.get('content') or delta.get('reasoning_content')), event.get('usage')
+
+
+def create_app(gateway):
+    app = Flask(__name__)
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        body = request.get_json(force=True)
+        name, model = gateway.select(request.headers, body)
+        if name is None:
+            return jsonify({'error': {'message': f'无法确定目标平台: {body.get("model")}', 'type': 'invalid_request_error'}}), 400
+        body['model'] = model
+        return gateway.forward(name, body)
+
+    @app.route('/v1/models', methods=['GET'])
+    def models():
+        return jsonify({
+            'object': 'list',
+            'data': [{'id': f"{name}/{provider['model']}", 'object': 'model', 'owned_by': name}
+                     for name, provider in gateway.providers.items()]
+        })
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        return jsonify(gateway.stats_summary())
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地OpenAI兼容网关')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--default-provider', help='无法从请求中判断平台时使用的默认平台')
+    parser.add_argument('--pool-size', type=int, default=100, help='每个平台的连接池大小')
+    parser.add_argument('--log', default='gateway_timings.jsonl', help='每个请求的耗时记录文件')
+    parser.add_argument('--mock-url', help='同时注册指向模拟服务器的mock平台')
+    args = parser.parse_args()
+
+    from config import config
+    providers = dict(config.providers())
+    if args.mock_url:
+        providers['mock'] = {'api_key': 'mock', 'base_url': args.mock_url, 'model': 'mock-model'}
+
+    if args.default_provider and args.default_provider not in providers:
+        parser.error(f"未知的默认平台: {args.default_provider}（可用平台: {', '.join(providers)}）")
+
+    gateway = Gateway(providers, args.default_provider, args.pool_size, args.log)
+    print(f"网关已启动: http://{args.host}:{args.port}/v1")
+    print(f"可用平台: {', '.join(providers)}")
+    WSGIServer((args.host, args.port), create_app(gateway), log=None).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+'''
+跨平台对冲请求测试工具
+
+功能说明：
+- 请求先发往主平台，若在截止时间内没有收到首token，则把同一条消息再发往备用平台
+- 两路请求中先输出首token的一方胜出，另一方立即取消，连接直接关闭
+- 截止时间可以固定指定，也可以取主平台基线测试中观测到的首token分位数（如p90）
+- 先运行一轮不对冲的基线，再运行一轮对冲，对比尾延迟改善和额外的token消耗
+
+运行命令：
+python hedging.py --primary tencent --backup ark --concurrency 4 --requests 200
+python hedging.py --primary aliyun --backup siliconflow --deadline 1.5
+
+配置参数：
+⭐ --primary / --backup：主平台和备用平台名称
+⭐ --deadline：对冲截止时间（秒），未指定时使用基线首token的--deadline-percentile分位数
+⭐ --requests：每一轮（基线/对冲）的请求数
+'''
+
+import argparse
+import asyncio
+import time
+
+from histogram import LatencyHistogram
+from loadgen import DEFAULT_MESSAGES, MOCK_BASE_URL, resolve_provider
+from stream_client import ConnectionPool, calculate_input_tokens, stream_chat
+
+
+class _Attempt:
+    def __init__(self, pool, provider, messages, max_tokens):
+        self.provider = provider
+        self.progress = {'event': asyncio.Event(), 'first_token': None, 'output_tokens': 0}
+        self.task = asyncio.ensure_future(
+            stream_chat(pool, provider, messages, max_tokens, progress=self.progress)
+        )
+
+
+async def _wait_any(attempts, timeout):
+    """等待任意一路收到首token或全部结束，最多等待timeout秒"""
+    waiters = [asyncio.ensure_future(a.progress['event'].wait()) for a in attempts]
+    waiters += [a.task for a in attempts]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters[:len(attempts)]:
+            waiter.cancel()
+
+
+async def hedged_request(pool, primary, backup, messages, max_tokens, deadline):
+    """发送一次（可能对冲的）请求；backup为None时即为普通请求"""
+    start = time.perf_counter()
+    attempts = [_Attempt(pool, primary, messages, max_tokens)]
+    hedged = False
+
+    while True:
+        started = [a for a in attempts if a.progress['first_token'] is not None]
+        if started:
+            winner = min(started, key=lambda a: a.progress['first_token'])
+            break
+        if all(a.task.done() for a in attempts):
+            # 主平台在首token前就失败时立即对冲
+            if backup is not None and not hedged:
+                attempts.append(_Attempt(pool, backup, messages, max_tokens))
+                hedged = True
+                continue
+            winner = None
+            break
+        timeout = None
+        if backup is not None and not hedged:
+            timeout = max(0.0, start + deadline - time.perf_counter())
+        await _wait_any(attempts, timeout)
+        if backup is not None and not hedged and time.perf_counter() >= start + deadline:
+            if not any(a.progress['first_token'] is not None for a in attempts):
+                attempts.append(_Attempt(pool, backup, messages, max_tokens))
+                hedged = True
+
+    # 取消落败的一路，未读完的连接会被直接关闭而不是归还连接池
+    losers = [a for a in attempts if a is not winner]
+    for attempt in losers:
+        attempt.task.cancel()
+    await asyncio.gather(*[a.task for a in losers], return_exceptions=True)
+
+    result = {
+        'hedged': hedged,
+        'winner': winner.provider['name'] if winner else None,
+        'ok': False,
+        'first_token_time': 0.0,
+        'total_time': 0.0,
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'wasted_input_tokens': 0,
+        'wasted_output_tokens': 0
+    }
+    for attempt in losers:
+        # 落败的每一路（无论已完成还是被取消）平台都已处理了输入，收到的输出也已计费
+        sample = None
+        if not attempt.task.cancelled() and attempt.task.exception() is None:
+            sample = attempt.task.result()
+        if sample is not None:
+            result['wasted_input_tokens'] += sample['input_tokens']
+            result['wasted_output_tokens'] += sample['output_tokens']
+        else:
+            result['wasted_input_tokens'] += calculate_input_tokens(messages)
+            result['wasted_output_tokens'] += attempt.progress['output_tokens']
+    if winner is None:
+        result['total_time'] = time.perf_counter() - start
+        return result
+
+    sample = await winner.task
+    result['ok'] = sample['ok']
+    result['first_token_time'] = winner.progress['first_token'] - start
+    result['total_time'] = time.perf_counter() - start
+    result['input_tokens'] = sample['input_tokens']
+    result['output_tokens'] = sample['output_tokens']
+    return result
+
+
+class PhaseStats:
+    def __init__(self, name):
+        self.name = name
+        self.ttft = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self.requests = 0
+        self.ok = 0
+        self.hedged = 0
+        self.backup_wins = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.wasted_input_tokens = 0
+        self.wasted_output_tokens = 0
+
+    def record(self, result, backup_name=None):
+        self.requests += 1
+        self.hedged += result['hedged']
+        self.wasted_input_tokens += result['wasted_input_tokens']
+        self.wasted_output_tokens += result['wasted_output_tokens']
+        if not result['ok']:
+            return
+        self.ok += 1
+        self.ttft.record(result['first_token_time'])
+        self.total.record(result['total_time'])
+        self.input_tokens += result['input_tokens']
+        self.output_tokens += result['output_tokens']
+        if backup_name is not None and result['winner'] == backup_name:
+            self.backup_wins += 1
+
+
+async def run_phase(pool, name, primary, backup, args, deadline=None):
+    stats = PhaseStats(name)
+    messages = [{"role": "user", "content": args.prompt}]
+    remaining = args.requests
+
+    async def user():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            result = await hedged_request(pool, primary, backup, messages, args.max_tokens, deadline)
+            stats.record(result, backup['name'] if backup else None)
+
+    print(f"\n正在运行{name}（{args.requests}个请求，并发{args.concurrency}）...")
+    await asyncio.gather(*[user() for _ in range(args.concurrency)])
+    return stats
+
+
+def phase_row(stats):
+    wasted = stats.wasted_input_tokens + stats.wasted_output_tokens
+    used = stats.input_tokens + stats.output_tokens
+    return [
+        stats.name,
+        f'{stats.ok}/{stats.requests}',
+        stats.ttft.percentile(50), stats.ttft.percentile(90), stats.ttft.percentile(99),
+        stats.total.percentile(50), stats.total.percentile(99),
+        f'{stats.hedged / stats.requests:.1%}' if stats.requests else '-',
+        f'{stats.backup_wins / stats.requests:.1%}' if stats.requests else '-',
+        wasted,
+        f'{wasted / used:.1%}' if used else '-'
+    ]
+
+
+async def run(args):
+    primary = resolve_provider(args.primary, args.mock_url)
+    backup = resolve_provider(args.backup, args.backup_mock_url)
+    if backup['name'] == primary['name']:
+        backup['name'] += '-backup'
+
+    pool = ConnectionPool()
+    try:
+        baseline = await run_phase(pool, '基线（仅主平台）', primary, None, args)
+        deadline = args.deadline
+        if deadline is None:
+            deadline = baseline.ttft.percentile(args.deadline_percentile)
+            print(f"使用基线首token p{args.deadline_percentile:g} 作为对冲截止时间: {deadline:.2f}秒")
+        hedged = await run_phase(pool, f'对冲（{deadline:.2f}秒后发往备用平台）', primary, backup, args, deadline)
+    finally:
+        await pool.close()
+    return baseline, hedged, deadline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='跨平台对冲请求测试工具')
+    parser.add_argument('--primary', required=True, help='主平台名称')
+    parser.add_argument('--backup', required=True, help='备用平台名称')
+    parser.add_argument('--deadline', type=float, help='对冲截止时间（秒）')
+    parser.add_argument('--deadline-percentile', type=float, default=90, help='未指定截止时间时使用的基线首token分位数')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100, help='每一轮的请求数')
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--prompt', default=DEFAULT_MESSAGES[0]['content'], help='测试消息')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='主平台为mock时的API地址')
+    parser.add_argument('--backup-mock-url', default=MOCK_BASE_URL, help='备用平台为mock时的API地址')
+    args = parser.parse_args()
+
+    from tabulate import tabulate
+
+    print("===== 对冲请求测试 =====")
+    print(f"主平台: {args.primary}, 备用平台: {args.backup}")
+    baseline, hedged, deadline = asyncio.run(run(args))
+
+    headers = ['模式', '成功', '首token p50(秒)', '首token p90(秒)', '首token p99(秒)',
+               '总耗时 p50(秒)', '总耗时 p99(秒)', '对冲比例', '备用胜出', '额外token', '额外token占比']
+    print("\n对冲效果对比：")
+    print(tabulate([phase_row(baseline), phase_row(hedged)], headers=headers, tablefmt='grid', floatfmt=".2f"))
+
+    for p in (90, 99):
+        before = baseline.ttft.percentile(p)
+        after = hedged.ttft.percentile(p)
+        if before > 0:
+            print(f"- 首token p{p}: {before:.2f}秒 → {after:.2f}秒 ({(after - before) / before:+.1%})")
+    print(f"- 额外token: 输入 {hedged.wasted_input_tokens} 个, 输出 {hedged.wasted_output_tokens} 个"
+          f"（落败请求的输入和已收到的输出，被取消请求的实际计费可能略高）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+'''
+可合并的延迟直方图
+
+功能说明：
+- 对数分桶记录延迟（相对误差约1%），内存占用与样本数无关
+- 多个进程/节点的直方图可以直接合并，无需传输原始样本
+- 支持百分位、均值、最值统计
+- 可序列化为JSON友好的字典，便于进程间或网络传输
+- 按平台统计成功率、错误分布和goodput（满足单请求SLO的请求输出的token/s），
+  失败的请求不计入延迟统计
+'''
+
+import math
+
+# 计算goodput的默认单请求SLO（秒）：首token不超过ttft，且平均token间隔不超过itl（0表示不检查）
+DEFAULT_SLO = {'ttft': 2.0, 'itl': 0.1}
+
+
+def meets_slo(sample, slo):
+    """成功的请求是否满足单请求SLO"""
+    if not sample['ok']:
+        return False
+    if slo.get('ttft') and sample['first_token_time'] > slo['ttft']:
+        return False
+    gaps = sample['itl']
+    if slo.get('itl') and gaps and sum(gaps) / len(gaps) > slo['itl']:
+        return False
+    return True
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图（单位：秒）"""
+
+    def __init__(self, precision=0.01, min_value=1e-5):
+        self.precision = precision
+        self.min_value = min_value
+        self._log_base = math.log1p(precision)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_base) + 1
+
+    def _value(self, index):
+        # 取桶的中点作为代表值
+        if index == 0:
+            return self.min_value
+        low = self.min_value * math.exp((index - 1) * self._log_base)
+        return low * (1 + self.precision / 2)
+
+    def record(self, value, count=1):
+        if value is None or value < 0:
+            return
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """合并另一个直方图（分桶参数必须一致）"""
+        if other.precision != self.precision or other.min_value != self.min_value:
+            raise ValueError('直方图分桶参数不一致，无法合并')
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def value_at_rank(self, rank):
+        """返回第rank个（从1开始）样本所在桶的代表值"""
+        if self.count == 0:
+            return 0.0
+        rank = min(max(rank, 1), self.count)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                value = self._value(index)
+                # 代表值不超出真实的最值范围
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        return self.value_at_rank(math.ceil(self.count * p / 100.0))
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            'precision': self.precision,
+            'min_value': self.min_value,
+            'buckets': {str(k): v for k, v in self.buckets.items()},
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls(precision=data['precision'], min_value=data['min_value'])
+        hist.buckets = {int(k): v for k, v in data['buckets'].items()}
+        hist.count = data['count']
+        hist.total = data['total']
+        hist.min = data['min']
+        hist.max = data['max']
+        return hist
+
+
+class ProviderStats:
+    """单个平台在一次压测中的汇总统计（全部可合并）"""
+
+    HISTOGRAMS = ['network_latency', 'first_token_time', 'itl', 'total_time', 'throttle_wait']
+
+    def __init__(self, slo=None):
+        self.slo = slo or DEFAULT_SLO
+        self.model = None
+        self.hists = {name: LatencyHistogram() for name in self.HISTOGRAMS}
+        self.ok = 0
+        self.good = 0
+        self.good_output_tokens = 0
+        self.errors = {}
+        self.throttled = 0
+        self.quota_exhausted = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.usage_reported = 0
+        self.duration = 0.0
+
+    def record(self, sample):
+        """记录一次请求的结果（stream_client返回的样本字典）"""
+        # 限流等待与429单独统计，不计入延迟和错误
+        if sample.get('throttle_wait'):
+            self.hists['throttle_wait'].record(sample['throttle_wait'])
+        if sample.get('error_type') == 'throttled':
+            self.throttled += 1
+            return
+        if not sample['ok']:
+            kind = sample.get('error_type') or 'error'
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            return
+        self.ok += 1
+        self.model = sample.get('model') or self.model
+        self.input_tokens += sample['input_tokens']
+        self.output_tokens += sample['output_tokens']
+        self.cached_tokens += sample.get('cached_tokens', 0)
+        self.usage_reported += bool(sample.get('usage_reported'))
+        for name in ('network_latency', 'first_token_time', 'total_time'):
+            self.hists[name].record(sample[name])
+        for gap in sample['itl']:
+            self.hists['itl'].record(gap)
+        if meets_slo(sample, self.slo):
+            self.good += 1
+            self.good_output_tokens += sample['output_tokens']
+
+    def record_quota_exhausted(self, waited):
+        """记录一个在运行结束前没有等到配额、因而没有发出的请求；等待时间同样计入限流等待"""
+        self.quota_exhausted += 1
+        self.hists['throttle_wait'].record(waited)
+
+    @property
+    def requests(self):
+        return self.ok + sum(self.errors.values()) + self.throttled
+
+    @property
+    def success_rate(self):
+        return self.ok / self.requests if self.requests else 0.0
+
+    @property
+    def goodput(self):
+        """满足SLO的请求每秒输出的token数"""
+        return self.good_output_tokens / self.duration if self.duration else 0.0
+
+    def merge(self, other):
+        for name in self.HISTOGRAMS:
+            self.hists[name].merge(other.hists[name])
+        self.ok += other.ok
+        self.good += other.good
+        self.good_output_tokens += other.good_output_tokens
+        self.throttled += other.throttled
+        self.quota_exhausted += other.quota_exhausted
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+        self.model = self.model or other.model
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cached_tokens += other.cached_tokens
+        self.usage_reported += other.usage_reported
+        # 各worker并行运行，取最长的运行时间
+        self.duration = max(self.duration, other.duration)
+        return self
+
+    def to_dict(self):
+        return {
+            'hists': {name: hist.to_dict() for name, hist in self.hists.items()},
+            'ok': self.ok,
+            'good': self.good,
+            'good_output_tokens': self.good_output_tokens,
+            'errors': dict(self.errors),
+            'throttled': self.throttled,
+            'quota_exhausted': self.quota_exhausted,
+            'model': self.model,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cached_tokens': self.cached_tokens,
+            'usage_reported': self.usage_reported,
+            'duration': self.duration,
+            'slo': self.slo
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data.get('slo'))
+        stats.hists.update({name: LatencyHistogram.from_dict(hist) for name, hist in data['hists'].items()})
+        stats.ok = data['ok']
+        stats.good = data.get('good', 0)
+        stats.good_output_tokens = data.get('good_output_tokens', 0)
+        stats.errors = dict(data['errors'])
+        stats.throttled = data.get('throttled', 0)
+        stats.quota_exhausted = data.get('quota_exhausted', 0)
+        stats.model = data.get('model')
+        stats.input_tokens = data['input_tokens']
+        stats.output_tokens = data['output_tokens']
+        stats.cached_tokens = data.get('cached_tokens', 0)
+        stats.usage_reported = data.get('usage_reported', 0)
+        stats.duration = data['duration']
+        return stats
+
+
+# to_dict中保存客户端资源统计的键，不会与平台名称冲突
+RESOURCES_KEY = '_resources'
+
+
+class RunStats:
+    """一次压测的全部平台统计，键为平台名称
+
+    resources为压测客户端自身的资源统计（resource_monitor.ResourceUsage），可能为None。
+    slo为计算goodput的单请求SLO，默认使用DEFAULT_SLO；未指定时从合并或反序列化的平台统计中继承。
+    samples为可选的逐请求样本库（sample_store.SampleStore），不包含在to_dict中，由调用方单独传输。
+    """
+
+    def __init__(self, slo=None):
+        self.slo = slo
+        self.providers = {}
+        self.resources = None
+        self.samples = None
+
+    def get(self, provider):
+        if provider not in self.providers:
+            self.providers[provider] = ProviderStats(self.slo)
+        return self.providers[provider]
+
+    def record(self, sample):
+        self.get(sample['provider']).record(sample)
+
+    def merge(self, other):
+        if self.slo is None:
+            self.slo = other.slo
+        for provider, stats in other.providers.items():
+            self.get(provider).merge(stats)
+        if other.resources is not None:
+            if self.resources is None:
+                from resource_monitor import ResourceUsage
+                self.resources = ResourceUsage()
+            self.resources.merge(other.resources)
+        if other.samples is not None:
+            if self.samples is None:
+                from sample_store import SampleStore
+                self.samples = SampleStore()
+            self.samples.extend(other.samples)
+        return self
+
+    def to_dict(self):
+        data = {provider: stats.to_dict() for provider, stats in self.providers.items()}
+        if self.resources is not None:
+            data[RESOURCES_KEY] = self.resources.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        run = cls()
+        data = dict(data)
+        resources = data.pop(RESOURCES_KEY, None)
+        run.providers = {provider: ProviderStats.from_dict(stats) for provider, stats in data.items()}
+        if run.providers:
+            run.slo = next(iter(run.providers.values())).slo
+        if resources is not None:
+            from resource_monitor import ResourceUsage
+            run.resources = ResourceUsage.from_dict(resources)
+        return run
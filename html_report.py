@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+'''
+离线HTML性能报告
+
+功能说明：
+- 读取loadgen.py --samples保存的逐请求样本，生成单个自包含的HTML文件：图表为内联SVG，
+  不引用任何外部脚本、样式或字体，可直接用浏览器打开或作为附件发送
+- 各平台首token、总耗时的CDF，逐请求平均/最大token间隔的CDF；同时提供loadgen.py --output保存的直方图文件时，
+  token间隔改用全部相邻数据块间隔的直方图
+- CDF的纵轴按“几个9”拉伸（50%、90%、99%、99.9%等距），尾部延迟一目了然
+- 压测期间各平台的输出吞吐、请求数和按错误类型分列的错误数随时间的变化
+- 生成时降采样：CDF固定取约CDF_POINTS个分位点（尾部加密），时间序列最多--buckets个时间桶，
+  图表点数与样本数无关，百万级样本也能在数秒内生成几十KB的文件
+
+运行命令：
+python html_report.py samples.npz --output report.html
+python html_report.py samples.npz --histograms stats.json --by provider,model --output report.html
+
+配置参数：
+⭐ --by：分组字段（provider、model、prompt），逗号分隔
+⭐ --histograms：loadgen.py --output保存的直方图文件，用于绘制完整的token间隔分布
+⭐ --buckets：时间序列的最大时间桶数
+'''
+
+import argparse
+import datetime
+import html
+import json
+import math
+import time
+
+import numpy as np
+
+from histogram import LatencyHistogram
+from sample_store import CATEGORY_COLUMNS, SampleStore
+from stream_client import ERROR_TYPES
+
+CDF_POINTS = 160
+MAX_BUCKETS = 240
+MAX_NINES = 4
+
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+WIDTH = 720
+HEIGHT = 300
+MARGIN = {'left': 64, 'right': 16, 'top': 12, 'bottom': 44}
+
+STYLE = '''
+body { font-family: -apple-system, "Segoe UI", "PingFang SC", "Microsoft YaHei", sans-serif; margin: 24px; color: #222; }
+h1 { font-size: 22px; } h2 { font-size: 18px; margin-top: 32px; border-bottom: 1px solid #ddd; padding-bottom: 4px; }
+h3 { font-size: 15px; margin: 20px 0 4px; }
+table { border-collapse: collapse; font-size: 13px; } th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: right; }
+th { background: #f4f4f4; } td:first-child, th:first-child { text-align: left; }
+.meta { color: #666; font-size: 13px; } .note { color: #666; font-size: 12px; }
+svg { display: block; } svg text { font-size: 11px; fill: #444; } .legend span { margin-right: 14px; font-size: 12px; }
+'''
+
+
+def quantile_grid(points=CDF_POINTS, max_nines=MAX_NINES):
+    """CDF的分位点：在“几个9”的尺度上均匀分布，尾部比中位数附近更密"""
+    nines = np.linspace(0, max_nines, points)
+    return 1 - 10 ** -nines
+
+
+def nines(quantiles):
+    """分位点换算为“几个9”的纵坐标：0.9 -> 1，0.99 -> 2"""
+    return -np.log10(np.maximum(1 - np.asarray(quantiles, dtype=np.float64), 10.0 ** -MAX_NINES))
+
+
+def histogram_quantiles(hist, quantiles):
+    """LatencyHistogram在各分位点上的取值（桶的代表值，限制在真实最值范围内）"""
+    indexes = sorted(hist.buckets)
+    cumulative = np.cumsum([hist.buckets[index] for index in indexes])
+    ranks = np.clip(np.ceil(np.asarray(quantiles) * hist.count), 1, hist.count)
+    positions = np.searchsorted(cumulative, ranks)
+    values = np.array([hist._value(indexes[position]) for position in positions])
+    return np.clip(values, hist.min, hist.max)
+
+
+def nice_ticks(low, high, count=5):
+    """返回覆盖[low, high]的整齐刻度"""
+    if high <= low:
+        high = low + 1
+    step = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= step)
+    ticks = [round(math.floor(low / step) * step, 10)]
+    while ticks[-1] < high - step * 1e-9:
+        ticks.append(round(ticks[-1] + step, 10))
+    return ticks
+
+
+def format_tick(value):
+    return f'{value:g}' if abs(value) < 1e5 else f'{value:.2e}'
+
+
+def line_chart(series, x_label, y_label, y_ticks=None, step=False):
+    """绘制折线图，返回SVG文本
+
+    series为[(名称, xs, ys)]；y_ticks为可选的[(纵坐标, 标签)]，省略时自动生成；step为True时画阶梯线（时间序列）。
+    """
+    series = [(name, np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+              for name, xs, ys in series if len(xs)]
+    if step:
+        # 阶梯线：每个时间桶内取值不变，最后一个桶画到桶的结束时刻
+        series = [(name, np.repeat(np.append(xs, xs[-1] + (xs[-1] - xs[-2] if len(xs) > 1 else 1)), 2)[1:-1],
+                   np.repeat(ys, 2)) for name, xs, ys in series]
+    if not series:
+        return '<p class="note">没有数据</p>'
+    x_ticks = nice_ticks(min(float(xs.min()) for _, xs, _ in series), max(float(xs.max()) for _, xs, _ in series))
+    if y_ticks is None:
+        y_ticks = [(value, format_tick(value))
+                   for value in nice_ticks(min(0.0, min(float(ys.min()) for _, _, ys in series)),
+                                           max(float(ys.max()) for _, _, ys in series))]
+    x_low, x_high = x_ticks[0], x_ticks[-1]
+    y_low, y_high = y_ticks[0][0], y_ticks[-1][0]
+    plot_width = WIDTH - MARGIN['left'] - MARGIN['right']
+    plot_height = HEIGHT - MARGIN['top'] - MARGIN['bottom']
+
+    def px(x):
+        return MARGIN['left'] + (x - x_low) / ((x_high - x_low) or 1) * plot_width
+
+    def py(y):
+        return MARGIN['top'] + plot_height - (y - y_low) / ((y_high - y_low) or 1) * plot_height
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}">']
+    for value in x_ticks:
+        x = px(value)
+        parts.append(f'<line x1="{x:.1f}" y1="{MARGIN["top"]}" x2="{x:.1f}" y2="{MARGIN["top"] + plot_height}" stroke="#eee"/>')
+        parts.append(f'<text x="{x:.1f}" y="{MARGIN["top"] + plot_height + 14}" text-anchor="middle">{format_tick(value)}</text>')
+    for value, label in y_ticks:
+        y = py(value)
+        parts.append(f'<line x1="{MARGIN["left"]}" y1="{y:.1f}" x2="{MARGIN["left"] + plot_width}" y2="{y:.1f}" stroke="#eee"/>')
+        parts.append(f'<text x="{MARGIN["left"] - 6}" y="{y + 4:.1f}" text-anchor="end">{html.escape(label)}</text>')
+    parts.append(f'<rect x="{MARGIN["left"]}" y="{MARGIN["top"]}" width="{plot_width}" height="{plot_height}" '
+                 f'fill="none" stroke="#999"/>')
+    parts.append(f'<text x="{MARGIN["left"] + plot_width / 2:.1f}" y="{HEIGHT - 6}" text-anchor="middle">'
+                 f'{html.escape(x_label)}</text>')
+    parts.append(f'<text transform="translate(14 {MARGIN["top"] + plot_height / 2:.1f}) rotate(-90)" '
+                 f'text-anchor="middle">{html.escape(y_label)}</text>')
+    for index, (name, xs, ys) in enumerate(series):
+        points = ' '.join(f'{px(x):.1f},{py(y):.1f}' for x, y in zip(xs, ys))
+        parts.append(f'<polyline fill="none" stroke="{COLORS[index % len(COLORS)]}" stroke-width="1.6" '
+                     f'points="{points}"><title>{html.escape(name)}</title></polyline>')
+    parts.append('</svg>')
+    legend = ''.join(f'<span style="color:{COLORS[index % len(COLORS)]}">■</span><span>{html.escape(name)}</span>'
+                     for index, (name, _, _) in enumerate(series))
+    return '\n'.join(parts) + f'\n<div class="legend">{legend}</div>'
+
+
+def cdf_chart(series, x_label, samples):
+    """CDF图：series为[(名称, 分位点, 取值)]，纵轴为“几个9”，最高到样本数能支撑的分位"""
+    max_nines = min(MAX_NINES, max(1, math.ceil(math.log10(max(samples, 10)))))
+    labels = ['0%', '90%', '99%', '99.9%', '99.99%']
+    y_ticks = [(value, labels[value]) for value in range(max_nines + 1)]
+    y_ticks.insert(1, (float(nines(0.5)), '50%'))
+    keep = [(name, values[quantiles <= 1 - 10.0 ** -max_nines], nines(quantiles[quantiles <= 1 - 10.0 ** -max_nines]))
+            for name, quantiles, values in series]
+    return line_chart(keep, x_label, '累计占比', y_ticks=y_ticks)
+
+
+def table_html(headers, rows):
+    head = ''.join(f'<th>{html.escape(str(header))}</th>' for header in headers)
+    body = ''.join('<tr>' + ''.join(f'<td>{html.escape(str(cell))}</td>' for cell in row) + '</tr>' for row in rows)
+    return f'<table><tr>{head}</tr>{body}</table>'
+
+
+def _label(label):
+    return '/'.join(part or '-' for part in label)
+
+
+def load_histograms(filename):
+    """读取loadgen.py --output的直方图文件，返回{平台: token间隔直方图}"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    hists = {}
+    for provider, stats in data.items():
+        if isinstance(stats, dict) and 'hists' in stats and stats['hists'].get('itl', {}).get('count'):
+            hists[provider] = LatencyHistogram.from_dict(stats['hists']['itl'])
+    return hists
+
+
+def build_report(store, by=('provider',), histograms=None, buckets=MAX_BUCKETS, title='API性能测试报告', source=''):
+    """生成报告的HTML文本"""
+    by = tuple(by)
+    quantiles = quantile_grid()
+    sections = []
+
+    summary = store.summarize(by, ('first_token_time', 'total_time', 'itl_mean', 'output_speed'),
+                              percentiles=(50, 90, 99, 99.9))
+    sections.append('<h2>汇总</h2>')
+    sections.append(table_html(summary.headers(), summary.rows()))
+    sections.append('<p class="note">延迟单位为秒，只统计成功的请求；输出token/s为成功请求的输出token数除以该组的时间跨度</p>')
+
+    ok = int(store.column('ok').sum())
+    sections.append('<h2>延迟分布（CDF）</h2>')
+    for metric, name in (('first_token_time', '首token时间'), ('total_time', '总耗时'),
+                         ('itl_mean', '逐请求平均token间隔'), ('itl_max', '逐请求最大token间隔（停顿）')):
+        if metric == 'itl_mean' and histograms:
+            # 有直方图文件时，用全部相邻数据块间隔的分布代替逐请求平均值
+            series = [(provider, quantiles, histogram_quantiles(hist, quantiles)) for provider, hist in histograms.items()]
+            count = max(hist.count for hist in histograms.values())
+            name = '全部token间隔（直方图）'
+        else:
+            labels, table = store.distribution(metric, quantiles, by)
+            # 没有记录该指标的分组（例如run_tests.py的样本没有token间隔）不画线
+            series = [(_label(label), quantiles, row) for label, row in zip(labels, table) if row.any()]
+            count = ok
+        unit = '毫秒' if metric.startswith('itl') else '秒'
+        scale = 1000 if metric.startswith('itl') else 1
+        sections.append(f'<h3>{name}</h3>')
+        sections.append(cdf_chart([(label, q, values * scale) for label, q, values in series], f'{name}（{unit}）', count))
+
+    start = store.column('start')
+    span = float(start.max() - start.min()) if len(start) else 0.0
+    bucket_seconds = max(1.0, math.ceil(span / max(1, buckets)))
+    offsets, labels, total, errors, tokens = store.timeline(bucket_seconds, by)
+    sections.append('<h2>随时间的变化</h2>')
+    sections.append(f'<p class="note">按请求开始时间分桶，每桶{bucket_seconds:g}秒；输出token计入请求开始的时间桶</p>')
+    sections.append('<h3>输出吞吐（token/s）</h3>')
+    sections.append(line_chart([(_label(label), offsets, row / bucket_seconds) for label, row in zip(labels, tokens)],
+                               '开始后的时间（秒）', 'token/s', step=True))
+    sections.append('<h3>请求数（次/秒）</h3>')
+    sections.append(line_chart([(_label(label), offsets, row / bucket_seconds) for label, row in zip(labels, total)],
+                               '开始后的时间（秒）', '请求/秒', step=True))
+    error_offsets, error_labels, error_total, _, _ = store.timeline(bucket_seconds, ('error_type',))
+    error_series = [(ERROR_TYPES.get(label[0], label[0]), error_offsets, row)
+                    for label, row in zip(error_labels, error_total) if label[0]]
+    sections.append('<h3>错误数（每桶）</h3>')
+    sections.append(line_chart(error_series, '开始后的时间（秒）', '错误数', step=True) if error_series
+                    else '<p class="note">没有失败的请求</p>')
+
+    failed = len(store) - ok
+    meta = (f'样本数 {len(store)}（成功 {ok}，失败 {failed}），时间跨度 {span:.0f}秒，'
+            f'生成时间 {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+    if source:
+        meta += f'，数据来源 {source}'
+    return (f'<!DOCTYPE html>\n<html lang="zh-CN"><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'<style>{STYLE}</style></head><body>\n<h1>{html.escape(title)}</h1><p class="meta">{html.escape(meta)}</p>\n'
+            + '\n'.join(sections) + '\n</body></html>\n')
+
+
+def write_report(store, filename, by=('provider',), histograms=None, buckets=MAX_BUCKETS, title='API性能测试报告',
+                 source=''):
+    """生成报告并写入filename，返回文件字节数"""
+    content = build_report(store, by, histograms, buckets, title, source).encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(content)
+    return len(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线HTML性能报告')
+    parser.add_argument('samples_file', help='loadgen.py用--samples保存的样本文件(.npz)')
+    parser.add_argument('--output', default='report.html', help='输出的HTML文件')
+    parser.add_argument('--by', default='provider', help='分组字段，逗号分隔')
+    parser.add_argument('--histograms', help='loadgen.py --output保存的直方图文件(.json)')
+    parser.add_argument('--buckets', type=int, default=MAX_BUCKETS, help='时间序列的最大时间桶数')
+    parser.add_argument('--title', default='API性能测试报告')
+    args = parser.parse_args()
+
+    by = [name.strip() for name in args.by.split(',') if name.strip()]
+    for name in by:
+        if name not in CATEGORY_COLUMNS:
+            parser.error(f'未知的分组字段: {name}')
+
+    start = time.perf_counter()
+    store = SampleStore.load(args.samples_file)
+    histograms = load_histograms(args.histograms) if args.histograms else None
+    size = write_report(store, args.output, by, histograms, args.buckets, args.title, args.samples_file)
+    print(f"报告已保存到文件: {args.output}（{len(store)}个样本, {size / 1024:.1f}KB, "
+          f"耗时{time.perf_counter() - start:.2f}秒）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+'''
+压测实时数据上报
+
+功能说明：
+- 压测进程把请求的开始/结束事件汇总后，按固定周期通过UDP发送给实时看板（dashboard.py）
+- 每个周期只发送一个小数据包：各平台当前在途请求数 + 本周期内完成请求的精简样本
+- 不上报逐token事件；UDP发送不等待对方确认，看板未启动或处理变慢都不会拖慢压测
+
+数据包格式（JSON）：
+    {"source": "主机名:进程号", "inflight": {"ark": 12}, "samples": [["ark", 1, null, 0.52, 38.1], ...]}
+    样本字段依次为：平台、是否成功、错误类型、首token时间（秒）、输出速度（token/s）
+'''
+
+import asyncio
+import json
+import os
+import socket
+
+# 单个数据包最多携带的样本数，保证数据包大小远低于UDP上限
+MAX_SAMPLES_PER_PACKET = 400
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class LiveFeed:
+    def __init__(self, address, interval=0.5):
+        self.address = parse_address(address)
+        self.interval = interval
+        self.source = f'{socket.gethostname()}:{os.getpid()}'
+        self.inflight = {}
+        self._samples = []
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._task = None
+
+    def started(self, provider):
+        self.inflight[provider] = self.inflight.get(provider, 0) + 1
+
+    def finished(self, sample):
+        self.inflight[sample['provider']] -= 1
+        self._samples.append([
+            sample['provider'],
+            1 if sample['ok'] else 0,
+            sample['error_type'],
+            round(sample['first_token_time'], 4),
+            round(sample['output_speed'], 2)
+        ])
+
+    def flush(self):
+        samples, self._samples = self._samples, []
+        batches = [samples[i:i + MAX_SAMPLES_PER_PACKET] for i in range(0, len(samples), MAX_SAMPLES_PER_PACKET)]
+        for batch in batches or [[]]:
+            packet = {'source': self.source, 'inflight': self.inflight, 'samples': batch}
+            try:
+                self._socket.sendto(json.dumps(packet).encode('utf-8'), self.address)
+            except OSError:
+                # 看板不可达或发送缓冲区已满时直接丢弃，不影响压测
+                pass
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.flush()
+        self._socket.close()
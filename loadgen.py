@@ -0,0 +1,561 @@
+# -*- coding: utf-8 -*-
+
+'''
+多进程压测工具
+
+功能说明：
+- 以固定并发（闭环）或固定QPS（开环）向一个或多个平台持续发送流式请求
+- 支持多进程模式：每个worker进程拥有独立的事件循环和连接池，
+  目标并发/QPS在各进程之间均分，避免单核解析SSE时成为瓶颈
+- worker只回传可合并的直方图和计数，不回传原始样本，汇总开销极小；
+  需要逐请求样本时（--samples）写入列式样本库（sample_store.py），每个样本约50字节，结束时一次性回传
+- 同时记录压测客户端自身的CPU、内存、GC、socket和事件循环滞后，
+  客户端成为瓶颈时在报告中标记为“客户端受限”
+- 可使用mock平台对本地模拟服务器（mock_server.py）进行压测
+
+运行命令：
+python loadgen.py --providers ark,aliyun --concurrency 32 --duration 60 --processes 4
+python loadgen.py --providers mock --qps 200 --duration 30 --processes 4
+
+配置参数：
+⭐ --providers：平台名称，逗号分隔（ark、aliyun、tencent、siliconflow、openrouter、deepseek、mock）
+⭐ --concurrency：每个平台的并发请求数（闭环模式）
+⭐ --qps：每个平台每秒发起的请求数（开环模式）
+⭐ --duration / --requests：运行时长（秒）或每个平台的总请求数
+⭐ --processes：worker进程数量
+⭐ --pace：按平台的请求数/token数配额控制节奏（配额来自--rpm/--tpm或响应头），429单独统计
+⭐ --dashboard：实时看板（dashboard.py）的数据接收地址，如 127.0.0.1:5001
+⭐ --flush-interval：每隔多少秒输出一次中间结果（并写入--output文件），长时间压测无需等到结束
+⭐ --connect-timeout / --ttft-timeout / --idle-timeout / --total-timeout：各阶段超时（秒），
+   默认取config.py中的TIMEOUTS（可用环境变量覆盖），超时的请求被取消并记为timeout
+⭐ --slo-ttft / --slo-itl：计算goodput的单请求SLO（秒），报告中同时给出成功率和错误分类
+⭐ --samples：将逐请求样本保存为.npz文件，可用sample_store.py按平台/模型/提示词分组汇总
+⭐ --calibration / --no-calibration：校准文件（calibrate.py --save生成），存在时自动从各请求的耗时中扣除
+   stream_client的固定计时偏差
+'''
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import queue
+import random
+import time
+
+from histogram import DEFAULT_SLO, RunStats
+from live_feed import LiveFeed
+from rate_limit import ProviderRateLimiter
+from resource_monitor import ResourceMonitor
+from stream_client import ERROR_TYPES, ConnectionPool, calculate_input_tokens, stream_chat
+
+DEFAULT_MESSAGES = [
+    {"role": "user", "content": "你好，请介绍一下你自己。"}
+]
+
+MOCK_BASE_URL = 'http://127.0.0.1:8000/v1'
+
+# 等待worker结果时检查其是否存活的间隔（秒）
+WORKER_POLL_INTERVAL = 1.0
+
+
+def resolve_provider(name, mock_url=MOCK_BASE_URL):
+    """将平台名称解析为包含name、base_url、api_key、model的字典"""
+    if name == 'mock':
+        return {'name': 'mock', 'base_url': mock_url, 'api_key': 'mock', 'model': 'mock-model'}
+    from config import config
+    provider = getattr(config, name, None)
+    if not isinstance(provider, dict):
+        raise ValueError(f'未知的平台: {name}')
+    return {'name': name, 'base_url': provider['base_url'], 'api_key': provider['api_key'], 'model': provider['model']}
+
+
+def make_plan(providers, concurrency=0, qps=0.0, duration=0.0, requests=0,
+              messages=None, max_tokens=512, arrival='uniform', pace=False, rate_limits=None, dashboard=None,
+              flush_interval=0, timeouts=None, slo=None, keep_samples=False, corrections=None):
+    if not concurrency and not qps:
+        concurrency = 1
+    if not duration and not requests:
+        raise ValueError('必须指定运行时长(duration)或请求总数(requests)')
+    return {
+        'providers': providers,
+        'concurrency': concurrency,
+        'qps': qps,
+        'arrival': arrival,
+        'duration': duration,
+        'requests': requests,
+        'messages': messages or DEFAULT_MESSAGES,
+        'max_tokens': max_tokens,
+        'offset': 0.0,
+        'start_at': None,
+        'pace': pace,
+        'rate_limits': rate_limits or {},
+        'rate_share': 1.0,
+        'dashboard': dashboard,
+        'flush_interval': flush_interval,
+        'timeouts': timeouts,
+        'slo': slo or DEFAULT_SLO,
+        'keep_samples': keep_samples,
+        'corrections': corrections or {}
+    }
+
+
+async def _run_provider(pool, provider, plan, stats, feed=None):
+    start = time.perf_counter()
+    deadline = start + plan['duration'] if plan['duration'] else None
+    budget = plan['requests']
+    issued = 0
+    limiter = None
+    if plan['pace']:
+        quota = plan['rate_limits'].get(provider['name'], {})
+        limiter = ProviderRateLimiter(quota.get('rpm'), quota.get('tpm'), share=plan['rate_share'])
+    # 平台按max_tokens预扣token配额，请求完成后按实际用量修正
+    estimated_tokens = calculate_input_tokens(plan['messages']) + plan['max_tokens']
+    if stats.samples is not None:
+        from sample_store import prompt_label
+        prompt = prompt_label(plan['messages'])
+    if plan['corrections']:
+        from calibrate import correct_sample
+
+    async def one_request():
+        waited = 0.0
+        if limiter:
+            wait_start = time.perf_counter()
+            try:
+                # 等待配额不能超过运行截止时间
+                timeout = deadline - wait_start if deadline is not None else None
+                waited = await asyncio.wait_for(limiter.acquire(estimated_tokens), timeout)
+            except asyncio.TimeoutError:
+                # 到截止时间仍未等到配额，请求不再发出；等待时间和被压住的需求仍计入报告
+                stats.get(provider['name']).record_quota_exhausted(time.perf_counter() - wait_start)
+                return
+        if feed:
+            feed.started(provider['name'])
+        sample = await stream_chat(pool, provider, plan['messages'], plan['max_tokens'], timeouts=plan['timeouts'])
+        sample['throttle_wait'] = waited
+        if plan['corrections']:
+            correct_sample(sample, plan['corrections'])
+        if feed:
+            feed.finished(sample)
+        if limiter:
+            actual = sample['input_tokens'] + sample['output_tokens'] if sample['ok'] else None
+            limiter.observe(sample['http_status'], sample['rate_limit_headers'], estimated_tokens, actual)
+        stats.record(sample)
+        if stats.samples is not None:
+            stats.samples.add_sample(sample, prompt, provider['model'])
+
+    def can_issue():
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        return not budget or issued < budget
+
+    if plan['qps']:
+        # 开环模式：按到达时间表发起请求，不等待前一个请求完成
+        interval = 1.0 / plan['qps']
+        next_time = start + plan['offset']
+        tasks = set()
+        while can_issue():
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not can_issue():
+                break
+            issued += 1
+            task = asyncio.ensure_future(one_request())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if plan['arrival'] == 'poisson':
+                next_time += random.expovariate(plan['qps'])
+            else:
+                next_time += interval
+        if tasks:
+            await asyncio.gather(*tasks)
+    else:
+        # 闭环模式：每个虚拟用户完成一个请求后立即发起下一个
+        async def user():
+            nonlocal issued
+            while can_issue():
+                issued += 1
+                await one_request()
+
+        await asyncio.gather(*[user() for _ in range(plan['concurrency'])])
+
+    stats.get(provider['name']).duration = time.perf_counter() - start
+
+
+def snapshot_stats(stats, elapsed):
+    """复制当前统计作为中间结果；尚未结束的平台以已运行时长作为duration"""
+    snapshot = RunStats.from_dict(stats.to_dict())
+    for provider in snapshot.providers.values():
+        if not provider.duration:
+            provider.duration = elapsed
+    return snapshot
+
+
+async def _flush_loop(stats, interval, on_snapshot):
+    start = time.perf_counter()
+    while True:
+        await asyncio.sleep(interval)
+        on_snapshot(snapshot_stats(stats, time.perf_counter() - start))
+
+
+async def run_load(plan, pool=None, on_snapshot=None):
+    """在当前进程的事件循环中执行压测计划，返回RunStats
+
+    传入pool时复用已有连接池（调用方负责关闭），便于多个阶段之间保持连接预热。
+    传入on_snapshot且计划中设置了flush_interval时，每隔flush_interval秒以中间结果调用一次。
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool()
+    stats = RunStats(plan.get('slo'))
+    if plan.get('keep_samples'):
+        from sample_store import SampleStore
+        stats.samples = SampleStore()
+    for provider in plan['providers']:
+        stats.get(provider['name'])
+    if plan.get('start_at'):
+        # 分布式模式下按约定的墙上时钟时刻同时开始
+        delay = plan['start_at'] - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    feed = None
+    if plan.get('dashboard'):
+        feed = LiveFeed(plan['dashboard'])
+        feed.start()
+    monitor = ResourceMonitor().start()
+    flusher = None
+    if on_snapshot and plan.get('flush_interval'):
+        flusher = asyncio.ensure_future(_flush_loop(stats, plan['flush_interval'], on_snapshot))
+    try:
+        await asyncio.gather(*[_run_provider(pool, provider, plan, stats, feed) for provider in plan['providers']])
+    finally:
+        if flusher:
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+        stats.resources = await monitor.stop()
+        if feed:
+            await feed.stop()
+        if own_pool:
+            await pool.close()
+    return stats
+
+
+def _share(total, parts, index):
+    return total // parts + (1 if index < total % parts else 0)
+
+
+def split_plan(plan, processes):
+    """将并发数/QPS/请求数在各worker之间均分"""
+    plans = []
+    for index in range(processes):
+        part = dict(plan)
+        part['rate_share'] = plan['rate_share'] / processes
+        if plan['qps']:
+            part['qps'] = plan['qps'] / processes
+            # 错开各worker的发起时刻，避免同时突发（可多级拆分）
+            part['offset'] = plan['offset'] + index / plan['qps']
+        else:
+            part['concurrency'] = _share(plan['concurrency'], processes, index)
+            if not part['concurrency']:
+                continue
+        if plan['requests']:
+            part['requests'] = _share(plan['requests'], processes, index)
+            if not part['requests']:
+                continue
+        plans.append(part)
+    return plans
+
+
+def _worker_main(plan, barrier, results, index):
+    # 所有worker就绪后同时开始，避免进程启动时间差影响结果
+    barrier.wait()
+
+    def on_snapshot(snapshot):
+        results.put(('partial', index, snapshot.to_dict()))
+
+    stats = asyncio.run(run_load(plan, on_snapshot=on_snapshot))
+    if stats.samples is not None:
+        results.put(('samples', index, stats.samples.to_dict()))
+    results.put(('final', index, stats.to_dict()))
+
+
+def _stop_workers(workers):
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+    for worker in workers:
+        worker.join()
+
+
+def run_multiprocess(plan, processes, on_snapshot=None):
+    """启动多个worker进程执行压测计划，合并各进程的直方图
+
+    on_snapshot用于接收合并后的中间结果（需在计划中设置flush_interval）。
+    计划中设置keep_samples时，各worker的样本库合并到返回值的samples中。
+    有worker未上报最终结果就退出（异常、OOM、被杀死）时终止其余worker并抛出RuntimeError。
+    """
+    plans = split_plan(plan, processes)
+    if len(plans) <= 1:
+        return asyncio.run(run_load(plans[0] if plans else plan, on_snapshot=on_snapshot))
+    if on_snapshot is None:
+        # 没有接收方时worker不必生成中间结果
+        plans = [dict(part, flush_interval=0) for part in plans]
+
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(len(plans))
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_worker_main, args=(part, barrier, results, index))
+               for index, part in enumerate(plans)]
+    for worker in workers:
+        worker.start()
+
+    # 每个worker最新的（中间或最终）结果，以及已上报的中间结果次数
+    latest = {}
+    samples = []
+    rounds = [0] * len(workers)
+    reported = 0
+    finished = 0
+    suspects = set()
+    while finished < len(workers):
+        try:
+            kind, index, data = results.get(timeout=WORKER_POLL_INTERVAL)
+        except queue.Empty:
+            # 已退出却没有上报最终结果的worker再等一个周期，确认队列中没有它遗留的数据
+            dead = {index for index, worker in enumerate(workers)
+                    if rounds[index] != float('inf') and not worker.is_alive()}
+            failed = dead & suspects
+            if failed:
+                _stop_workers(workers)
+                details = '、'.join(f'worker {index}（exitcode {workers[index].exitcode}）' for index in sorted(failed))
+                raise RuntimeError(f'{details}未上报最终结果就退出，压测中止')
+            suspects = dead
+            continue
+        if kind == 'samples':
+            from sample_store import SampleStore
+            samples.append(SampleStore.from_dict(data))
+            continue
+        latest[index] = data
+        if kind == 'final':
+            finished += 1
+            rounds[index] = float('inf')
+        elif on_snapshot:
+            rounds[index] += 1
+            # 所有worker都上报了新一轮中间结果后才合并输出，每个周期只输出一次
+            if reported < min(rounds) < float('inf'):
+                reported = min(rounds)
+                partial = RunStats(plan.get('slo'))
+                for part in latest.values():
+                    partial.merge(RunStats.from_dict(part))
+                on_snapshot(partial)
+    for worker in workers:
+        worker.join()
+
+    stats = RunStats(plan.get('slo'))
+    for data in latest.values():
+        stats.merge(RunStats.from_dict(data))
+    for part in samples:
+        if stats.samples is None:
+            stats.samples = part
+        else:
+            stats.samples.extend(part)
+    return stats
+
+
+def report_rows(stats):
+    rows = []
+    for name, provider in stats.providers.items():
+        ttft = provider.hists['first_token_time']
+        itl = provider.hists['itl']
+        total = provider.hists['total_time']
+        duration = provider.duration or 1
+        rows.append([
+            name,
+            provider.requests,
+            provider.ok,
+            sum(provider.errors.values()),
+            f'{provider.success_rate:.1%}',
+            ttft.percentile(50), ttft.percentile(95), ttft.percentile(99),
+            itl.percentile(50) * 1000, itl.percentile(95) * 1000,
+            total.percentile(50), total.percentile(95),
+            provider.throttled,
+            provider.hists['throttle_wait'].total,
+            provider.requests / duration,
+            provider.output_tokens / duration,
+            provider.goodput
+        ])
+    return rows
+
+
+REPORT_HEADERS = [
+    '平台', '请求数', '成功', '失败', '成功率',
+    '首token p50(秒)', '首token p95(秒)', '首token p99(秒)',
+    'token间隔 p50(毫秒)', 'token间隔 p95(毫秒)',
+    '总耗时 p50(秒)', '总耗时 p95(秒)',
+    '429次数', '限流等待(秒)',
+    '请求/秒', '输出token/s', 'goodput(token/s)'
+]
+
+
+def describe_slo(slo):
+    conditions = []
+    if slo.get('ttft'):
+        conditions.append(f"首token ≤ {slo['ttft']:g}秒")
+    if slo.get('itl'):
+        conditions.append(f"平均token间隔 ≤ {slo['itl'] * 1000:g}毫秒")
+    return '，'.join(conditions) or '不限制'
+
+
+def describe_errors(errors):
+    return ', '.join(f'{ERROR_TYPES.get(kind, kind)}: {count}' for kind, count in errors.items())
+
+
+def print_report(stats):
+    from tabulate import tabulate
+    print("\n压测结果：")
+    print(tabulate(report_rows(stats), headers=REPORT_HEADERS, tablefmt='grid', floatfmt=".2f"))
+    for name, provider in stats.providers.items():
+        if provider.errors:
+            print(f"- {name} 错误分布: {describe_errors(provider.errors)}")
+        if provider.quota_exhausted:
+            print(f"- {name} 有{provider.quota_exhausted}个请求到运行结束仍未等到配额，没有发出（等待时间计入限流等待）")
+    slo = stats.slo or DEFAULT_SLO
+    print(f"goodput只统计满足SLO（{describe_slo(slo)}）的请求；失败的请求不计入延迟统计")
+    print_resources(stats.resources)
+
+
+def partial_reporter(output=None):
+    """返回用于run_multiprocess的中间结果回调：打印简要结果，并覆盖写入output文件"""
+    from tabulate import tabulate
+
+    def on_snapshot(stats):
+        elapsed = max((provider.duration for provider in stats.providers.values()), default=0)
+        print(f"\n中间结果（已运行约{elapsed:.0f}秒）：")
+        print(tabulate(report_rows(stats), headers=REPORT_HEADERS, tablefmt='simple', floatfmt=".2f"))
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(stats.to_dict(), f, ensure_ascii=False)
+
+    return on_snapshot
+
+
+def print_resources(resources):
+    if resources is None:
+        return
+    from tabulate import tabulate
+
+    summary = resources.summary()
+    print("\n压测客户端资源占用：")
+    print(tabulate([list(summary.values())], headers=list(summary.keys()), tablefmt='grid', disable_numparse=True))
+    reasons = resources.client_bound()
+    if reasons:
+        print(f"⚠️ 客户端受限（{'；'.join(reasons)}）：测得的延迟包含压测客户端自身的排队时间，"
+              f"请增加--processes或降低并发后再比较平台")
+
+
+def add_timeout_arguments(parser):
+    parser.add_argument('--connect-timeout', type=float, help='建立连接的超时（秒）')
+    parser.add_argument('--ttft-timeout', type=float, help='等待首token的超时（秒）')
+    parser.add_argument('--idle-timeout', type=float, help='相邻数据块之间的最长间隔（秒）')
+    parser.add_argument('--total-timeout', type=float, help='单个请求的总超时（秒），0表示不限制')
+    return parser
+
+
+def add_load_arguments(parser):
+    from calibrate import CALIBRATION_FILE
+    parser.add_argument('--providers', default='mock', help='平台名称，逗号分隔')
+    parser.add_argument('--concurrency', type=int, default=0, help='每个平台的并发数（闭环）')
+    parser.add_argument('--qps', type=float, default=0.0, help='每个平台的QPS（开环）')
+    parser.add_argument('--arrival', choices=['uniform', 'poisson'], default='uniform', help='开环模式的到达分布')
+    parser.add_argument('--duration', type=float, default=0.0, help='运行时长（秒）')
+    parser.add_argument('--requests', type=int, default=0, help='每个平台的请求总数')
+    parser.add_argument('--processes', type=int, default=1, help='worker进程数量')
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--prompt', default=DEFAULT_MESSAGES[0]['content'], help='测试消息')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    parser.add_argument('--pace', action='store_true', help='按配额控制请求节奏')
+    parser.add_argument('--rpm', type=float, default=0, help='每个平台每分钟请求数配额（配合--pace）')
+    parser.add_argument('--tpm', type=float, default=0, help='每个平台每分钟token数配额（配合--pace）')
+    parser.add_argument('--output', help='将合并后的直方图保存为JSON文件')
+    parser.add_argument('--dashboard', help='实时看板的数据接收地址（host:port）')
+    parser.add_argument('--flush-interval', type=float, default=60, help='输出中间结果的间隔（秒），0表示只在结束时输出')
+    add_timeout_arguments(parser)
+    parser.add_argument('--slo-ttft', type=float, default=DEFAULT_SLO['ttft'], help='goodput的首token目标（秒）')
+    parser.add_argument('--slo-itl', type=float, default=DEFAULT_SLO['itl'], help='goodput的平均token间隔目标（秒）')
+    parser.add_argument('--calibration', default=CALIBRATION_FILE, help='校准文件，存在时自动修正计时偏差')
+    parser.add_argument('--no-calibration', action='store_true', help='不修正计时偏差')
+    return parser
+
+
+def build_arg_parser():
+    parser = add_load_arguments(argparse.ArgumentParser(description='多进程API压测工具'))
+    parser.add_argument('--samples', help='将逐请求样本保存为.npz文件（sample_store.py格式）')
+    return parser
+
+
+def timeouts_from_args(args):
+    from config import config
+    timeouts = config.timeouts()
+    for phase in timeouts:
+        value = getattr(args, f'{phase}_timeout')
+        if value is not None:
+            timeouts[phase] = value
+    return timeouts
+
+
+def plan_from_args(args, providers):
+    from calibrate import load_calibration
+    return make_plan(
+        providers,
+        concurrency=args.concurrency,
+        qps=args.qps,
+        duration=args.duration,
+        requests=args.requests,
+        messages=[{"role": "user", "content": args.prompt}],
+        max_tokens=args.max_tokens,
+        arrival=args.arrival,
+        pace=args.pace,
+        dashboard=args.dashboard,
+        flush_interval=args.flush_interval,
+        timeouts=timeouts_from_args(args),
+        slo={'ttft': args.slo_ttft, 'itl': args.slo_itl},
+        keep_samples=bool(getattr(args, 'samples', None)),
+        corrections={} if args.no_calibration else load_calibration(args.calibration).get('stream_client'),
+        rate_limits={
+            provider['name'] if isinstance(provider, dict) else provider: {'rpm': args.rpm or None, 'tpm': args.tpm or None}
+            for provider in providers
+        }
+    )
+
+
+def save_stats(stats, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(stats.to_dict(), f, ensure_ascii=False)
+    print(f'\n直方图数据已保存到文件: {filename}')
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    providers = [resolve_provider(name.strip(), args.mock_url) for name in args.providers.split(',') if name.strip()]
+    plan = plan_from_args(args, providers)
+
+    print("===== API压测工具 =====")
+    print(f"平台: {', '.join(p['name'] for p in providers)}")
+    mode = f"QPS {plan['qps']}" if plan['qps'] else f"并发 {plan['concurrency']}"
+    print(f"模式: {mode}, worker进程: {args.processes}")
+    if plan['corrections']:
+        from calibrate import describe_corrections
+        print(f"计时修正（{args.calibration}）: {describe_corrections(plan['corrections'])}")
+    print()
+
+    stats = run_multiprocess(plan, args.processes, partial_reporter(args.output))
+    print_report(stats)
+
+    if args.output:
+        save_stats(stats, args.output)
+    if args.samples:
+        stats.samples.save(args.samples)
+        print(f'逐请求样本（{len(stats.samples)}个）已保存到文件: {args.samples}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+'''
+平台 × 模型 × 负载 矩阵测试
+
+功能说明：
+- 在一个JSON运行文件中声明要测试的平台（含API地址）、模型和负载
+- 自动展开为笛卡尔积矩阵，每个格子为“平台/模型/负载”的一组请求
+- 所有格子共享同一个并发预算和连接池，请求按轮次交错发起，
+  各格子在相同的时间段内采样，避免先后运行带来的时段偏差
+- 某个平台缺少API密钥或没有某个模型时跳过对应格子，不影响其他格子
+
+运行文件格式（参见 matrix.example.json）：
+{
+  "concurrency": 12,                        # 整个矩阵的并发预算
+  "timeouts": {"ttft": 60, "total": 300},   # 各阶段超时（秒），省略的阶段使用config.py中的默认值
+  "models": ["deepseek-r1", "deepseek-v3"], # 参与对比的模型（逻辑名称），省略时使用全部
+  "providers": {
+    "ark": {
+      "base_url": "https://ark.cn-beijing.volces.com/api/v3",  # 省略时使用config.py中的地址
+      "api_key_env": "ARK_API_KEY",                            # 省略时使用config.py中的密钥
+      "models": {"deepseek-r1": "deepseek-r1-250120"}          # 逻辑名称 -> 该平台的模型ID
+    }
+  },
+  "workloads": {
+    "short": {"prompt": "100.9和100.11谁大？", "max_tokens": 512, "requests": 5}
+  }
+}
+
+运行命令：
+python matrix.py matrix.example.json
+python matrix.py matrix.example.json --models deepseek-r1,deepseek-v3 --providers ark,aliyun --concurrency 8
+'''
+
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+from histogram import RunStats
+from loadgen import MOCK_BASE_URL, describe_errors, resolve_provider, save_stats
+from stream_client import ConnectionPool, stream_chat
+
+DEFAULT_REQUESTS = 5
+DEFAULT_CONCURRENCY = 8
+
+
+def load_run_file(filename):
+    with open(filename, encoding='utf-8') as f:
+        spec = json.load(f)
+    for key in ('providers', 'workloads'):
+        if not spec.get(key):
+            raise ValueError(f'运行文件缺少{key}配置: {filename}')
+    return spec
+
+
+def resolve_endpoint(name, spec, mock_url=MOCK_BASE_URL):
+    """按运行文件中的平台配置解析API地址和密钥"""
+    if name == 'mock':
+        return resolve_provider('mock', spec.get('base_url') or mock_url)
+    from config import PROVIDERS, config
+    if spec.get('api_key_env') or name not in PROVIDERS:
+        key_var = spec.get('api_key_env') or f'{name.upper()}_API_KEY'
+        api_key = config.getenv(key_var)
+        if not api_key:
+            raise ValueError(f'缺少必要的环境变量: {key_var}')
+        if not spec.get('base_url'):
+            raise ValueError(f'平台{name}未配置base_url')
+        return {'name': name, 'base_url': spec['base_url'], 'api_key': api_key, 'model': None}
+    provider = resolve_provider(name)
+    if spec.get('base_url'):
+        provider['base_url'] = spec['base_url']
+    return provider
+
+
+def expand_matrix(spec, providers=None, models=None, workloads=None, mock_url=MOCK_BASE_URL):
+    """展开为格子列表，返回(cells, skipped)；skipped为[(格子名称, 原因)]"""
+    provider_specs = {name: value for name, value in spec['providers'].items() if not providers or name in providers}
+    models = models or spec.get('models') or sorted({m for value in provider_specs.values() for m in value['models']})
+    workload_specs = {name: value for name, value in spec['workloads'].items() if not workloads or name in workloads}
+
+    cells = []
+    skipped = []
+    for name, provider_spec in provider_specs.items():
+        try:
+            endpoint = resolve_endpoint(name, provider_spec, mock_url)
+        except ValueError as e:
+            skipped.append((f'{name}/*', str(e)))
+            continue
+        for model in models:
+            model_id = provider_spec['models'].get(model)
+            if model_id is None:
+                skipped.append((f'{name}/{model}', '该平台未配置此模型'))
+                continue
+            for workload, workload_spec in workload_specs.items():
+                key = f'{name}/{model}/{workload}'
+                messages = workload_spec.get('messages') or [{"role": "user", "content": workload_spec['prompt']}]
+                cells.append({
+                    'key': key,
+                    'provider': name,
+                    'model': model,
+                    'workload': workload,
+                    # stream_chat按provider['name']记录样本，这里使用格子名称
+                    'endpoint': dict(endpoint, name=key, model=model_id),
+                    'messages': messages,
+                    'max_tokens': workload_spec.get('max_tokens', 512),
+                    'extra_body': workload_spec.get('extra_body'),
+                    'requests': workload_spec.get('requests', DEFAULT_REQUESTS)
+                })
+    return cells, skipped
+
+
+def interleave(cells):
+    """按轮次交错排列请求：每一轮每个格子发一个请求"""
+    jobs = []
+    for round_index in range(max((cell['requests'] for cell in cells), default=0)):
+        jobs += [cell for cell in cells if round_index < cell['requests']]
+    return jobs
+
+
+async def run_matrix(cells, concurrency, timeouts=None):
+    """在同一个并发预算下执行整个矩阵，返回按格子汇总的RunStats"""
+    pool = ConnectionPool()
+    stats = RunStats()
+    for cell in cells:
+        stats.get(cell['key'])
+    jobs = collections.deque(interleave(cells))
+    spans = {}
+    done = 0
+    total = len(jobs)
+
+    async def worker():
+        nonlocal done
+        while jobs:
+            cell = jobs.popleft()
+            start = time.perf_counter()
+            sample = await stream_chat(pool, cell['endpoint'], cell['messages'], cell['max_tokens'], cell['extra_body'],
+                                       timeouts=timeouts)
+            stats.record(sample)
+            first, _ = spans.get(cell['key'], (start, None))
+            spans[cell['key']] = (min(first, start), time.perf_counter())
+            done += 1
+            status = '成功' if sample['ok'] else f"失败({sample['error_type']})"
+            print(f"[{done}/{total}] {cell['key']}: {status}, 首token {sample['first_token_time']:.2f}秒")
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(min(concurrency, total) or 1)])
+    finally:
+        await pool.close()
+    for key, (first, last) in spans.items():
+        stats.get(key).duration = last - first
+    return stats
+
+
+def cell_rows(cells, stats):
+    rows = []
+    for cell in cells:
+        provider = stats.get(cell['key'])
+        ttft = provider.hists['first_token_time']
+        itl = provider.hists['itl']
+        total = provider.hists['total_time']
+        rows.append([
+            cell['provider'], cell['model'], cell['workload'],
+            f'{provider.ok}/{provider.requests}',
+            f'{provider.success_rate:.0%}',
+            ttft.percentile(50), ttft.percentile(95),
+            itl.percentile(50) * 1000,
+            total.percentile(50),
+            provider.output_tokens / provider.ok if provider.ok else 0,
+            provider.goodput
+        ])
+    return rows
+
+
+def comparison_rows(cells, stats, workload, models):
+    """某个负载下各平台不同模型的首token p50对比"""
+    table = {}
+    for cell in cells:
+        if cell['workload'] != workload:
+            continue
+        provider = stats.get(cell['key'])
+        value = provider.hists['first_token_time'].percentile(50) if provider.ok else None
+        table.setdefault(cell['provider'], {})[cell['model']] = value
+    return [[name] + [f'{values[m]:.2f}' if values.get(m) is not None else '-' for m in models]
+            for name, values in table.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='平台 × 模型 × 负载 矩阵测试')
+    parser.add_argument('run_file', help='JSON运行文件')
+    parser.add_argument('--providers', help='只测试这些平台，逗号分隔')
+    parser.add_argument('--models', help='只测试这些模型（逻辑名称），逗号分隔')
+    parser.add_argument('--workloads', help='只运行这些负载，逗号分隔')
+    parser.add_argument('--concurrency', type=int, help='并发预算，覆盖运行文件中的设置')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    parser.add_argument('--output', help='将各格子的直方图保存为JSON文件')
+    args = parser.parse_args()
+
+    def split(value):
+        return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+    spec = load_run_file(args.run_file)
+    cells, skipped = expand_matrix(spec, split(args.providers), split(args.models), split(args.workloads), args.mock_url)
+    concurrency = args.concurrency or spec.get('concurrency', DEFAULT_CONCURRENCY)
+
+    print("===== 矩阵测试 =====")
+    print(f"格子数: {len(cells)}, 请求总数: {sum(cell['requests'] for cell in cells)}, 并发预算: {concurrency}")
+    for key, reason in skipped:
+        print(f"- 跳过 {key}: {reason}")
+    if not cells:
+        print("没有可运行的格子")
+        return
+
+    stats = asyncio.run(run_matrix(cells, concurrency, spec.get('timeouts')))
+
+    from tabulate import tabulate
+
+    print("\n矩阵结果：")
+    print(tabulate(cell_rows(cells, stats),
+                   headers=['平台', '模型', '负载', '成功', '成功率', '首token p50(秒)', '首token p95(秒)',
+                            'token间隔 p50(毫秒)', '总耗时 p50(秒)', '平均输出token', 'goodput(token/s)'],
+                   tablefmt='grid', floatfmt=".2f"))
+
+    models = list(dict.fromkeys(cell['model'] for cell in cells))
+    for workload in dict.fromkeys(cell['workload'] for cell in cells):
+        print(f"\n负载 {workload} 的首token p50对比（秒）：")
+        print(tabulate(comparison_rows(cells, stats, workload, models), headers=['平台'] + models,
+                       tablefmt='grid', disable_numparse=True))
+
+    for cell in cells:
+        provider = stats.get(cell['key'])
+        if provider.errors:
+            print(f"- {cell['key']} 错误分布: {describe_errors(provider.errors)}")
+
+    if args.output:
+        save_stats(stats, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+'''
+本地模拟API服务器
+
+功能说明：
+- 提供OpenAI兼容的/v1/chat/completions接口（流式与非流式）
+- 按精确的时间表输出token：首token延迟 + 固定的token间隔
+- 第一个数据块只包含role，与真实平台行为一致
+- 请求带有tools时以delta.tool_calls流式返回对第一个工具的调用（参数JSON分片输出），
+  response_format为JSON模式时回答正文为分片输出的JSON对象
+- 提供/v1/embeddings接口，返回固定维度的向量（支持encoding_format为float或base64），
+  耗时为 ttft + itl × 批大小
+- 支持keep-alive，可用于压测工具自身的验证，无需消耗真实API额度
+
+运行命令：
+python mock_server.py --port 8000 --ttft 0.2 --itl 0.02 --tokens 100
+
+配置参数：
+⭐ --ttft：首个内容token的延迟（秒）
+⭐ --itl：相邻token之间的间隔（秒）
+⭐ --tokens：每个请求输出的token数量（请求中的max_tokens更小时以其为准）
+⭐ --jitter：token间隔的随机抖动比例（0表示严格按时间表输出）
+⭐ --slots：同时生成的最大请求数，超出的请求排队等待（0表示不限制），用于模拟平台容量
+⭐ --slow-ratio / --slow-ttft：按比例随机让部分请求的首token延迟变为slow-ttft，用于模拟长尾
+⭐ --rpm：每分钟请求数配额，超出时返回429和Retry-After，并在响应头中返回x-ratelimit-*（0表示不限制）
+⭐ --embedding-dim：/v1/embeddings返回的向量维度
+⭐ --trace：把每个请求在服务端的实际发送时刻（相对收到请求，秒）逐行写入JSON文件，作为calibrate.py的基准
+⭐ --prefill：每1000个未命中缓存的输入token增加的首token延迟（秒），用于模拟上下文增长的影响；
+  以消息为单位模拟前缀缓存，与之前请求相同的消息前缀计为命中缓存，在usage.prompt_tokens_details.cached_tokens中返回
+'''
+
+import argparse
+import array
+import asyncio
+import base64
+import collections
+import json
+import math
+import random
+import sys
+import time
+
+TOKEN_TEXT = '测试'
+# 前缀缓存最多保存的消息前缀数量
+PREFIX_CACHE_SIZE = 10000
+
+
+def float32_base64(values):
+    """小端float32字节的base64编码，与OpenAI接口encoding_format=base64的格式一致"""
+    data = array.array('f', values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return base64.b64encode(data.tobytes()).decode('ascii')
+
+
+class MockServer:
+    def __init__(self, ttft=0.2, itl=0.02, tokens=100, jitter=0.0, slots=0, rpm=0, slow_ratio=0.0, slow_ttft=0.0,
+                 prefill=0.0, embedding_dim=1024, trace=None):
+        self.ttft = ttft
+        self.trace = open(trace, 'a', encoding='utf-8') if trace else None
+        self.embedding_dim = embedding_dim
+        self._vector = [math.sin(i) for i in range(embedding_dim)]
+        self._vector_base64 = float32_base64(self._vector)
+        self.prefill = prefill
+        self._prefixes = collections.OrderedDict()
+        self.slow_ratio = slow_ratio
+        self.slow_ttft = slow_ttft
+        self.itl = itl
+        self.tokens = tokens
+        self.jitter = jitter
+        self.slots = asyncio.Semaphore(slots) if slots else None
+        self.rpm = rpm
+        self._recent = collections.deque()
+        self.requests = 0
+        self.server = None
+
+    def _chunk(self, request_id, model, delta, finish_reason=None, usage=None):
+        data = {
+            'id': request_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+        if usage is not None:
+            data['usage'] = usage
+        body = f'data: {json.dumps(data, ensure_ascii=False)}\n\n'.encode('utf-8')
+        # 使用chunked编码逐块发送
+        return f'{len(body):x}\r\n'.encode('latin-1') + body + b'\r\n'
+
+    def _schedule(self, index, ttft):
+        # 第index个token相对请求开始的计划时间
+        offset = ttft + index * self.itl
+        if self.jitter and index > 0:
+            offset += random.uniform(-self.jitter, self.jitter) * self.itl
+        return offset
+
+    def _rate_limit(self):
+        """滑动窗口配额检查，返回(是否放行, 限流响应头)"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 60:
+            self._recent.popleft()
+        allowed = len(self._recent) < self.rpm
+        if allowed:
+            self._recent.append(now)
+        reset = 60 - (now - self._recent[0]) if self._recent else 0.0
+        headers = (
+            f'x-ratelimit-limit-requests: {self.rpm}\r\n'
+            f'x-ratelimit-remaining-requests: {self.rpm - len(self._recent)}\r\n'
+            f'x-ratelimit-reset-requests: {reset:.3f}s\r\n'
+        )
+        if not allowed:
+            headers += f'Retry-After: {math.ceil(reset)}\r\n'
+        return allowed, headers.encode('latin-1')
+
+    def _output(self, request, count):
+        """返回(按时间表依次发送的delta列表, finish_reason, 非流式响应的message)"""
+        tools = request.get('tools')
+        if tools:
+            function = tools[0].get('function') or {}
+            required = (function.get('parameters') or {}).get('required') or []
+            arguments = json.dumps({name: TOKEN_TEXT for name in required}, ensure_ascii=False)
+            step = max(1, math.ceil(len(arguments) / max(1, count - 1)))
+            call = {'index': 0, 'id': f'call-{self.requests}', 'type': 'function',
+                    'function': {'name': function.get('name', ''), 'arguments': ''}}
+            deltas = [{'tool_calls': [call]}] + [
+                {'tool_calls': [{'index': 0, 'function': {'arguments': arguments[i:i + step]}}]}
+                for i in range(0, len(arguments), step)
+            ]
+            message = {'role': 'assistant', 'content': None,
+                       'tool_calls': [dict(call, function=dict(call['function'], arguments=arguments))]}
+            return deltas, 'tool_calls', message
+        if (request.get('response_format') or {}).get('type') in ('json_object', 'json_schema'):
+            text = json.dumps({'answer': TOKEN_TEXT * count}, ensure_ascii=False)
+            step = math.ceil(len(text) / count)
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        else:
+            text = TOKEN_TEXT * count
+            pieces = [TOKEN_TEXT] * count
+        return [{'content': piece} for piece in pieces], 'stop', {'role': 'assistant', 'content': text}
+
+    def _cached_tokens(self, messages):
+        """返回命中前缀缓存的输入token数（按UTF-8字节估算），并记录本次请求的所有消息前缀"""
+        cached = 0
+        hit = True
+        prefix = ''
+        for message in messages:
+            prefix += json.dumps(message, ensure_ascii=False, sort_keys=True)
+            if hit and prefix in self._prefixes:
+                cached += len(message.get('content', '').encode('utf-8'))
+                self._prefixes.move_to_end(prefix)
+            else:
+                hit = False
+                self._prefixes[prefix] = True
+        while len(self._prefixes) > PREFIX_CACHE_SIZE:
+            self._prefixes.popitem(last=False)
+        return cached
+
+    async def _sleep_until(self, loop, deadline):
+        delay = deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _trace(self, request_id, stream, tokens, received, marks):
+        """marks为各阶段写入完成时的perf_counter读数，记录为相对收到请求的秒数"""
+        if self.trace is None:
+            return
+        record = {'id': request_id, 'stream': stream, 'tokens': tokens}
+        record.update({name: moment - received for name, moment in marks.items()})
+        self.trace.write(json.dumps(record) + '\n')
+        self.trace.flush()
+
+    async def handle_chat(self, writer, request):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        received = time.perf_counter()
+        marks = {}
+        limit_headers = b''
+        if self.rpm:
+            allowed, limit_headers = self._rate_limit()
+            if not allowed:
+                message = b'{"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}}'
+                writer.write(
+                    b'HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\n' + limit_headers
+                    + f'Content-Length: {len(message)}\r\n\r\n'.encode('latin-1') + message
+                )
+                await writer.drain()
+                return
+        self.requests += 1
+        request_id = f'mock-{self.requests}'
+        model = request.get('model', 'mock-model')
+        count = min(self.tokens, request.get('max_tokens') or self.tokens)
+        ttft = self.slow_ttft if self.slow_ratio and random.random() < self.slow_ratio else self.ttft
+        prompt_tokens = sum(len(m.get('content', '').encode('utf-8')) for m in request.get('messages', []))
+        cached_tokens = self._cached_tokens(request.get('messages', []))
+        ttft += self.prefill * (prompt_tokens - cached_tokens) / 1000
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': count,
+            'total_tokens': prompt_tokens + count,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens}
+        }
+
+        deltas, finish_reason, message = self._output(request, count)
+
+        if not request.get('stream'):
+            await self._sleep_until(loop, start + self._schedule(len(deltas) - 1, ttft))
+            body = json.dumps({
+                'id': request_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': message,
+                    'finish_reason': finish_reason
+                }],
+                'usage': usage
+            }, ensure_ascii=False).encode('utf-8')
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n' + limit_headers
+                + f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+            )
+            await writer.drain()
+            now = time.perf_counter()
+            self._trace(request_id, False, len(deltas), received, {'headers': now, 'first': now, 'last': now, 'end': now})
+            return
+
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n' + limit_headers
+            + b'Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n'
+        )
+        writer.write(self._chunk(request_id, model, {'role': 'assistant', 'content': ''}))
+        await writer.drain()
+        marks['headers'] = time.perf_counter()
+        for index, delta in enumerate(deltas):
+            await self._sleep_until(loop, start + self._schedule(index, ttft))
+            writer.write(self._chunk(request_id, model, delta))
+            await writer.drain()
+            marks['last'] = time.perf_counter()
+            marks.setdefault('first', marks['last'])
+        writer.write(self._chunk(request_id, model, {}, finish_reason))
+        include_usage = (request.get('stream_options') or {}).get('include_usage')
+        if include_usage:
+            data = {'id': request_id, 'object': 'chat.completion.chunk', 'model': model, 'choices': [], 'usage': usage}
+            body = f'data: {json.dumps(data)}\n\n'.encode('utf-8')
+            writer.write(f'{len(body):x}\r\n'.encode('latin-1') + body + b'\r\n')
+        body = b'data: [DONE]\n\n'
+        writer.write(f'{len(body):x}\r\n'.encode('latin-1') + body + b'\r\n0\r\n\r\n')
+        await writer.drain()
+        marks['end'] = time.perf_counter()
+        self._trace(request_id, True, len(deltas), received, marks)
+
+    async def handle_embeddings(self, writer, request):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        inputs = request.get('input') or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await self._sleep_until(loop, start + self.ttft + self.itl * len(inputs))
+        embedding = self._vector_base64 if request.get('encoding_format') == 'base64' else self._vector
+        prompt_tokens = sum(len(text.encode('utf-8')) for text in inputs)
+        body = json.dumps({
+            'object': 'list',
+            'model': request.get('model', 'mock-embedding'),
+            'data': [{'object': 'embedding', 'index': index, 'embedding': embedding} for index in range(len(inputs))],
+            'usage': {'prompt_tokens': prompt_tokens, 'total_tokens': prompt_tokens}
+        }).encode('utf-8')
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+            + f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if method == 'POST' and path.rstrip('/').endswith('/chat/completions'):
+                    if self.slots is not None:
+                        # 排队等待生成槽位，排队时间计入首token延迟
+                        async with self.slots:
+                            await self.handle_chat(writer, json.loads(body or b'{}'))
+                    else:
+                        await self.handle_chat(writer, json.loads(body or b'{}'))
+                elif method == 'POST' and path.rstrip('/').endswith('/embeddings'):
+                    await self.handle_embeddings(writer, json.loads(body or b'{}'))
+                else:
+                    message = b'{"error": "not found"}'
+                    writer.write(
+                        b'HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n'
+                        + f'Content-Length: {len(message)}\r\n\r\n'.encode('latin-1') + message
+                    )
+                    await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8000):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='本地模拟API服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--ttft', type=float, default=0.2)
+    parser.add_argument('--itl', type=float, default=0.02)
+    parser.add_argument('--tokens', type=int, default=100)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--slots', type=int, default=0)
+    parser.add_argument('--rpm', type=int, default=0)
+    parser.add_argument('--slow-ratio', type=float, default=0.0)
+    parser.add_argument('--slow-ttft', type=float, default=0.0)
+    parser.add_argument('--prefill', type=float, default=0.0)
+    parser.add_argument('--embedding-dim', type=int, default=1024)
+    parser.add_argument('--trace', help='逐请求写入服务端实际发送时刻的JSON Lines文件')
+    args = parser.parse_args()
+
+    server = MockServer(args.ttft, args.itl, args.tokens, args.jitter, args.slots, args.rpm,
+                        args.slow_ratio, args.slow_ttft, args.prefill,
+                        args.embedding_dim, args.trace)
+    port = await server.start(args.host, args.port)
+    print(f"模拟API服务器已启动: http://{args.host}:{port}/v1")
+    print(f"首token延迟: {args.ttft}秒, token间隔: {args.itl}秒, 输出token数: {args.tokens}")
+    async with server.server:
+        await server.server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+'''
+网络劣化模拟代理
+
+功能说明：
+- 在压测工具与上游（mock_server.py或真实平台）之间转发HTTP/1.1流量，并按配置注入网络劣化：
+  附加RTT（两个方向各延迟一半，数据顺序不变）、随机抖动、下行带宽上限、
+  分包（每次写入拆成不超过--split字节的小段分别发送，SSE事件会被切断在任意位置）、
+  合包（下行数据攒--coalesce秒后一次发送，多个SSE事件落在同一个TCP段中）、随机连接重置（RST）
+- 新连接上的第一个请求额外延迟一个RTT，模拟TCP握手：压测客户端连接本地代理的connect_time接近0，
+  这一RTT会体现在网络延迟和首token中
+- 上游为https时由代理与上游建立TLS，并把请求中的Host头改写为上游主机，压测工具以http连接代理
+- 用途：验证首token、各阶段耗时和SSE解析在劣化网络下是否正确；在本地复现北京、法兰克福等测试机的链路条件，
+  区分“平台慢”和“链路慢”
+
+运行命令：
+python net_proxy.py --upstream http://127.0.0.1:8000 --port 9000 --rtt 0.1 --split 7
+python loadgen.py --providers mock --mock-url http://127.0.0.1:9000/v1 --concurrency 4 --requests 40
+python net_proxy.py --upstream https://api.deepseek.com --port 9001 --rtt 0.2 --bandwidth 64 --reset-ratio 0.05
+DEEPSEEK_BASE_URL=http://127.0.0.1:9001 python loadgen.py --providers deepseek --concurrency 2 --requests 20
+
+配置参数：
+⭐ --upstream：上游地址（http://或https://主机[:端口]）
+⭐ --rtt / --jitter：附加的往返时延和每个数据块的随机附加延迟上限（秒）
+⭐ --bandwidth：每个连接的下行带宽上限（KB/s），0表示不限制
+⭐ --split：分包大小（字节），0表示不拆分
+⭐ --coalesce：合包窗口（秒），0表示收到即转发
+⭐ --reset-ratio / --reset-after：按比例随机选中连接，在下行发送了0~reset-after字节之间的随机位置发送RST
+⭐ --seed：随机种子，便于复现
+'''
+
+import argparse
+import asyncio
+import collections
+import random
+import re
+import socket
+import ssl
+import struct
+import time
+from urllib.parse import urlsplit
+
+HEADER_END = b'\r\n\r\n'
+HOST_HEADER = re.compile(rb'^host:[^\r\n]*', re.IGNORECASE | re.MULTILINE)
+CONTENT_LENGTH = re.compile(rb'^content-length:\s*(\d+)', re.IGNORECASE | re.MULTILINE)
+
+
+def reset_connection(writer):
+    """以RST而不是FIN关闭连接（SO_LINGER超时为0）"""
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        except OSError:
+            pass
+    writer.transport.abort()
+
+
+class DelayedPipe:
+    """单方向的数据转发：按到达时刻加延迟的时间表发送，可限速、分包、合包和中途重置
+
+    put()放入的数据在到达时刻 + delay（+ 随机抖动）之后发送，发送时刻单调不减，数据顺序不变。
+    """
+
+    def __init__(self, writer, delay=0.0, jitter=0.0, bandwidth=0, split=0, coalesce=0.0, reset_at=None, rng=None):
+        self.writer = writer
+        self.delay = delay
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.split = split
+        self.coalesce = coalesce
+        self.reset_at = reset_at
+        self.rng = rng or random.Random()
+        self.pending = collections.deque()
+        self.arrived = asyncio.Event()
+        self.last_due = 0.0
+        self.free_at = 0.0
+        self.sent = 0
+        self.reset = False
+
+    def put(self, data, extra_delay=0.0):
+        """data为None表示对端已关闭"""
+        due = time.perf_counter() + self.delay + extra_delay
+        if self.jitter:
+            due += self.rng.uniform(0, self.jitter)
+        self.last_due = max(self.last_due, due)
+        self.pending.append((self.last_due, data))
+        self.arrived.set()
+
+    async def _wait_until(self, moment):
+        delay = moment - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, data):
+        pieces = [data[i:i + self.split] for i in range(0, len(data), self.split)] if self.split else [data]
+        for piece in pieces:
+            if self.reset_at is not None and self.sent + len(piece) >= self.reset_at:
+                self.writer.write(piece[:self.reset_at - self.sent])
+                await self.writer.drain()
+                reset_connection(self.writer)
+                self.reset = True
+                return False
+            if self.bandwidth:
+                await self._wait_until(self.free_at)
+                self.free_at = max(time.perf_counter(), self.free_at) + len(piece) / self.bandwidth
+            self.writer.write(piece)
+            await self.writer.drain()
+            self.sent += len(piece)
+        return True
+
+    async def _next(self):
+        while not self.pending:
+            self.arrived.clear()
+            await self.arrived.wait()
+        return self.pending.popleft()
+
+    async def run(self):
+        """发送直到收到None或连接被重置；返回是否发送了RST"""
+        closed = False
+        while not closed:
+            due, data = await self._next()
+            await self._wait_until(due)
+            if data is None:
+                break
+            chunks = [data]
+            if self.coalesce:
+                # 合包：窗口内到期的数据拼成一次写入
+                await self._wait_until(due + self.coalesce)
+                while self.pending and self.pending[0][0] <= time.perf_counter():
+                    _, next_data = self.pending.popleft()
+                    if next_data is None:
+                        closed = True
+                        break
+                    chunks.append(next_data)
+            if not await self._send(b''.join(chunks)):
+                break
+        if not self.reset:
+            self.writer.close()
+        return self.reset
+
+
+class NetworkProxy:
+    def __init__(self, upstream, rtt=0.0, jitter=0.0, bandwidth=0.0, split=0, coalesce=0.0,
+                 reset_ratio=0.0, reset_after=4096, seed=None):
+        parts = urlsplit(upstream)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'上游地址必须为http://或https://开头: {upstream}')
+        self.tls = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.tls else 80)
+        self.host_header = b'Host: ' + parts.netloc.encode('idna')
+        self.rtt = rtt
+        self.jitter = jitter
+        # 带宽参数单位为KB/s，内部使用字节/秒
+        self.bandwidth = bandwidth * 1024
+        self.split = split
+        self.coalesce = coalesce
+        self.reset_ratio = reset_ratio
+        self.reset_after = reset_after
+        self.rng = random.Random(seed)
+        self.server = None
+        self.stats = {'connections': 0, 'active': 0, 'resets': 0, 'upstream_errors': 0, 'bytes_up': 0, 'bytes_down': 0}
+
+    def _rewrite(self, head):
+        """把请求头中的Host改写为上游主机"""
+        if HOST_HEADER.search(head):
+            return HOST_HEADER.sub(self.host_header, head, count=1)
+        line_end = head.index(b'\r\n')
+        return head[:line_end + 2] + self.host_header + b'\r\n' + head[line_end + 2:]
+
+    async def _forward_requests(self, reader, pipe):
+        """读取客户端的请求，改写Host后按完整请求交给上行方向；没有Content-Length时退化为原样转发"""
+        buffer = b''
+        first = True
+        passthrough = False
+        while True:
+            try:
+                data = await reader.read(65536)
+            except ConnectionError:
+                break
+            if not data:
+                break
+            if passthrough:
+                pipe.put(data)
+                continue
+            buffer += data
+            while True:
+                end = buffer.find(HEADER_END)
+                if end < 0:
+                    break
+                head = buffer[:end + len(HEADER_END)]
+                match = CONTENT_LENGTH.search(head)
+                if match is None and not head.startswith((b'GET ', b'HEAD ', b'DELETE ')):
+                    pipe.put(self._rewrite(head) + buffer[len(head):], self.rtt if first else 0.0)
+                    buffer = b''
+                    passthrough = True
+                    break
+                length = int(match.group(1)) if match else 0
+                if len(buffer) < len(head) + length:
+                    break
+                # 新连接上的第一个请求额外延迟一个RTT，模拟TCP握手
+                pipe.put(self._rewrite(head) + buffer[len(head):len(head) + length], self.rtt if first else 0.0)
+                buffer = buffer[len(head) + length:]
+                first = False
+            self.stats['bytes_up'] += len(data)
+        pipe.put(None)
+
+    async def _forward_responses(self, reader, pipe):
+        while True:
+            try:
+                data = await reader.read(65536)
+            except ConnectionError:
+                break
+            if not data:
+                break
+            self.stats['bytes_down'] += len(data)
+            pipe.put(data)
+        pipe.put(None)
+
+    async def handle_connection(self, client_reader, client_writer):
+        self.stats['connections'] += 1
+        self.stats['active'] += 1
+        try:
+            context = ssl.create_default_context() if self.tls else None
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                self.host, self.port, ssl=context, server_hostname=self.host if self.tls else None)
+        except (OSError, ssl.SSLError) as e:
+            self.stats['upstream_errors'] += 1
+            self.stats['active'] -= 1
+            print(f"连接上游失败: {e.__class__.__name__}: {e}")
+            reset_connection(client_writer)
+            return
+        for writer in (client_writer, upstream_writer):
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        reset_at = None
+        if self.reset_ratio and self.rng.random() < self.reset_ratio:
+            reset_at = self.rng.randint(0, self.reset_after)
+        up = DelayedPipe(upstream_writer, self.rtt / 2, rng=self.rng)
+        down = DelayedPipe(client_writer, self.rtt / 2, self.jitter, self.bandwidth, self.split, self.coalesce,
+                           reset_at, self.rng)
+        tasks = [
+            asyncio.ensure_future(self._forward_requests(client_reader, up)),
+            asyncio.ensure_future(self._forward_responses(upstream_reader, down)),
+            asyncio.ensure_future(up.run())
+        ]
+        try:
+            if await down.run():
+                self.stats['resets'] += 1
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            upstream_writer.transport.abort()
+            client_writer.transport.abort()
+            self.stats['active'] -= 1
+
+    async def start(self, host='127.0.0.1', port=9000):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def describe(self):
+        items = [f'附加RTT {self.rtt * 1000:g}毫秒']
+        if self.jitter:
+            items.append(f'抖动≤{self.jitter * 1000:g}毫秒')
+        if self.bandwidth:
+            items.append(f'下行带宽{self.bandwidth / 1024:g}KB/s')
+        if self.split:
+            items.append(f'分包{self.split}字节')
+        if self.coalesce:
+            items.append(f'合包窗口{self.coalesce * 1000:g}毫秒')
+        if self.reset_ratio:
+            items.append(f'重置比例{self.reset_ratio:.0%}（前{self.reset_after}字节内）')
+        return '，'.join(items)
+
+
+async def report_loop(proxy, interval):
+    while True:
+        await asyncio.sleep(interval)
+        stats = proxy.stats
+        print(f"连接 {stats['connections']}（活动 {stats['active']}），重置 {stats['resets']}，"
+              f"上游连接失败 {stats['upstream_errors']}，上行 {stats['bytes_up'] / 1024:.1f}KB，"
+              f"下行 {stats['bytes_down'] / 1024:.1f}KB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='网络劣化模拟代理')
+    parser.add_argument('--upstream', default='http://127.0.0.1:8000', help='上游地址，如 http://127.0.0.1:8000')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--rtt', type=float, default=0.0, help='附加的往返时延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='下行每个数据块的随机附加延迟上限（秒）')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='每个连接的下行带宽上限（KB/s）')
+    parser.add_argument('--split', type=int, default=0, help='分包大小（字节）')
+    parser.add_argument('--coalesce', type=float, default=0.0, help='合包窗口（秒）')
+    parser.add_argument('--reset-ratio', type=float, default=0.0, help='被重置的连接比例')
+    parser.add_argument('--reset-after', type=int, default=4096, help='重置发生在下行的前多少字节内')
+    parser.add_argument('--seed', type=int, help='随机种子')
+    parser.add_argument('--report-interval', type=float, default=10, help='输出统计的间隔（秒），0表示不输出')
+    args = parser.parse_args()
+
+    proxy = NetworkProxy(args.upstream, args.rtt, args.jitter, args.bandwidth, args.split, args.coalesce,
+                         args.reset_ratio, args.reset_after, args.seed)
+    port = await proxy.start(args.host, args.port)
+    print(f"网络劣化代理已启动: http://{args.host}:{port} -> {args.upstream}")
+    print(proxy.describe())
+    if args.report_interval:
+        asyncio.ensure_future(report_loop(proxy, args.report_interval))
+    async with proxy.server:
+        await proxy.server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
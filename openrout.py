@@ -24,7 +24,8 @@ import os
 import json
 import requests
 from dotenv import load_dotenv
-from tabulate import tabulate
+from config import config
+from stream_client import EmptyResponseError, HTTPStatusError, check_deadlines, classify_error
 
 # 加载环境变量
 load_dotenv()
@@ -34,6 +35,9 @@ api_key = os.getenv('OPENAI_API_KEY')
 base_url = os.getenv('OPENAI_BASE_URL')
 model_id = os.getenv('OPENAI_MODEL_ID')
 
+# 各阶段超时（秒），默认值见config.py中的TIMEOUTS，可用STREAM_*_TIMEOUT环境变量覆盖
+timeouts = config.timeouts()
+
 # 打印配置信息
 print(f"使用API地址: {base_url}")
 print(f"使用模型: {model_id}")
@@ -65,6 +69,7 @@ def write_stream_content(text):
 
 # 生成性能统计表格
 def generate_performance_table(metrics):
+    from tabulate import tabulate
     headers = ['指标', '数值', '单位']
     rows = [
         ['网络延迟', f"{metrics['network_latency']:.2f}", '秒'],
@@ -76,6 +81,7 @@ def generate_performance_table(metrics):
 
 # 生成Token统计表格
 def generate_token_table(metrics):
+    from tabulate import tabulate
     headers = ['Token类型', '数量', '备注']
     rows = [
         ['输入Token', metrics['input_tokens'], '-'],
@@ -124,33 +130,37 @@ try:
     print(f"请求URL: {url}")
     print(f"请求模型: {model_id}")
     
-    # 记录开始时间
-    start_time = time.time()
+    # 记录开始时间（perf_counter为单调高精度时钟，不受系统时间调整影响）
+    start_time = time.perf_counter()
     first_token_time = None
     network_latency = None
     content = ""
+    last_chunk_time = None
+    response = None
     
     # 发送流式请求
-    response = requests.post(url, json=payload, headers=headers, stream=True)
+    # 连接超时和读取超时；读取超时同时限制等待响应头和相邻数据之间的间隔，且不超过总超时
+    read_timeout = max(timeouts['ttft'], timeouts['idle'])
+    if timeouts['total']:
+        read_timeout = min(read_timeout or timeouts['total'], timeouts['total'])
+    response = requests.post(url, json=payload, headers=headers, stream=True,
+                             timeout=(timeouts['connect'] or None, read_timeout or None))
     
     # 获取首次网络连接时间
-    network_latency = time.time() - start_time
+    network_latency = time.perf_counter() - start_time
     print(f"\n网络延迟: {network_latency:.2f}秒")
     
     # 检查响应状态
     if response.status_code != 200:
-        raise Exception(f"API请求失败: HTTP {response.status_code} - {response.text}")
+        raise HTTPStatusError(response.status_code, response.headers, response.text)
     
     print("\n🔍 开始接收响应流：")
     
     # 处理流式响应
     for line in response.iter_lines():
+        check_deadlines(timeouts, start_time, first_token_time, last_chunk_time)
+        last_chunk_time = time.perf_counter()
         if line:
-            # 记录首个token的时间
-            if first_token_time is None:
-                first_token_time = time.time()
-                print("\n首个token响应时间：{:.2f}秒".format(first_token_time - start_time))
-            
             # 解析SSE格式的数据
             line_text = line.decode('utf-8')
             if line_text.startswith('data: '):
@@ -161,16 +171,23 @@ try:
                 try:
                     delta = json.loads(json_str)
                     if 'choices' in delta and len(delta['choices']) > 0:
+                        message = delta['choices'][0].get('delta') or {}
+                        # 记录首个token的时间：第一个数据块通常只包含role，与SSE注释、空行一样不计为首token
+                        if first_token_time is None and (message.get('reasoning_content') or message.get('content')):
+                            first_token_time = last_chunk_time
+                            print("\n首个token响应时间：{:.2f}秒".format(first_token_time - start_time))
                         if 'delta' in delta['choices'][0] and 'content' in delta['choices'][0]['delta']:
-                            chunk = delta['choices'][0]['delta']['content']
+                            chunk = delta['choices'][0]['delta']['content'] or ''
                             content += chunk
                             write_stream_content(chunk)
                 except json.JSONDecodeError:
                     continue
     
     # 计算结束时间和总耗时
-    end_time = time.time()
+    end_time = time.perf_counter()
     total_time = end_time - start_time
+    if first_token_time is None:
+        raise EmptyResponseError('响应流中没有任何输出内容')
     
     # 计算实际输出耗时（总时间 - 首个token时间）
     output_time = total_time - (first_token_time - start_time)
@@ -196,13 +213,20 @@ try:
 
 except Exception as e:
     print("\n❌ 发生错误：{}".format(str(e)))
+    # 错误分类，run_tests.py据此识别失败的样本，不再按补零后的数值参与排名
+    print("错误类型：{}".format(classify_error(e, 'connect' if network_latency is None else 'stream')))
+    
+    # 超时或出错时立即关闭连接，不再等待剩余的响应
+    if response is not None:
+        response.close()
     
     # 即使发生错误也计算已获得的指标
-    end_time = time.time()
+    end_time = time.perf_counter()
     if network_latency is not None:
         metrics['network_latency'] = network_latency
     if first_token_time is not None:
         metrics['first_token_time'] = first_token_time - start_time
+        metrics['output_time'] = end_time - first_token_time
     metrics['total_time'] = end_time - start_time
     
     # 计算已获得的token数据
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+'''
+平台价格表与成本-性能报告
+
+功能说明：
+- 内置各平台各模型的参考价格（每百万token）：输入、输出、缓存命中的输入
+- 价格可在本地的JSON文件中覆盖或补充（格式见 pricing.example.json），无需修改代码
+- 读取 loadgen.py / matrix.py 用 --output 保存的统计数据，按平台返回的真实token用量(usage)计算成本
+- 每个平台给出每百万输出token的成本（含输入成本）、单次请求成本，
+  与p50/p95延迟、持续输出token/s并列展示
+- 计算成本与延迟的帕累托前沿：不存在另一个平台同时更便宜且更快
+
+运行命令：
+python pricing.py stats.json
+python pricing.py stats.json --pricing my_prices.json --latency total_p95
+
+配置参数：
+⭐ --pricing：本地价格文件，省略时读取当前目录下的pricing.json（存在时）
+⭐ --latency：帕累托前沿使用的延迟指标（ttft_p50、ttft_p95、total_p50、total_p95）
+⭐ --usd-cny：美元价格折算人民币的汇率，覆盖价格文件中的设置
+
+注意：内置价格为编写时各平台官网公布的标准价格，不含优惠和免费额度，请以各平台最新价格为准
+'''
+
+import argparse
+import json
+import os
+
+from histogram import RunStats
+
+DEFAULT_PRICING_FILE = 'pricing.json'
+
+# 美元价格折算人民币的默认汇率
+USD_CNY = 7.2
+
+# 各平台各模型的价格（每百万token），键与config.py中的平台名称和模型ID一致
+# cache_hit省略时按输入价格计费；currency省略时为人民币(CNY)
+PRICES = {
+    'ark': {
+        'deepseek-r1-250120': {'input': 4.0, 'output': 16.0},
+        'deepseek-v3-241226': {'input': 2.0, 'output': 8.0}
+    },
+    'aliyun': {
+        'deepseek-r1': {'input': 4.0, 'output': 16.0},
+        'deepseek-v3': {'input': 2.0, 'output': 8.0}
+    },
+    'tencent': {
+        'deepseek-r1': {'input': 4.0, 'output': 16.0},
+        'deepseek-v3': {'input': 2.0, 'output': 8.0}
+    },
+    'siliconflow': {
+        'deepseek-ai/DeepSeek-R1': {'input': 4.0, 'output': 16.0},
+        'deepseek-ai/DeepSeek-V3': {'input': 2.0, 'output': 8.0}
+    },
+    'openrouter': {
+        'deepseek/deepseek-r1': {'input': 0.55, 'output': 2.19, 'currency': 'USD'},
+        'deepseek/deepseek-chat': {'input': 0.27, 'output': 1.10, 'currency': 'USD'}
+    },
+    'deepseek': {
+        'deepseek-reasoner': {'input': 4.0, 'cache_hit': 1.0, 'output': 16.0},
+        'deepseek-chat': {'input': 2.0, 'cache_hit': 0.5, 'output': 8.0}
+    }
+}
+
+# 帕累托前沿可选的延迟指标：(直方图名称, 百分位)
+LATENCY_METRICS = {
+    'ttft_p50': ('first_token_time', 50),
+    'ttft_p95': ('first_token_time', 95),
+    'total_p50': ('total_time', 50),
+    'total_p95': ('total_time', 95)
+}
+
+
+def load_prices(filename=None):
+    """返回(价格表, 汇率)；本地价格文件中的条目按平台、模型逐项覆盖内置价格"""
+    prices = {provider: dict(models) for provider, models in PRICES.items()}
+    usd_cny = USD_CNY
+    if filename is None and os.path.exists(DEFAULT_PRICING_FILE):
+        filename = DEFAULT_PRICING_FILE
+    if filename:
+        with open(filename, encoding='utf-8') as f:
+            local = json.load(f)
+        usd_cny = local.get('usd_cny', usd_cny)
+        for provider, models in local.get('prices', {}).items():
+            prices.setdefault(provider, {}).update(models)
+    return prices, usd_cny
+
+
+def price_for(prices, name, model):
+    """按统计中的名称查找价格；矩阵测试的名称为“平台/模型/负载”，取第一段作为平台"""
+    provider = name.split('/')[0]
+    models = prices.get(provider, {})
+    return models.get(model) or models.get('*')
+
+
+def request_cost(stats, price, usd_cny=USD_CNY):
+    """按真实token用量计算的总成本（元）；未命中缓存的输入按输入价格，命中缓存的按缓存价格"""
+    cache_hit = price.get('cache_hit', price['input'])
+    uncached = max(0, stats.input_tokens - stats.cached_tokens)
+    cost = (uncached * price['input'] + stats.cached_tokens * cache_hit + stats.output_tokens * price['output']) / 1e6
+    return cost * usd_cny if price.get('currency', 'CNY') == 'USD' else cost
+
+
+def cost_points(run, prices, usd_cny=USD_CNY, latency='ttft_p50'):
+    """返回每个平台的成本与性能数据；没有成功请求或缺少价格的平台cost为None"""
+    hist_name, p = LATENCY_METRICS[latency]
+    points = []
+    for name, stats in run.providers.items():
+        price = price_for(prices, name, stats.model)
+        cost = request_cost(stats, price, usd_cny) if price and stats.ok else None
+        points.append({
+            'name': name,
+            'model': stats.model,
+            'price': price,
+            'cost_per_m_output': cost / stats.output_tokens * 1e6 if cost is not None and stats.output_tokens else None,
+            'cost_per_request': cost / stats.ok if cost is not None else None,
+            'latency': stats.hists[hist_name].percentile(p) if stats.ok else None,
+            'stats': stats
+        })
+    return points
+
+
+def pareto_frontier(points):
+    """成本和延迟都越低越好；返回不被任何其他平台支配的点，按成本升序"""
+    candidates = [point for point in points if point['cost_per_m_output'] is not None and point['latency'] is not None]
+    frontier = []
+    for point in candidates:
+        dominated = any(
+            other['cost_per_m_output'] <= point['cost_per_m_output'] and other['latency'] <= point['latency']
+            and (other['cost_per_m_output'] < point['cost_per_m_output'] or other['latency'] < point['latency'])
+            for other in candidates
+        )
+        if not dominated:
+            frontier.append(point)
+    return sorted(frontier, key=lambda point: point['cost_per_m_output'])
+
+
+def _money(value, digits=2):
+    return f'{value:.{digits}f}' if value is not None else '-'
+
+
+def cost_rows(points, frontier):
+    on_frontier = {point['name'] for point in frontier}
+    rows = []
+    for point in points:
+        stats = point['stats']
+        price = point['price']
+        ttft = stats.hists['first_token_time']
+        total = stats.hists['total_time']
+        unit = '$' if price and price.get('currency') == 'USD' else '¥'
+        rows.append([
+            point['name'],
+            point['model'] or '-',
+            f"{unit}{price['input']:g}/{unit}{price.get('cache_hit', price['input']):g}/{unit}{price['output']:g}"
+            if price else '未配置价格',
+            _money(point['cost_per_m_output']),
+            _money(point['cost_per_request'], 4),
+            f'{ttft.percentile(50):.2f}/{ttft.percentile(95):.2f}' if stats.ok else '-',
+            f'{total.percentile(50):.2f}/{total.percentile(95):.2f}' if stats.ok else '-',
+            f'{stats.output_tokens / stats.duration:.1f}' if stats.duration else '-',
+            f'{stats.usage_reported}/{stats.ok}',
+            '★' if point['name'] in on_frontier else ''
+        ])
+    return rows
+
+
+COST_HEADERS = [
+    '平台', '模型', '单价(输入/缓存命中/输出，每百万token)', '每百万输出token成本(元)', '单次请求成本(元)',
+    '首token p50/p95(秒)', '总耗时 p50/p95(秒)', '持续输出token/s', '真实usage样本', '帕累托前沿'
+]
+
+
+def print_cost_report(run, prices, usd_cny=USD_CNY, latency='ttft_p50'):
+    from tabulate import tabulate
+
+    points = cost_points(run, prices, usd_cny, latency)
+    frontier = pareto_frontier(points)
+    print("\n成本-性能对比：")
+    print(tabulate(cost_rows(points, frontier), headers=COST_HEADERS, tablefmt='grid', disable_numparse=True))
+    print(f"\n帕累托前沿（每百万输出token成本 vs {latency}，按成本升序）：")
+    if not frontier:
+        print("- 没有同时具备价格和成功样本的平台")
+    for point in frontier:
+        print(f"- {point['name']}: ¥{point['cost_per_m_output']:.2f}/百万输出token, {latency} {point['latency']:.2f}秒")
+    print(f"\n说明：成本按平台返回的usage计算（含输入成本），美元价格按汇率{usd_cny}折算；"
+          f"“真实usage样本”少于成功数时，其余样本的token数为按字节估算")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='平台成本-性能报告')
+    parser.add_argument('stats_file', help='loadgen.py或matrix.py用--output保存的统计数据')
+    parser.add_argument('--pricing', help=f'本地价格文件，省略时读取{DEFAULT_PRICING_FILE}（存在时）')
+    parser.add_argument('--latency', choices=list(LATENCY_METRICS), default='ttft_p50', help='帕累托前沿使用的延迟指标')
+    parser.add_argument('--usd-cny', type=float, help='美元折算人民币的汇率')
+    args = parser.parse_args()
+
+    with open(args.stats_file, encoding='utf-8') as f:
+        run = RunStats.from_dict(json.load(f))
+    prices, usd_cny = load_prices(args.pricing)
+    print_cost_report(run, prices, args.usd_cny or usd_cny, args.latency)
+
+
+if __name__ == '__main__':
+    main()
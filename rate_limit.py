@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+'''
+限流感知的请求节奏控制
+
+功能说明：
+- 解析HTTP 429响应、Retry-After以及x-ratelimit-*系列响应头
+- 每个平台维护请求数和token数两个令牌桶，压测按令牌桶节奏发起请求
+- 根据响应头实时校准剩余额度，尽量贴近配额运行而不触发限流
+- 收到429时暂停该平台的所有请求直到Retry-After指定的时刻
+- 限流等待时间单独统计，不计入请求延迟
+
+支持的响应头：
+- Retry-After（秒数或HTTP日期）、retry-after-ms
+- x-ratelimit-limit-requests / x-ratelimit-remaining-requests / x-ratelimit-reset-requests
+- x-ratelimit-limit-tokens / x-ratelimit-remaining-tokens / x-ratelimit-reset-tokens
+- x-ratelimit-limit / x-ratelimit-remaining / x-ratelimit-reset（视为请求数额度）
+'''
+
+import asyncio
+import re
+import time
+
+RATE_LIMIT_HEADERS = ('retry-after', 'retry-after-ms')
+
+_DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def is_rate_limit_header(name):
+    return name in RATE_LIMIT_HEADERS or name.startswith('x-ratelimit-')
+
+
+def parse_duration(value):
+    """解析'1s'、'6m0s'、'20ms'或纯数字（秒）格式的时长"""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+        # 部分平台返回的是重置时刻的Unix时间戳
+        if seconds > 1e9:
+            return max(0.0, seconds - time.time())
+        return seconds
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers):
+    """返回需要等待的秒数，没有相关响应头时返回None"""
+    if 'retry-after-ms' in headers:
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rate_limit_headers(headers):
+    """解析为 {'requests': {...}, 'tokens': {...}}，每项包含limit、remaining、reset"""
+    quotas = {}
+    for kind in ('requests', 'tokens'):
+        quota = {
+            'limit': _int(headers.get(f'x-ratelimit-limit-{kind}')),
+            'remaining': _int(headers.get(f'x-ratelimit-remaining-{kind}')),
+            'reset': parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+        }
+        if kind == 'requests' and quota['limit'] is None:
+            quota = {
+                'limit': _int(headers.get('x-ratelimit-limit')),
+                'remaining': _int(headers.get('x-ratelimit-remaining')),
+                'reset': parse_duration(headers.get('x-ratelimit-reset'))
+            }
+        if any(value is not None for value in quota.values()):
+            quotas[kind] = quota
+    return quotas
+
+
+class TokenBucket:
+    """异步令牌桶；rate为None表示额度未知（不限速）"""
+
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity or 0.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def configure(self, limit, window):
+        """按“每window秒limit个”的配额设置速率和容量"""
+        now = time.monotonic()
+        self._refill(now)
+        first = self.rate is None
+        self.rate = limit / window
+        self.capacity = float(limit)
+        if first:
+            self.tokens = self.capacity
+        self.tokens = min(self.tokens, self.capacity)
+
+    def sync(self, remaining):
+        """用服务端返回的剩余额度校准本地估计（只向下校准，避免超发）"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, float(remaining))
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def consume(self, amount):
+        self._refill(time.monotonic())
+        self.tokens -= amount
+
+    def refund(self, amount):
+        """归还预扣的令牌，桶中令牌不超过容量"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    async def acquire(self, amount=1):
+        """等待直到桶中有足够的令牌，返回等待的秒数"""
+        start = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.rate is None:
+                break
+            self._refill(now)
+            # 单个请求超过容量时，等桶满即放行，避免永久等待
+            needed = min(amount, self.capacity)
+            if self.tokens >= needed:
+                self.tokens -= amount
+                break
+            await asyncio.sleep((needed - self.tokens) / self.rate)
+        return time.monotonic() - start
+
+
+class ProviderRateLimiter:
+    """单个平台的请求数/token数双令牌桶
+
+    share为本进程分得的配额比例：多进程压测时每个worker只使用1/P的额度。
+    """
+
+    def __init__(self, rpm=None, tpm=None, window=60.0, backoff=1.0, share=1.0):
+        self.window = window
+        self.backoff = backoff
+        self.share = share
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        if rpm:
+            self.requests.configure(rpm * share, window)
+        if tpm:
+            self.tokens.configure(tpm * share, window)
+        self.throttled = 0
+        self._consecutive = 0
+
+    async def acquire(self, estimated_tokens):
+        """发起请求前调用，返回因节奏控制等待的秒数"""
+        waited = await self.requests.acquire(1)
+        waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def observe(self, status, headers, estimated_tokens=0, actual_tokens=None):
+        """根据响应状态和响应头更新令牌桶"""
+        for kind, bucket in (('requests', self.requests), ('tokens', self.tokens)):
+            quota = parse_rate_limit_headers(headers).get(kind)
+            if not quota:
+                continue
+            if quota['limit'] and (bucket.rate is None or bucket.capacity != quota['limit'] * self.share):
+                bucket.configure(quota['limit'] * self.share, self.window)
+            if quota['remaining'] is not None and bucket.rate is not None:
+                bucket.sync(quota['remaining'] * self.share)
+
+        if status == 429:
+            self.throttled += 1
+            self._consecutive += 1
+            retry_after = parse_retry_after(headers)
+            if retry_after is None:
+                # 没有Retry-After时指数退避
+                retry_after = self.backoff * (2 ** min(self._consecutive - 1, 6))
+            self.requests.pause(retry_after)
+            self.tokens.pause(retry_after)
+            # 被限流的请求不消耗token额度，归还预扣的部分
+            if self.tokens.rate is not None:
+                self.tokens.refund(estimated_tokens)
+        else:
+            self._consecutive = 0
+            if actual_tokens is not None and self.tokens.rate is not None:
+                # 按实际用量修正预扣的token数
+                self.tokens.consume(actual_tokens - estimated_tokens)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+'''
+压测客户端资源监控
+
+功能说明：
+- 记录压测进程自身的资源占用：CPU时间、峰值内存(RSS)、GC次数与停顿时间、打开的socket数量
+- 在事件循环中按固定周期采样定时器延迟（事件循环滞后），衡量客户端是否来得及处理响应
+- 事件循环滞后或CPU占满超过阈值时，将本次运行标记为“客户端受限”，
+  此时测得的延迟包含客户端自身的排队时间，不应归咎于平台
+- 多进程/分布式压测时各进程的统计可以合并
+
+判定规则（默认阈值）：
+- 事件循环滞后p99超过50毫秒
+- 或超过20%的采样周期内进程CPU占用达到单核的90%以上（单个事件循环只能使用一个核）
+'''
+
+import asyncio
+import gc
+import os
+import sys
+import time
+
+from histogram import LatencyHistogram
+
+# 默认采样周期（秒）
+SAMPLE_INTERVAL = 0.1
+# 每隔多少个采样周期统计一次socket数量
+SOCKET_SAMPLE_EVERY = 10
+
+LAG_THRESHOLD = 0.05
+CPU_THRESHOLD = 0.9
+SATURATED_FRACTION = 0.2
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """当前RSS（MB），仅Linux可读取当前值，其他系统返回峰值RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_mb()
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def open_sockets():
+    """统计当前进程打开的socket数量（仅Linux，其他系统返回0）"""
+    try:
+        fds = os.listdir('/proc/self/fd')
+    except OSError:
+        return 0
+    count = 0
+    for fd in fds:
+        try:
+            if os.readlink(f'/proc/self/fd/{fd}').startswith('socket:'):
+                count += 1
+        except OSError:
+            continue
+    return count
+
+
+class ResourceUsage:
+    """一个或多个压测进程的资源统计，可合并"""
+
+    def __init__(self):
+        self.processes = 0
+        self.wall = 0.0
+        self.cpu_time = 0.0
+        self.peak_rss_mb = 0.0
+        self.total_rss_mb = 0.0
+        self.gc_collections = [0, 0, 0]
+        self.gc_pause_total = 0.0
+        self.gc_pause_max = 0.0
+        self.sockets_peak = 0
+        self.cpu_windows = 0
+        self.cpu_saturated = 0
+        self.loop_lag = LatencyHistogram()
+
+    def merge(self, other):
+        self.processes += other.processes
+        self.wall = max(self.wall, other.wall)
+        self.cpu_time += other.cpu_time
+        self.peak_rss_mb = max(self.peak_rss_mb, other.peak_rss_mb)
+        self.total_rss_mb += other.total_rss_mb
+        self.gc_collections = [a + b for a, b in zip(self.gc_collections, other.gc_collections)]
+        self.gc_pause_total += other.gc_pause_total
+        self.gc_pause_max = max(self.gc_pause_max, other.gc_pause_max)
+        # 各进程峰值之和，是同时打开socket数的上界
+        self.sockets_peak += other.sockets_peak
+        self.cpu_windows += other.cpu_windows
+        self.cpu_saturated += other.cpu_saturated
+        self.loop_lag.merge(other.loop_lag)
+        return self
+
+    def client_bound(self, lag_threshold=LAG_THRESHOLD, saturated_fraction=SATURATED_FRACTION):
+        """返回判定为客户端受限的原因列表，为空表示客户端未成为瓶颈"""
+        reasons = []
+        lag = self.loop_lag.percentile(99)
+        if lag > lag_threshold:
+            reasons.append(f'事件循环滞后p99 {lag * 1000:.0f}毫秒')
+        if self.cpu_windows and self.cpu_saturated / self.cpu_windows > saturated_fraction:
+            reasons.append(f'{self.cpu_saturated / self.cpu_windows:.0%}的时间CPU占用≥{CPU_THRESHOLD:.0%}')
+        return reasons
+
+    def summary(self):
+        return {
+            '进程数': self.processes,
+            'CPU时间(秒)': round(self.cpu_time, 2),
+            'CPU占用': f'{self.cpu_time / (self.wall * self.processes):.0%}' if self.wall and self.processes else '-',
+            '峰值RSS(MB)': round(self.peak_rss_mb, 1),
+            'GC次数(0/1/2代)': '/'.join(str(count) for count in self.gc_collections),
+            'GC停顿(毫秒, 合计/最大)': f'{self.gc_pause_total * 1000:.1f}/{self.gc_pause_max * 1000:.1f}',
+            '峰值socket数': self.sockets_peak,
+            '循环滞后(毫秒, p50/p99/最大)': f'{self.loop_lag.percentile(50) * 1000:.1f}/'
+                                     f'{self.loop_lag.percentile(99) * 1000:.1f}/{(self.loop_lag.max or 0) * 1000:.1f}'
+        }
+
+    def to_dict(self):
+        data = {key: value for key, value in vars(self).items() if key != 'loop_lag'}
+        data['loop_lag'] = self.loop_lag.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        usage = cls()
+        for key, value in data.items():
+            if key != 'loop_lag':
+                setattr(usage, key, value)
+        usage.loop_lag = LatencyHistogram.from_dict(data['loop_lag'])
+        return usage
+
+
+class ResourceMonitor:
+    """在当前进程的事件循环中采样资源占用；start/stop需在事件循环内调用"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.usage = ResourceUsage()
+        self._task = None
+        self._gc_start = None
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            pause = time.perf_counter() - self._gc_start
+            self._gc_start = None
+            self.usage.gc_collections[info['generation']] += 1
+            self.usage.gc_pause_total += pause
+            self.usage.gc_pause_max = max(self.usage.gc_pause_max, pause)
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        ticks = 0
+        last_wall = time.perf_counter()
+        last_cpu = time.process_time()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            # 定时器实际被唤醒的时刻与预期时刻之差即为事件循环滞后
+            self.usage.loop_lag.record(max(0.0, loop.time() - expected))
+            now_wall = time.perf_counter()
+            now_cpu = time.process_time()
+            self.usage.cpu_windows += 1
+            if now_cpu - last_cpu >= CPU_THRESHOLD * (now_wall - last_wall):
+                self.usage.cpu_saturated += 1
+            last_wall, last_cpu = now_wall, now_cpu
+            ticks += 1
+            if ticks % SOCKET_SAMPLE_EVERY == 0:
+                self.usage.sockets_peak = max(self.usage.sockets_peak, open_sockets())
+
+    def start(self):
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        gc.callbacks.append(self._on_gc)
+        self._task = asyncio.ensure_future(self._sample())
+        return self
+
+    async def stop(self):
+        """停止采样，返回本进程的ResourceUsage"""
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        usage = self.usage
+        usage.processes = 1
+        usage.wall = time.perf_counter() - self._start_wall
+        usage.cpu_time = time.process_time() - self._start_cpu
+        usage.peak_rss_mb = usage.total_rss_mb = _peak_rss_mb()
+        usage.sockets_peak = max(usage.sockets_peak, open_sockets())
+        return usage
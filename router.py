@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+'''
+延迟感知的多平台路由客户端
+
+功能说明：
+- 提供与OpenAI SDK一致的 client.chat.completions.create(...) 调用方式
+- 覆盖config.APIConfig中配置的所有平台，每次调用自动选择当前最优的平台
+- 根据实际调用实时更新各平台的EWMA估计：首token延迟、输出速率、错误率
+- 按可配置的权重计算得分，并以一定概率随机探索其他平台，平台恢复后能重新获得流量
+- 在收到首token之前失败时自动切换到下一个平台重试
+- 可用loadgen.py --output保存的直方图作为初始估计
+
+使用示例：
+    from router import RoutingClient
+
+    client = RoutingClient(exploration=0.05)
+    stream = client.chat.completions.create(
+        messages=[{"role": "user", "content": "你好"}],
+        stream=True
+    )
+    for chunk in stream:
+        ...
+    print(stream.provider, client.snapshot())
+
+得分说明（越低越好）：
+    单次耗时 = ttft权重 × 首token延迟(秒) + decode权重 × 单token耗时(秒)
+    得分 = (单次耗时 + error权重 × 错误率) / (1 - 错误率)
+    即失败后重试直到成功的期望总耗时，error权重为每次失败额外损失的秒数。
+    默认权重 {'ttft': 1.0, 'decode': 100.0, 'error': 10.0}，即按约100个输出token估算单次耗时；
+    错误率趋近100%时得分按MIN_SUCCESS_RATE放大，持续失败的平台不会排在健康平台之前。
+'''
+
+import json
+import random
+import threading
+import time
+
+DEFAULT_WEIGHTS = {'ttft': 1.0, 'decode': 100.0, 'error': 10.0}
+# 计算得分时成功率的下限，避免错误率为100%时除零
+MIN_SUCCESS_RATE = 0.01
+
+
+class ProviderEstimate:
+    """单个平台的EWMA估计"""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.ttft = None
+        self.decode_rate = None
+        self.error_rate = 0.0
+        self.samples = 0
+
+    def _update(self, current, value):
+        if current is None:
+            return value
+        return (1 - self.alpha) * current + self.alpha * value
+
+    def record_success(self, ttft, decode_rate=None):
+        self.samples += 1
+        # 非流式调用测不到首token延迟，传入None时只更新错误率
+        if ttft is not None:
+            self.ttft = self._update(self.ttft, ttft)
+        if decode_rate:
+            self.decode_rate = self._update(self.decode_rate, decode_rate)
+        self.error_rate = self._update(self.error_rate, 0.0)
+
+    def record_error(self):
+        self.samples += 1
+        self.error_rate = self._update(self.error_rate, 1.0)
+
+    def score(self, weights):
+        ttft = self.ttft if self.ttft is not None else 0.0
+        per_token = 1.0 / self.decode_rate if self.decode_rate else 0.0
+        cost = weights['ttft'] * ttft + weights['decode'] * per_token
+        success_rate = max(1.0 - self.error_rate, MIN_SUCCESS_RATE)
+        return (cost + weights['error'] * self.error_rate) / success_rate
+
+
+class RoutedStream:
+    """包装SDK的流式响应，迭代过程中测量首token延迟和输出速率"""
+
+    def __init__(self, router, name, response, start):
+        self.router = router
+        self.provider = name
+        self._response = response
+        self._start = start
+        self._iterator = iter(response)
+        self._first = None
+        self._last = None
+        self._chunks = 0
+        self._done = False
+        self._buffer = []
+
+    def _prime(self):
+        """预读到第一个内容块为止；此前的失败由路由器切换平台重试"""
+        while True:
+            chunk = next(self._iterator)
+            self._buffer.append(chunk)
+            if self._observe(chunk):
+                return
+
+    def _observe(self, chunk):
+        choices = getattr(chunk, 'choices', None)
+        if not choices:
+            return False
+        delta = choices[0].delta
+        text = getattr(delta, 'content', None) or getattr(delta, 'reasoning_content', None)
+        if not text:
+            return False
+        now = time.perf_counter()
+        if self._first is None:
+            self._first = now
+        self._last = now
+        self._chunks += 1
+        return True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._buffer:
+            # 先返回预读的数据块
+            return self._buffer.pop(0)
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self._finish(ok=True)
+            raise
+        except Exception:
+            self._finish(ok=False)
+            raise
+        self._observe(chunk)
+        return chunk
+
+    def _finish(self, ok):
+        if self._done:
+            return
+        self._done = True
+        if not ok or self._first is None:
+            self.router._record_error(self.provider)
+            return
+        elapsed = self._last - self._first
+        decode_rate = (self._chunks - 1) / elapsed if elapsed > 0 and self._chunks > 1 else None
+        self.router._record_success(self.provider, self._first - self._start, decode_rate)
+
+    def close(self):
+        # 提前关闭时只记录首token延迟，不更新输出速率
+        if not self._done and self._first is not None:
+            self._done = True
+            self.router._record_success(self.provider, self._first - self._start)
+        close = getattr(self._response, 'close', None)
+        if close:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Completions:
+    def __init__(self, router):
+        self._router = router
+
+    def create(self, **kwargs):
+        return self._router._create(**kwargs)
+
+
+class _Chat:
+    def __init__(self, router):
+        self.completions = _Completions(router)
+
+
+class RoutingClient:
+    """多平台路由客户端，接口与openai.OpenAI的chat.completions保持一致"""
+
+    def __init__(self, providers=None, weights=None, exploration=0.05, alpha=0.2,
+                 max_attempts=2, timeout=None, priors=None):
+        if providers is None:
+            from config import config
+            providers = config.providers()
+        if not providers:
+            raise ValueError('没有可用的平台')
+        if max_attempts < 1:
+            raise ValueError(f'max_attempts必须至少为1: {max_attempts}')
+        self.providers = providers
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.exploration = exploration
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.estimates = {name: ProviderEstimate(alpha) for name in providers}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.chat = _Chat(self)
+        if priors:
+            self.load_priors(priors)
+
+    def load_priors(self, filename):
+        """用loadgen.py --output保存的直方图数据初始化估计值"""
+        from histogram import RunStats
+        with open(filename, encoding='utf-8') as f:
+            run = RunStats.from_dict(json.load(f))
+        with self._lock:
+            for name, stats in run.providers.items():
+                estimate = self.estimates.get(name)
+                if estimate is None or not stats.requests:
+                    continue
+                estimate.ttft = stats.hists['first_token_time'].percentile(50)
+                itl = stats.hists['itl'].mean()
+                estimate.decode_rate = 1.0 / itl if itl > 0 else None
+                estimate.error_rate = sum(stats.errors.values()) / stats.requests
+                estimate.samples = stats.requests
+
+    def _client(self, name):
+        # 只在平台被选中时才创建对应的SDK客户端
+        if name not in self._clients:
+            from openai import OpenAI
+            provider = self.providers[name]
+            options = {'timeout': self.timeout} if self.timeout is not None else {}
+            self._clients[name] = OpenAI(api_key=provider['api_key'], base_url=provider['base_url'], **options)
+        return self._clients[name]
+
+    def _rank(self, candidates):
+        with self._lock:
+            # 尚无样本的平台优先探索
+            unseen = [name for name in candidates if self.estimates[name].samples == 0]
+            if unseen:
+                first = random.choice(unseen)
+            elif random.random() < self.exploration:
+                first = random.choice(candidates)
+            else:
+                first = min(candidates, key=lambda name: self.estimates[name].score(self.weights))
+            rest = sorted((name for name in candidates if name != first),
+                          key=lambda name: self.estimates[name].score(self.weights))
+        return [first] + rest
+
+    def _record_success(self, name, ttft, decode_rate=None):
+        with self._lock:
+            self.estimates[name].record_success(ttft, decode_rate)
+
+    def _record_error(self, name):
+        with self._lock:
+            self.estimates[name].record_error()
+
+    def _create(self, model=None, stream=False, **kwargs):
+        candidates = list(self.providers)
+        if model is not None:
+            # 指定了模型时只在配置了该模型的平台之间路由
+            candidates = [name for name in candidates if self.providers[name]['model'] == model] or candidates
+
+        error = None
+        for name in self._rank(candidates)[:self.max_attempts]:
+            start = time.perf_counter()
+            response = None
+            try:
+                response = self._client(name).chat.completions.create(
+                    model=self.providers[name]['model'], stream=stream, **kwargs
+                )
+                if not stream:
+                    # 非流式调用的耗时包含完整输出，不计入首token延迟
+                    self._record_success(name, None)
+                    return response
+                routed = RoutedStream(self, name, response, start)
+                routed._prime()
+                return routed
+            except Exception as e:
+                # 首token之前的失败可以安全地切换平台，先关闭已建立的响应以释放连接
+                close = getattr(response, 'close', None)
+                if close:
+                    close()
+                self._record_error(name)
+                error = e
+        raise error
+
+    def snapshot(self):
+        """返回各平台当前的估计值和得分"""
+        with self._lock:
+            return {
+                name: {
+                    'ttft': estimate.ttft,
+                    'decode_rate': estimate.decode_rate,
+                    'error_rate': estimate.error_rate,
+                    'samples': estimate.samples,
+                    'score': estimate.score(self.weights)
+                }
+                for name, estimate in self.estimates.items()
+            }
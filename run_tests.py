@@ -19,6 +19,10 @@
 
 3. 运行测试：
    python run_tests.py
+   python run_tests.py --rounds 6 --mode staggered --spacing 0.5   # 多轮随机交错，错开发起时刻
+   python run_tests.py --rounds 6 --mode isolated                  # 多轮随机顺序，逐个平台单独运行
+   python run_tests.py --rounds 10 --html                          # 同时生成带延迟分布图的HTML报告
+   python run_tests.py --no-calibration                            # 不按calibration.json修正各脚本的计时偏差
 
 输出格式：
 程序将以表格形式展示以下指标：
@@ -30,14 +34,29 @@
 - 输出Token数量
 - Token输出速率（token/s）
 - 总Token数量
+- 成功率、goodput（首token满足--slo-ttft的样本每秒输出的token数）和状态
+
+失败的样本（连接失败、TLS、HTTP 4xx/429/5xx、中途断开、超时、SSE格式错误）按错误类型标记，
+不计入延迟统计，也不参与排名
+
+存在calibration.json（calibrate.py --save生成）时，自动从各脚本测得的耗时中扣除其固定计时偏差
 """
 
+import argparse
 import asyncio
+import collections
 import subprocess
 import re
-from tabulate import tabulate
 import datetime
 import os
+import statistics
+
+from calibrate import CALIBRATION_FILE, correct_metrics, describe_corrections, load_calibration
+from histogram import DEFAULT_SLO
+from scheduler import MODES, make_schedule, run_schedule
+from stream_client import ERROR_TYPES
+
+METRIC_KEYS = ['网络延迟', '首token响应', '输出耗时', '总耗时', '输入Token', '输出Token', '输出token/s', '总Token']
 
 def extract_metrics(output, verbose=False, platform_name=None):
     metrics = {
@@ -117,6 +136,11 @@ def extract_metrics(output, verbose=False, platform_name=None):
                         metrics[metric] = float(value)
                     break
     
+    # 识别HTTP 429限流，限流的平台单独标记，不能按补零后的数值参与排名
+    metrics['限流'] = bool(re.search(r'HTTP 429|Error code: 429|Too Many Requests', output))
+    if verbose and metrics['限流']:
+        print(f"[调试] 检测到HTTP 429限流")
+    
     if verbose:
         print(f"[调试] 指标直接提取结果:")
         for k, v in metrics.items():
@@ -187,6 +211,17 @@ def extract_metrics(output, verbose=False, platform_name=None):
                 if verbose:
                     print(f"[调试] 设置默认值 {key} = 0.0")
     
+    # 识别失败的样本：脚本输出的错误分类，或者脚本没有任何输出；失败的样本不计入统计和排名
+    match = re.search(r'错误类型[：:]\s*(\w+)', output)
+    if match:
+        metrics['错误'] = match.group(1)
+    elif '发生错误' in output or not output.strip():
+        metrics['错误'] = 'error'
+    else:
+        metrics['错误'] = None
+    if verbose and metrics['错误']:
+        print(f"[调试] 检测到失败: {metrics['错误']}")
+    
     if verbose:
         print("[调试] 最终指标结果:")
         for k, v in metrics.items():
@@ -194,23 +229,163 @@ def extract_metrics(output, verbose=False, platform_name=None):
                 
     return metrics
 
-async def run_test(script_name):
+async def run_test(script_name, timeout=0):
+    """运行单个测试脚本并返回其输出；超过timeout秒（0表示不限制）时强制结束，返回已输出的部分"""
     try:
         process = await asyncio.create_subprocess_exec(
             'python', script_name,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
-        stdout, stderr = await process.communicate()
+        communicate = asyncio.ensure_future(process.communicate())
+        try:
+            done, _ = await asyncio.wait({communicate}, timeout=timeout or None)
+            if not done:
+                print(f'\n⚠️ {script_name} 运行超过{timeout:g}秒，强制结束')
+                process.kill()
+            # 进程结束后管道关闭，communicate返回已输出的内容
+            stdout, stderr = await communicate
+            if not done:
+                # 补充错误分类，被强制结束的样本记为超时
+                stdout += '\n错误类型：timeout\n'.encode('utf-8')
+        except asyncio.CancelledError:
+            # 整个测试被取消时不留下仍在运行的子进程
+            if process.returncode is None:
+                process.kill()
+            raise
         return stdout.decode('utf-8')
     except Exception as e:
         print(f'运行 {script_name} 时发生错误: {str(e)}')
         return ''
 
-async def save_results_to_file(table_content, metrics_data=None, platforms=None):
+def is_failed(metrics):
+    return metrics['限流'] or bool(metrics['错误'])
+
+def describe_failure(metrics):
+    if metrics['限流']:
+        return '被限流(HTTP 429)'
+    return f"失败({ERROR_TYPES.get(metrics['错误'], metrics['错误'])})"
+
+def aggregate_rounds(samples, slo_ttft=DEFAULT_SLO['ttft']):
+    """多轮测试时取各指标在成功的轮次中的中位数，并统计成功率、错误分布和goodput
+
+    goodput为首token不超过slo_ttft的成功样本的输出token数，除以全部样本的总耗时之和。
+    """
+    valid = [metrics for metrics in samples if not is_failed(metrics)]
+    if not valid:
+        result = dict(samples[0])
+    else:
+        result = {}
+        for key in METRIC_KEYS:
+            value = statistics.median(metrics[key] for metrics in valid)
+            result[key] = round(value) if 'Token' in key else round(value, 4)
+        result['限流'] = False
+        result['错误'] = None
+    result['有效轮次'] = len(valid)
+    result['成功率'] = len(valid) / len(samples)
+    result['错误分布'] = dict(collections.Counter(
+        'throttled' if metrics['限流'] else metrics['错误'] for metrics in samples if is_failed(metrics)))
+    good = [metrics for metrics in valid if metrics['首token响应'] <= slo_ttft]
+    elapsed = sum(metrics['总耗时'] for metrics in samples)
+    result['goodput'] = sum(metrics['输出Token'] for metrics in good) / elapsed if elapsed else 0.0
+    return result
+
+# 性能分析摘要中的排名项：(标题, 指标, 是否越大越好, 数值格式)
+HIGHLIGHTS = [
+    ('最快首token响应', '首token响应', False, '{:.2f}秒'),
+    ('最高输出速率', '输出token/s', True, '{:.2f}token/s'),
+    ('最短总耗时', '总耗时', False, '{:.2f}秒'),
+    ('输出内容最多', '输出Token', True, '{}个token')
+]
+
+def highlights(metrics_data, platforms):
+    """性能分析摘要的各排名项；每个指标只扫描一遍，平台数很少时不需要借助sample_store"""
+    lines = []
+    for title, key, higher, fmt in HIGHLIGHTS:
+        best = None
+        for p in platforms:
+            value = metrics_data[p][key]
+            if best is None or (value > best[1] if higher else value < best[1]):
+                best = (p, value)
+        if best:
+            lines.append(f"- {title}: {best[0]} ({fmt.format(best[1])})")
+    return lines
+
+def save_html_report(samples, filename):
+    """把各轮样本写入sample_store并生成离线HTML报告（CDF和时间序列），需要numpy"""
+    from html_report import write_report
+    from sample_store import SampleRecord, SampleStore
+    
+    store = SampleStore()
+    for slot, platform, metrics in samples:
+        failed = is_failed(metrics)
+        store.append(SampleRecord(
+            start=slot.get('started_at'),
+            network_latency=metrics['网络延迟'],
+            first_token_time=metrics['首token响应'],
+            output_time=metrics['输出耗时'],
+            total_time=metrics['总耗时'],
+            output_speed=metrics['输出token/s'],
+            input_tokens=metrics['输入Token'],
+            output_tokens=metrics['输出Token'],
+            ok=0 if failed else 1,
+            provider=platform,
+            error_type=('throttled' if metrics['限流'] else metrics['错误']) if failed else None
+        ))
+    write_report(store, filename, title='API性能对比测试报告')
+    print(f"HTML报告已保存到文件: {filename}")
+
+def describe_slot(slot):
+    return (f"第{slot['round']}轮第{slot['position']}位, 计划偏移{slot['offset']:.2f}秒, "
+            f"开始时另有{slot['overlap']}个平台在运行")
+
+def results_filename():
     # 生成带时间戳的文件名
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'test_results_{timestamp}.txt'
+    return f'test_results_{timestamp}.txt'
+
+def build_table(metrics_data, platforms, rounds):
+    """生成对比表格；尚未完成的平台显示为'-'，全部样本都失败的平台只显示状态和成功率"""
+    def row(label, key, fmt='{:.2f}', failed_value='-'):
+        cells = []
+        for p in platforms:
+            if p not in metrics_data:
+                cells.append('-')
+            elif is_failed(metrics_data[p]) and failed_value == '-':
+                cells.append('-')
+            else:
+                cells.append(fmt.format(metrics_data[p][key]))
+        return [label] + cells
+    
+    headers = ['指标'] + platforms
+    rows = [
+        row('网络延迟(秒)', '网络延迟'),
+        row('首token响应(秒)', '首token响应'),
+        row('输出耗时(秒)', '输出耗时'),
+        row('总耗时(秒)', '总耗时'),
+        row('输入Token(个)', '输入Token', '{}'),
+        row('输出Token(个)', '输出Token', '{}'),
+        row('输出token/s(个/秒)', '输出token/s'),
+        row('总Token(个)', '总Token', '{}'),
+        row('成功率', '成功率', '{:.0%}', None),
+        row('goodput(token/s)', 'goodput', '{:.2f}', None),
+        ['状态'] + [(describe_failure(metrics_data[p]) if is_failed(metrics_data[p]) else '成功')
+                  if p in metrics_data else '-' for p in platforms]
+    ]
+    if rounds > 1:
+        rows.append(row(f'有效轮次(共{rounds}轮)', '有效轮次', '{}', None))
+    
+    # 只在生成表格时才需要tabulate
+    from tabulate import tabulate
+    return tabulate(rows, headers=headers, tablefmt='grid', disable_numparse=True)
+
+async def save_results_to_file(table_content, metrics_data=None, platforms=None, samples=None,
+                               filename=None, progress=None, corrections=None):
+    """保存报告；progress为(已完成数, 总数)时表示测试尚在进行，写入的是中间结果
+
+    corrections为已扣除的各脚本计时偏差 {脚本: {指标: 秒}}，写入测试说明
+    """
+    filename = filename or results_filename()
     
     # 确保文件写入是异步的
     async with asyncio.Lock():
@@ -220,28 +395,28 @@ async def save_results_to_file(table_content, metrics_data=None, platforms=None)
             f.write('=================================================\n\n')
             f.write(f'测试时间: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
             f.write(f'测试平台: 阿里云、火山引擎、腾讯云、硅基流动、OpenRouter和DeepSeek官方\n\n')
+            if progress:
+                f.write(f'测试状态: 进行中（已完成 {progress[0]}/{progress[1]} 个样本），以下为中间结果\n\n')
             f.write('测试指标对比表格:\n')
             f.write(table_content)
             
             # 如果提供了详细的指标数据，添加性能分析摘要
+            failed = [p for p in platforms or [] if is_failed(metrics_data[p])]
+            platforms = [p for p in platforms or [] if not is_failed(metrics_data[p])]
+            if failed:
+                details = '、'.join(f'{p}{describe_failure(metrics_data[p])}' for p in failed)
+                f.write(f"\n\n失败或被限流的平台: {details}（不参与排名）")
+            errors = {p: metrics_data[p]['错误分布'] for p in platforms if metrics_data[p]['错误分布']}
+            if errors:
+                f.write('\n\n部分轮次失败的平台（失败的轮次不计入统计）:\n')
+                for p, counts in errors.items():
+                    details = ', '.join(f'{ERROR_TYPES.get(kind, kind)}: {count}' for kind, count in counts.items())
+                    f.write(f"- {p}: {details}\n")
             if metrics_data and platforms:
                 f.write('\n\n性能分析摘要:\n')
                 
-                # 最快首token响应
-                fastest_first_token = min([(p, metrics_data[p]['首token响应']) for p in platforms], key=lambda x: x[1])
-                f.write(f"- 最快首token响应: {fastest_first_token[0]} ({fastest_first_token[1]:.2f}秒)\n")
-                
-                # 最高输出速率
-                fastest_output = max([(p, metrics_data[p]['输出token/s']) for p in platforms], key=lambda x: x[1])
-                f.write(f"- 最高输出速率: {fastest_output[0]} ({fastest_output[1]:.2f}token/s)\n")
-                
-                # 最短总耗时
-                fastest_total = min([(p, metrics_data[p]['总耗时']) for p in platforms], key=lambda x: x[1])
-                f.write(f"- 最短总耗时: {fastest_total[0]} ({fastest_total[1]:.2f}秒)\n")
-                
-                # 输出内容最多
-                most_output = max([(p, metrics_data[p]['输出Token']) for p in platforms], key=lambda x: x[1])
-                f.write(f"- 输出内容最多: {most_output[0]} ({most_output[1]}个token)\n")
+                for line in highlights(metrics_data, platforms):
+                    f.write(f"{line}\n")
                 
                 # 添加各平台特点分析
                 f.write('\n各平台特点:\n')
@@ -261,15 +436,37 @@ async def save_results_to_file(table_content, metrics_data=None, platforms=None)
             f.write('4. 总耗时: 整个请求的完整时间\n')
             f.write('5. 输出token/s: 输出Token数量除以输出耗时\n\n')
             f.write('注意: 所有平台使用相同的测试消息和测试环境，数据在同一时间段采集\n')
+            if corrections:
+                f.write(f'计时修正: 已按{CALIBRATION_FILE}扣除各脚本的固定计时偏差\n')
+                for script, values in corrections.items():
+                    f.write(f"- {script}: {describe_corrections(values)}\n")
+            
+            # 每个样本的调度信息，便于核对发起顺序和并发重叠对结果的影响
+            if samples:
+                f.write(f"\n调度记录（{samples[0][0]['mode']}）:\n")
+                for slot, platform, metrics in samples:
+                    started = datetime.datetime.fromtimestamp(slot['started_at']).strftime('%H:%M:%S.%f')[:-3]
+                    result = describe_failure(metrics) if is_failed(metrics) else f"首token {metrics['首token响应']:.2f}秒"
+                    f.write(f"- {started} {platform}: {describe_slot(slot)}, {result}\n")
     
-    print(f'\n测试结果已保存到文件: {filename}')
+    if not progress:
+        print(f'\n测试结果已保存到文件: {filename}')
 
-async def main():
+async def main(args):
     # 是否开启详细调试模式
     DEBUG_MODE = False
     
     print("===== API性能对比测试工具 =====")
     print("开始性能测试，将并发测试6个平台的API性能...\n")
+    print(f"调度方式: {args.mode}, 轮数: {args.rounds}, 每轮平台顺序随机交错\n")
+    
+    # 按calibrate.py测得的各脚本固定偏差修正耗时
+    corrections = {} if args.no_calibration else load_calibration()
+    if corrections:
+        print(f"计时修正（{CALIBRATION_FILE}）:")
+        for script, values in corrections.items():
+            print(f"- {script}: {describe_corrections(values)}")
+        print()
     
     # 定义测试脚本和对应的平台名称
     tests = [
@@ -281,71 +478,100 @@ async def main():
         ('deepseek_test.py', 'DeepSeek官方')
     ]
     
-    # 并发运行所有测试
-    print("正在并发执行测试，请稍候...\n")
-    results = await asyncio.gather(*[run_test(script) for script, _ in tests])
-    
-    # 解析结果
-    print("\n测试完成，正在处理结果...")
-    metrics_data = {}
-    for (script, platform), output in zip(tests, results):
-        print(f"\n处理 {platform} 平台结果...")
-        metrics = extract_metrics(output, verbose=DEBUG_MODE, platform_name=platform)
-        metrics_data[platform] = metrics
-        
-        # 输出提取到的指标摘要
-        print(f"  - 网络延迟: {metrics.get('网络延迟'):.2f}秒")
-        print(f"  - 首token响应: {metrics.get('首token响应'):.2f}秒")
-        print(f"  - 输出耗时: {metrics.get('输出耗时'):.2f}秒")
-        print(f"  - 总耗时: {metrics.get('总耗时'):.2f}秒")
-        print(f"  - 输入Token: {metrics.get('输入Token')}个")
-        print(f"  - 输出Token: {metrics.get('输出Token')}个")
-        print(f"  - 输出token/s: {metrics.get('输出token/s'):.2f}个/秒")
-        print(f"  - 总Token: {metrics.get('总Token')}个")
-    
-    # 准备表格数据
+    # 按随机交错的调度表运行所有测试，每完成一个样本就立即处理并输出结果
+    print("正在执行测试，请稍候...\n")
+    names = {script: platform for script, platform in tests}
     platforms = ['阿里云', '火山引擎', '腾讯云', '硅基流动', 'OpenRouter', 'DeepSeek官方']
-    headers = ['指标'] + platforms
-    rows = [
-        ['网络延迟(秒)'] + [metrics_data[p].get('网络延迟', 0) for p in platforms],
-        ['首token响应(秒)'] + [metrics_data[p].get('首token响应', 0) for p in platforms],
-        ['输出耗时(秒)'] + [metrics_data[p].get('输出耗时', 0) for p in platforms],
-        ['总耗时(秒)'] + [metrics_data[p].get('总耗时', 0) for p in platforms],
-        ['输入Token(个)'] + [metrics_data[p].get('输入Token', 0) for p in platforms],
-        ['输出Token(个)'] + [metrics_data[p].get('输出Token', 0) for p in platforms],
-        ['输出token/s(个/秒)'] + [metrics_data[p].get('输出token/s', 0) for p in platforms],
-        ['总Token(个)'] + [metrics_data[p].get('总Token', 0) for p in platforms]
-    ]
+    schedule = make_schedule(list(names), args.rounds, args.mode, args.spacing, args.seed)
+    filename = results_filename()
+    samples = []
+    saving = []
+    rounds_data = {platform: [] for _, platform in tests}
+    
+    def current_metrics():
+        # 多轮时各指标取中位数；尚无结果的平台不出现在结果中
+        return {platform: aggregate_rounds(history, args.slo_ttft)
+                for platform, history in rounds_data.items() if history}
+    
+    def on_result(slot, output):
+        platform = names[slot['provider']]
+        metrics = extract_metrics(output or '', verbose=DEBUG_MODE, platform_name=platform)
+        if not is_failed(metrics):
+            correct_metrics(metrics, corrections.get(slot['provider']))
+        metrics['调度'] = slot
+        samples.append((slot, platform, metrics))
+        rounds_data[platform].append(metrics)
+        print(f"\n[{len(samples)}/{len(schedule)}] {platform} 完成（{describe_slot(slot)}）")
+        
+        if is_failed(metrics):
+            print(f"  ⚠️ {describe_failure(metrics)}，该样本不计入统计和排名")
+        else:
+            # 输出提取到的指标摘要
+            print(f"  - 网络延迟: {metrics.get('网络延迟'):.2f}秒")
+            print(f"  - 首token响应: {metrics.get('首token响应'):.2f}秒")
+            print(f"  - 输出耗时: {metrics.get('输出耗时'):.2f}秒")
+            print(f"  - 总耗时: {metrics.get('总耗时'):.2f}秒")
+            print(f"  - 输入Token: {metrics.get('输入Token')}个")
+            print(f"  - 输出Token: {metrics.get('输出Token')}个")
+            print(f"  - 输出token/s: {metrics.get('输出token/s'):.2f}个/秒")
+            print(f"  - 总Token: {metrics.get('总Token')}个")
+        
+        # 中间结果写入同一个报告文件，测试中途中断也能保留已完成的样本
+        if len(samples) < len(schedule):
+            partial = current_metrics()
+            table = build_table(partial, platforms, args.rounds)
+            completed = [p for p in platforms if p in partial]
+            saving.append(asyncio.ensure_future(save_results_to_file(table, partial, completed, list(samples),
+                                                                     filename, (len(samples), len(schedule)),
+                                                                     corrections)))
+            # 多轮测试时每完成一轮打印一次中间对比表
+            if args.rounds > 1 and len(samples) % len(tests) == 0:
+                print(f"\n第{len(samples) // len(tests)}轮完成，中间结果：")
+                print(table)
+    
+    await run_schedule(schedule, lambda script: run_test(script, args.script_timeout),
+                       args.spacing, args.round_gap, on_result)
+    # 等待尚未写完的中间结果，避免覆盖最终报告
+    await asyncio.gather(*saving)
+    print(f"\n测试完成，共{len(samples)}个样本")
     
-    # 生成表格内容
-    table_content = tabulate(rows, headers=headers, tablefmt='grid', floatfmt=".2f")
+    metrics_data = current_metrics()
+    table_content = build_table(metrics_data, platforms, args.rounds)
     
     # 打印表格
     print("\n所有平台性能指标对比：")
     print(table_content)
     
-    # 性能分析摘要
+    # 性能分析摘要（排除失败和被限流的平台）
+    ranked = [p for p in platforms if not is_failed(metrics_data[p])]
     print("\n性能分析摘要：")
-    # 找出最快的首token响应
-    fastest_first_token = min([(p, metrics_data[p]['首token响应']) for p in platforms], key=lambda x: x[1])
-    print(f"- 最快首token响应: {fastest_first_token[0]} ({fastest_first_token[1]:.2f}秒)")
-    
-    # 找出最高的输出速率
-    fastest_output = max([(p, metrics_data[p]['输出token/s']) for p in platforms], key=lambda x: x[1])
-    print(f"- 最高输出速率: {fastest_output[0]} ({fastest_output[1]:.2f}token/s)")
-    
-    # 找出最短的总耗时
-    fastest_total = min([(p, metrics_data[p]['总耗时']) for p in platforms], key=lambda x: x[1])
-    print(f"- 最短总耗时: {fastest_total[0]} ({fastest_total[1]:.2f}秒)")
-    
-    # 找出输出内容最多的
-    most_output = max([(p, metrics_data[p]['输出Token']) for p in platforms], key=lambda x: x[1])
-    print(f"- 输出内容最多: {most_output[0]} ({most_output[1]}个token)")
+    if not ranked:
+        print("- 所有平台均失败或被限流，无法进行排名")
+    else:
+        for line in highlights(metrics_data, ranked):
+            print(line)
     
     # 保存结果到文件
-    await save_results_to_file(table_content, metrics_data, platforms)
+    await save_results_to_file(table_content, metrics_data, platforms, samples, filename, corrections=corrections)
+    if args.html:
+        save_html_report(samples, os.path.splitext(filename)[0] + '.html')
     
     print("\n测试完成！六个平台的性能指标统计标准已统一。")
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='API性能对比测试工具')
+    parser.add_argument('--rounds', type=int, default=1, help='测试轮数，多轮时各指标取中位数')
+    parser.add_argument('--mode', choices=MODES, default='concurrent',
+                        help='concurrent同时发起 / staggered间隔发起 / isolated逐个单独运行')
+    parser.add_argument('--spacing', type=float, default=0.0, help='staggered/isolated模式下相邻平台的发起间隔（秒）')
+    parser.add_argument('--round-gap', type=float, default=0.0, help='相邻两轮之间的间隔（秒）')
+    parser.add_argument('--seed', type=int, help='随机种子，便于复现调度顺序')
+    parser.add_argument('--slo-ttft', type=float, default=DEFAULT_SLO['ttft'],
+                        help='计算goodput的首token目标（秒），超过的样本不计入goodput')
+    parser.add_argument('--script-timeout', type=float, default=600,
+                        help='单个测试脚本的最长运行时间（秒），超时后强制结束并保留已输出的部分，0表示不限制')
+    parser.add_argument('--html', action='store_true',
+                        help='同时生成离线HTML报告（各平台延迟CDF和随时间的变化，需要numpy）')
+    parser.add_argument('--no-calibration', action='store_true',
+                        help=f'不按{CALIBRATION_FILE}（calibrate.py --save生成）修正各脚本的计时偏差')
+    asyncio.run(main(parser.parse_args()))
\ No newline at end of file
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+
+'''
+列式样本存储与向量化汇总
+
+功能说明：
+- 逐请求的样本按列存放：每个数值字段一个array模块缓冲区（float32/int32，开始时间为float64），
+  平台、模型、提示词、错误类型等分类字段存为整数编码加取值表，每个样本约占50字节
+- 写入路径使用带__slots__的SampleRecord，不为每个样本保留字典、列表或文本
+- 汇总时把各列一次性转换为NumPy数组，按平台/模型/提示词任意组合分组；
+  分组键为整数编码的组合，计数、均值用bincount，分位数在按组排序后的连续切片上计算，排名用argsort，
+  百万样本的汇总在毫秒级完成
+- 多个进程的样本库可直接合并（分类编码自动重映射），可保存为压缩的.npz文件供离线分析
+
+运行命令：
+python sample_store.py samples.npz
+python sample_store.py samples.npz --by provider,model --metrics first_token_time,total_time --rank first_token_time
+
+配置参数：
+⭐ --by：分组字段（provider、model、prompt、error_type），逗号分隔
+⭐ --metrics：统计的数值字段，逗号分隔
+⭐ --all：失败的请求也参与延迟统计（默认只统计成功的请求）
+⭐ --rank：按某个字段的p50排名
+'''
+
+import argparse
+import array
+import json
+import time
+
+import numpy as np
+
+# 数值列及其array类型码：d为float64，f为float32，i为int32，b为int8
+NUMERIC_COLUMNS = {
+    'start': 'd',
+    'network_latency': 'f',
+    'first_token_time': 'f',
+    'output_time': 'f',
+    'total_time': 'f',
+    'itl_mean': 'f',
+    'itl_max': 'f',
+    'output_speed': 'f',
+    'input_tokens': 'i',
+    'output_tokens': 'i',
+    'cached_tokens': 'i',
+    'bytes_received': 'i',
+    'ok': 'b'
+}
+CATEGORY_COLUMNS = ('provider', 'model', 'prompt', 'error_type')
+
+DTYPES = {'d': np.float64, 'f': np.float32, 'i': np.int32, 'b': np.int8}
+
+DEFAULT_METRICS = ('first_token_time', 'total_time', 'itl_mean', 'output_speed')
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+# 分类字段中表示“无”的取值（例如成功请求的error_type）
+NONE = ''
+
+
+def prompt_label(messages, limit=20):
+    """用最后一条消息的前limit个字符作为提示词分组标签"""
+    if not messages:
+        return NONE
+    content = messages[-1].get('content') or ''
+    return content[:limit]
+
+
+class SampleRecord:
+    """单个样本的写入记录，只包含存入样本库的字段"""
+
+    __slots__ = tuple(NUMERIC_COLUMNS) + CATEGORY_COLUMNS
+
+    def __init__(self, **fields):
+        for name in NUMERIC_COLUMNS:
+            setattr(self, name, fields.get(name) or 0)
+        for name in CATEGORY_COLUMNS:
+            setattr(self, name, fields.get(name) or NONE)
+
+    @classmethod
+    def from_sample(cls, sample, prompt=NONE, model=NONE, start=None):
+        """由stream_chat返回的样本字典生成记录；start为墙上时钟的开始时间，省略时按当前时间倒推"""
+        gaps = sample.get('itl') or ()
+        return cls(
+            start=start if start is not None else time.time() - sample['total_time'],
+            network_latency=sample['network_latency'],
+            first_token_time=sample['first_token_time'],
+            output_time=sample['output_time'],
+            total_time=sample['total_time'],
+            itl_mean=sum(gaps) / len(gaps) if gaps else 0.0,
+            itl_max=max(gaps) if gaps else 0.0,
+            output_speed=sample['output_speed'],
+            input_tokens=sample['input_tokens'],
+            output_tokens=sample['output_tokens'],
+            cached_tokens=sample.get('cached_tokens'),
+            bytes_received=sample.get('bytes_received'),
+            ok=1 if sample['ok'] else 0,
+            provider=sample['provider'],
+            model=sample.get('model') or model,
+            prompt=prompt,
+            error_type=sample.get('error_type')
+        )
+
+
+class SampleStore:
+    """列式样本库"""
+
+    def __init__(self):
+        self._numeric = {name: array.array(code) for name, code in NUMERIC_COLUMNS.items()}
+        self._codes = {name: array.array('i') for name in CATEGORY_COLUMNS}
+        self._values = {name: [] for name in CATEGORY_COLUMNS}
+        self._index = {name: {} for name in CATEGORY_COLUMNS}
+
+    def __len__(self):
+        return len(self._numeric['start'])
+
+    def _code(self, column, value):
+        index = self._index[column]
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(self._values[column])
+            self._values[column].append(value)
+        return code
+
+    def append(self, record):
+        for name, column in self._numeric.items():
+            column.append(getattr(record, name))
+        for name, codes in self._codes.items():
+            codes.append(self._code(name, getattr(record, name)))
+
+    def add_sample(self, sample, prompt=NONE, model=NONE, start=None):
+        self.append(SampleRecord.from_sample(sample, prompt, model, start))
+
+    def extend(self, other):
+        """合并另一个样本库，分类编码按本库的取值表重映射"""
+        for name, column in self._numeric.items():
+            column.extend(other._numeric[name])
+        for name, codes in self._codes.items():
+            mapping = np.array([self._code(name, value) for value in other._values[name]], dtype=np.int32)
+            if len(other):
+                codes.frombytes(mapping[other.codes(name)].tobytes())
+        return self
+
+    def _view(self, name):
+        # 直接引用array缓冲区、不复制的只读视图，仅在汇总过程中使用（期间不能写入）
+        if name in self._numeric:
+            return np.frombuffer(self._numeric[name], dtype=DTYPES[NUMERIC_COLUMNS[name]])
+        return np.frombuffer(self._codes[name], dtype=np.int32)
+
+    def column(self, name):
+        """数值列的NumPy数组（副本，之后继续写入不受影响）"""
+        return self._view(name).copy()
+
+    def codes(self, name):
+        return self._view(name).copy()
+
+    def values(self, name):
+        """分类列的取值表，下标即编码"""
+        return list(self._values[name])
+
+    def to_dict(self):
+        """可pickle的字典，用于进程间传输"""
+        return {
+            'numeric': {name: column.tobytes() for name, column in self._numeric.items()},
+            'codes': {name: codes.tobytes() for name, codes in self._codes.items()},
+            'values': {name: list(values) for name, values in self._values.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls()
+        for name, column in store._numeric.items():
+            column.frombytes(data['numeric'][name])
+        for name, codes in store._codes.items():
+            codes.frombytes(data['codes'][name])
+        for name in CATEGORY_COLUMNS:
+            for value in data['values'][name]:
+                store._code(name, value)
+        return store
+
+    def save(self, filename):
+        """保存为压缩的.npz文件"""
+        arrays = {f'numeric_{name}': self.column(name) for name in NUMERIC_COLUMNS}
+        arrays.update({f'codes_{name}': self.codes(name) for name in CATEGORY_COLUMNS})
+        arrays['values'] = np.array(json.dumps(self._values, ensure_ascii=False))
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        store = cls()
+        with np.load(filename) as data:
+            for name, code in NUMERIC_COLUMNS.items():
+                store._numeric[name].frombytes(data[f'numeric_{name}'].astype(DTYPES[code]).tobytes())
+            for name in CATEGORY_COLUMNS:
+                store._codes[name].frombytes(data[f'codes_{name}'].astype(np.int32).tobytes())
+            values = json.loads(str(data['values']))
+        for name in CATEGORY_COLUMNS:
+            for value in values[name]:
+                store._code(name, value)
+        return store
+
+    def group_keys(self, by):
+        """返回(每个样本的组合分组编码, 组合编码的取值空间大小)"""
+        key = np.zeros(len(self), dtype=np.int64)
+        size = 1
+        for name in by:
+            count = max(1, len(self._values[name]))
+            key = key * count + self._view(name)
+            size *= count
+        return key, size
+
+    def _group_label(self, by, key):
+        label = []
+        for name in reversed(by):
+            count = max(1, len(self._values[name]))
+            key, code = divmod(key, count)
+            label.append(self._values[name][code] if self._values[name] else NONE)
+        return tuple(reversed(label))
+
+    def _sort_by_group(self, key, size, mask=None):
+        """返回(按分组编码稳定排序后的样本下标, 每个分组编码的样本数)，mask为可选的样本筛选条件
+
+        取值空间较小时用16位整数排序（numpy使用基数排序）；之后每个指标只需一次gather即可得到按组连续存放的数组。
+        """
+        selected = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        selected_key = key[selected]
+        sort_key = selected_key.astype(np.uint16) if size <= 65535 else selected_key
+        return selected[np.argsort(sort_key, kind='stable')], np.bincount(selected_key, minlength=size)
+
+    def summarize(self, by=('provider',), metrics=DEFAULT_METRICS, percentiles=DEFAULT_PERCENTILES, only_ok=True):
+        """按分组汇总，返回Summary
+
+        计数、成功数用bincount一次算出；均值和分位数在按分组编码排序后的连续切片上计算
+        （reduceat和基于partition的np.percentile）。only_ok为True时延迟统计只使用成功的请求。
+        """
+        by = tuple(by)
+        key, size = self.group_keys(by)
+        ok = self._view('ok').astype(bool)
+        counts = np.bincount(key, minlength=size)
+        oks = np.bincount(key, weights=ok, minlength=size)
+        present = np.flatnonzero(counts)
+
+        gather, group_sizes = self._sort_by_group(key, size, ok if only_ok else None)
+        group_sizes = group_sizes[present]
+        ends = np.cumsum(group_sizes)
+        starts = ends - group_sizes
+        nonempty = group_sizes > 0
+
+        stats = {}
+        for metric in metrics:
+            values = self._view(metric)[gather]
+            sums = np.zeros(len(present))
+            if nonempty.any():
+                sums[nonempty] = np.add.reduceat(values, starts[nonempty], dtype=np.float64)
+            result = {'mean': np.divide(sums, group_sizes, out=np.full(len(present), np.nan), where=nonempty)}
+            table = np.full((len(present), len(percentiles)), np.nan)
+            for row in np.flatnonzero(nonempty):
+                table[row] = np.percentile(values[starts[row]:ends[row]], percentiles)
+            for column, p in enumerate(percentiles):
+                result[f'p{p}'] = table[:, column]
+            stats[metric] = result
+
+        # 每组的时间跨度和输出吞吐：按开始时间和结束时间的最小/最大值计算
+        start = self._view('start')
+        end = start + self._view('total_time')
+        first = np.full(size, np.inf)
+        last = np.full(size, -np.inf)
+        np.minimum.at(first, key, start)
+        np.maximum.at(last, key, end)
+        tokens = np.bincount(key, weights=self._view('output_tokens') * ok, minlength=size)
+        duration = last[present] - first[present]
+
+        return Summary(
+            by=by,
+            labels=[self._group_label(by, group) for group in present],
+            count=counts[present],
+            ok=oks[present].astype(np.int64),
+            output_tokens=tokens[present].astype(np.int64),
+            duration=duration,
+            stats=stats,
+            percentiles=tuple(percentiles)
+        )
+
+    def distribution(self, metric, quantiles, by=('provider',), only_ok=True):
+        """每组在指定分位点（0~1）上的取值，用于绘制CDF
+
+        返回(分组标签, 形状为(分组数, 分位点数)的数组)，只包含有数据的分组；
+        分位点数量固定，与样本数无关，百万级样本也只产生固定数量的点。
+        """
+        by = tuple(by)
+        key, size = self.group_keys(by)
+        gather, group_sizes = self._sort_by_group(key, size, self._view('ok').astype(bool) if only_ok else None)
+        ends = np.cumsum(group_sizes)
+        starts = ends - group_sizes
+        values = self._view(metric)[gather]
+        present = np.flatnonzero(group_sizes)
+        # 分位点较多时对每组排序一次、再线性插值，比np.quantile逐个分位点partition快得多
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        table = np.empty((len(present), len(quantiles)))
+        for row, group in enumerate(present):
+            ordered = np.sort(values[starts[group]:ends[group]]).astype(np.float64)
+            position = quantiles * (len(ordered) - 1)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, len(ordered) - 1)
+            table[row] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+        return [self._group_label(by, group) for group in present], table
+
+    def timeline(self, bucket_seconds, by=('provider',)):
+        """按开始时间分桶统计，返回(桶的起始偏移秒数, 分组标签, 计数, 失败数, 输出token数)，后三者形状为(分组数, 桶数)"""
+        by = tuple(by)
+        key, size = self.group_keys(by)
+        start = self.column('start')
+        if not len(start):
+            return np.zeros(0), [], np.zeros((0, 0)), np.zeros((0, 0)), np.zeros((0, 0))
+        offset = start - start.min()
+        buckets = int(offset.max() // bucket_seconds) + 1
+        index = key * buckets + (offset // bucket_seconds).astype(np.int64)
+        failed = 1 - self.column('ok')
+        total = np.bincount(index, minlength=size * buckets).reshape(size, buckets)
+        errors = np.bincount(index, weights=failed, minlength=size * buckets).reshape(size, buckets)
+        tokens = np.bincount(index, weights=self.column('output_tokens') * (1 - failed),
+                             minlength=size * buckets).reshape(size, buckets)
+        present = np.flatnonzero(total.sum(axis=1))
+        return (np.arange(buckets) * bucket_seconds, [self._group_label(by, group) for group in present],
+                total[present], errors[present], tokens[present])
+
+
+class Summary:
+    """SampleStore.summarize的结果，各统计量为与labels对齐的NumPy数组"""
+
+    def __init__(self, by, labels, count, ok, output_tokens, duration, stats, percentiles):
+        self.by = by
+        self.labels = labels
+        self.count = count
+        self.ok = ok
+        self.output_tokens = output_tokens
+        self.duration = duration
+        self.stats = stats
+        self.percentiles = percentiles
+
+    @property
+    def success_rate(self):
+        return np.divide(self.ok, self.count, out=np.zeros(len(self.count)), where=self.count > 0)
+
+    @property
+    def throughput(self):
+        """每组成功请求的输出token数除以该组的时间跨度"""
+        return np.divide(self.output_tokens, self.duration, out=np.zeros(len(self.duration)), where=self.duration > 0)
+
+    def rank(self, metric, stat='p50', ascending=True):
+        """返回[(分组标签, 值)]，按指定统计量排序，没有数据的分组排在最后
+
+        metric为参与汇总的数值字段，或success_rate、throughput；其他字段抛出ValueError。
+        """
+        if metric in self.stats:
+            values = self.stats[metric][stat]
+        elif metric in ('success_rate', 'throughput'):
+            values = getattr(self, metric)
+        else:
+            raise ValueError(f'字段{metric}未参与汇总，可排名的字段: {", ".join(list(self.stats) + ["success_rate", "throughput"])}')
+        order = np.argsort(values if ascending else -values, kind='stable')
+        return [(self.labels[index], float(values[index])) for index in order if not np.isnan(values[index])]
+
+    def rows(self, metrics=None):
+        metrics = metrics or list(self.stats)
+        rows = []
+        for index, label in enumerate(self.labels):
+            row = list(label) + [int(self.count[index]), f'{self.success_rate[index]:.1%}']
+            for metric in metrics:
+                row.append('/'.join(
+                    '-' if np.isnan(self.stats[metric][f'p{p}'][index]) else f"{self.stats[metric][f'p{p}'][index]:.3f}"
+                    for p in self.percentiles
+                ))
+            row.append(f'{self.throughput[index]:.1f}')
+            rows.append(row)
+        return rows
+
+    def headers(self, metrics=None):
+        metrics = metrics or list(self.stats)
+        percentiles = '/'.join(f'p{p}' for p in self.percentiles)
+        return list(self.by) + ['样本数', '成功率'] + [f'{metric} {percentiles}' for metric in metrics] + ['输出token/s']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列式样本库汇总')
+    parser.add_argument('samples_file', help='loadgen.py用--samples保存的样本文件(.npz)')
+    parser.add_argument('--by', default='provider', help='分组字段，逗号分隔')
+    parser.add_argument('--metrics', default=','.join(DEFAULT_METRICS), help='统计的数值字段，逗号分隔')
+    parser.add_argument('--all', action='store_true', help='失败的请求也参与延迟统计')
+    parser.add_argument('--rank', help='按该字段的p50升序排名')
+    args = parser.parse_args()
+
+    by = [name.strip() for name in args.by.split(',') if name.strip()]
+    metrics = [name.strip() for name in args.metrics.split(',') if name.strip()]
+    for name in by:
+        if name not in CATEGORY_COLUMNS:
+            parser.error(f'未知的分组字段: {name}')
+    for name in metrics:
+        if name not in NUMERIC_COLUMNS:
+            parser.error(f'未知的数值字段: {name}')
+    if args.rank and args.rank not in NUMERIC_COLUMNS:
+        parser.error(f'未知的排名字段: {args.rank}')
+    # 排名字段不在--metrics中时同样参与汇总，但不在表格中显示
+    summarized = metrics + [args.rank] if args.rank and args.rank not in metrics else metrics
+
+    store = SampleStore.load(args.samples_file)
+    start = time.perf_counter()
+    summary = store.summarize(by, summarized, only_ok=not args.all)
+    elapsed = time.perf_counter() - start
+
+    from tabulate import tabulate
+
+    print(f"样本数: {len(store)}, 汇总耗时: {elapsed * 1000:.1f}毫秒\n")
+    print(tabulate(summary.rows(metrics), headers=summary.headers(metrics), tablefmt='grid', disable_numparse=True))
+    if args.rank:
+        print(f"\n按{args.rank} p50排名：")
+        for position, (label, value) in enumerate(summary.rank(args.rank), 1):
+            print(f"{position}. {'/'.join(label)}: {value:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+'''
+随机交错调度
+
+功能说明：
+- 多轮对比测试时，每一轮随机打乱各平台的发起顺序
+- 每n轮（n为平台数）为一组，组内的顺序构成随机拉丁方：
+  每个平台在每个位置上恰好出现一次，先后顺序带来的影响在各平台之间均匀分摊
+- 支持三种发起方式：
+  concurrent：同一轮的请求同时发起（按随机顺序）
+  staggered：同一轮的请求按随机顺序依次间隔spacing秒发起，错开TLS握手和上行带宽的争用
+  isolated：同一轮的请求逐个执行，前一个完成并间隔spacing秒后才发起下一个，互不干扰
+- 每个样本都记录所在轮次、位置、计划偏移、实际开始时间以及开始时正在运行的其他请求数
+'''
+
+import asyncio
+import random
+import time
+
+MODES = ('concurrent', 'staggered', 'isolated')
+
+
+def balanced_orders(names, rounds, rng):
+    """生成rounds轮的发起顺序；每len(names)轮为一个随机拉丁方"""
+    n = len(names)
+    orders = []
+    while len(orders) < rounds:
+        base = list(names)
+        rng.shuffle(base)
+        columns = list(range(n))
+        rng.shuffle(columns)
+        block = [[base[(row + column) % n] for column in columns] for row in range(n)]
+        rng.shuffle(block)
+        orders += block
+    return orders[:rounds]
+
+
+def make_schedule(names, rounds=1, mode='concurrent', spacing=0.0, seed=None):
+    """返回调度表（按执行顺序排列的列表），每项为一个样本的调度信息"""
+    if mode not in MODES:
+        raise ValueError(f'未知的调度方式: {mode}')
+    rng = random.Random(seed)
+    schedule = []
+    for round_index, order in enumerate(balanced_orders(names, rounds, rng)):
+        for position, name in enumerate(order):
+            schedule.append({
+                'round': round_index + 1,
+                'position': position + 1,
+                'provider': name,
+                'mode': mode,
+                'offset': position * spacing if mode == 'staggered' else 0.0,
+                'started_at': None,
+                'overlap': 0
+            })
+    return schedule
+
+
+async def run_schedule(schedule, run_one, spacing=0.0, round_gap=0.0, on_result=None):
+    """按调度表执行，run_one(provider)为协程函数
+
+    返回[(slot, result)]，按调度表顺序排列；slot中会写入实际开始时间（墙上时钟）
+    和开始时正在运行的其他请求数(overlap)。
+    on_result(slot, result)在每个样本完成时立即调用（按完成顺序），便于增量输出结果。
+    """
+    running = 0
+    results = {}
+
+    async def launch(index, slot, delay):
+        nonlocal running
+        if delay > 0:
+            await asyncio.sleep(delay)
+        slot['started_at'] = time.time()
+        slot['overlap'] = running
+        running += 1
+        try:
+            results[index] = await run_one(slot['provider'])
+        finally:
+            running -= 1
+        if on_result:
+            on_result(slot, results[index])
+
+    rounds = {}
+    for index, slot in enumerate(schedule):
+        rounds.setdefault(slot['round'], []).append((index, slot))
+
+    for number, slots in enumerate(rounds.values()):
+        if number and round_gap > 0:
+            await asyncio.sleep(round_gap)
+        if slots[0][1]['mode'] == 'isolated':
+            for position, (index, slot) in enumerate(slots):
+                await launch(index, slot, spacing if position else 0.0)
+        else:
+            await asyncio.gather(*[launch(index, slot, slot['offset']) for index, slot in slots])
+
+    return [(slot, results.get(index)) for index, slot in enumerate(schedule)]
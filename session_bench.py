@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+'''
+多轮对话基准测试
+
+功能说明：
+- 按会话回放N轮对话：每轮收到回答后，将assistant回答追加到messages，再发送下一轮的用户消息
+- 上下文随轮次增长，测量每一轮的首token延迟、输入token数以及平台返回的缓存命中token数
+- 每个会话的首条消息带有唯一编号，第1轮不会命中其他会话留下的缓存，
+  后续轮次的缓存命中来自本会话之前的上下文（前缀缓存）
+- 按平台汇总：会话总耗时、首token随上下文的增长（末轮/首轮、每千输入token增加的毫秒数）、
+  缓存命中率，以及第2轮起命中与未命中缓存时的首token对比
+- 某一轮失败时该会话终止（后续轮次缺少上下文），计为未完成会话
+
+运行命令：
+python session_bench.py --providers ark,deepseek --sessions 5 --turns 6
+python session_bench.py --providers mock --sessions 10 --turns 8 --concurrency 4
+
+配置参数：
+⭐ --turns：每个会话的轮数
+⭐ --sessions：每个平台的会话数
+⭐ --concurrency：每个平台同时进行的会话数
+⭐ --system：可选的系统提示词，所有会话共享（可命中跨会话的前缀缓存）
+⭐ --output：将每一轮的样本保存为JSON文件
+'''
+
+import argparse
+import asyncio
+import json
+import statistics
+import uuid
+
+from histogram import LatencyHistogram
+from loadgen import (DEFAULT_MESSAGES, MOCK_BASE_URL, add_timeout_arguments, describe_errors, resolve_provider,
+                     timeouts_from_args)
+from stream_client import ConnectionPool, calculate_input_tokens, stream_chat
+
+# 第2轮起依次使用的用户消息，轮数更多时循环使用
+FOLLOW_UPS = [
+    "请把上面的回答总结成三点。",
+    "第二点能再展开说明一下吗？",
+    "有没有具体的例子？",
+    "如果换一个角度，你会怎么看？",
+    "请指出你前面回答中可能不准确的地方。",
+    "最后请用一句话概括我们的整个对话。"
+]
+
+
+def user_message(turn, prompt):
+    return prompt if turn == 1 else FOLLOW_UPS[(turn - 2) % len(FOLLOW_UPS)]
+
+
+async def run_session(pool, provider, turns, prompt, max_tokens=512, system=None, timeouts=None):
+    """执行一个会话，返回每一轮的样本列表（失败的那一轮为最后一个）"""
+    session_id = uuid.uuid4().hex[:8]
+    messages = [{"role": "system", "content": system}] if system else []
+    samples = []
+    for turn in range(1, turns + 1):
+        content = user_message(turn, prompt)
+        if turn == 1:
+            content = f"（会话{session_id}）{content}"
+        messages.append({"role": "user", "content": content})
+        sample = await stream_chat(pool, provider, list(messages), max_tokens, keep_text=True, timeouts=timeouts)
+        sample['session'] = session_id
+        sample['turn'] = turn
+        sample['context_bytes'] = calculate_input_tokens(messages)
+        samples.append(sample)
+        if not sample['ok']:
+            break
+        messages.append({"role": "assistant", "content": sample.pop('content')})
+    return samples
+
+
+class TurnStats:
+    """同一平台同一轮次的汇总"""
+
+    def __init__(self):
+        self.ttft = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self.attempts = 0
+        self.ok = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, sample):
+        self.attempts += 1
+        if not sample['ok']:
+            return
+        self.ok += 1
+        self.ttft.record(sample['first_token_time'])
+        self.total.record(sample['total_time'])
+        self.input_tokens += sample['input_tokens']
+        self.cached_tokens += sample['cached_tokens']
+
+
+class SessionStats:
+    """单个平台所有会话的汇总"""
+
+    def __init__(self, turns):
+        self.turns = [TurnStats() for _ in range(turns)]
+        self.session_time = LatencyHistogram()
+        self.completed = 0
+        self.sessions = 0
+        self.errors = {}
+        # 第2轮起按是否命中缓存分开统计首token
+        self.ttft_cached = LatencyHistogram()
+        self.ttft_uncached = LatencyHistogram()
+        # (输入token数, 首token延迟)，用于估计首token随上下文增长的斜率
+        self.points = []
+
+    def record(self, samples, turns):
+        self.sessions += 1
+        for sample in samples:
+            self.turns[sample['turn'] - 1].record(sample)
+            if not sample['ok']:
+                kind = sample['error_type'] or 'error'
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+                continue
+            self.points.append((sample['input_tokens'], sample['first_token_time']))
+            if sample['turn'] > 1:
+                hist = self.ttft_cached if sample['cached_tokens'] else self.ttft_uncached
+                hist.record(sample['first_token_time'])
+        if len(samples) == turns and samples[-1]['ok']:
+            self.completed += 1
+            self.session_time.record(sum(sample['total_time'] for sample in samples))
+
+    def ttft_slope(self):
+        """每增加1000个输入token首token延迟增加的秒数；样本不足时返回None"""
+        if len({x for x, _ in self.points}) < 2:
+            return None
+        slope, _ = statistics.linear_regression([x for x, _ in self.points], [y for _, y in self.points])
+        return slope * 1000
+
+    def cache_ratio(self, first_turn=2):
+        turns = self.turns[first_turn - 1:]
+        input_tokens = sum(turn.input_tokens for turn in turns)
+        return sum(turn.cached_tokens for turn in turns) / input_tokens if input_tokens else None
+
+
+async def run_sessions(providers, sessions, turns, concurrency, prompt, max_tokens, system=None, timeouts=None,
+                       samples=None):
+    """返回 {平台名称: SessionStats}；samples为列表时追加每一轮的样本"""
+    pool = ConnectionPool()
+    results = {provider['name']: SessionStats(turns) for provider in providers}
+
+    async def one(provider, semaphore, index):
+        async with semaphore:
+            session = await run_session(pool, provider, turns, prompt, max_tokens, system, timeouts)
+        results[provider['name']].record(session, turns)
+        if samples is not None:
+            samples.extend(session)
+        last = session[-1]
+        status = '完成' if len(session) == turns and last['ok'] else f"第{last['turn']}轮失败({last['error_type']})"
+        print(f"[{index + 1}/{sessions}] {provider['name']} 会话{last['session']}: {status}")
+
+    tasks = []
+    for provider in providers:
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        tasks += [one(provider, semaphore, index) for index in range(sessions)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await pool.close()
+    return results
+
+
+def _seconds(hist, p, count):
+    return f'{hist.percentile(p):.2f}' if count else '-'
+
+
+def _ratio(value):
+    return f'{value:.0%}' if value is not None else '-'
+
+
+def turn_rows(results):
+    rows = []
+    for name, stats in results.items():
+        for number, turn in enumerate(stats.turns, 1):
+            rows.append([
+                name, number, f'{turn.ok}/{turn.attempts}',
+                f'{turn.input_tokens / turn.ok:.0f}' if turn.ok else '-',
+                _ratio(turn.cached_tokens / turn.input_tokens if turn.input_tokens else None),
+                _seconds(turn.ttft, 50, turn.ok),
+                _seconds(turn.ttft, 95, turn.ok),
+                _seconds(turn.total, 50, turn.ok)
+            ])
+    return rows
+
+
+TURN_HEADERS = ['平台', '轮次', '成功', '平均输入token', '缓存命中', '首token p50(秒)', '首token p95(秒)', '总耗时 p50(秒)']
+
+
+def summary_rows(results):
+    rows = []
+    for name, stats in results.items():
+        first, last = stats.turns[0], stats.turns[-1]
+        growth = last.ttft.percentile(50) / first.ttft.percentile(50) if first.ok and last.ok else None
+        slope = stats.ttft_slope()
+        rows.append([
+            name,
+            f'{stats.completed}/{stats.sessions}',
+            f'{_seconds(stats.session_time, 50, stats.completed)}/{_seconds(stats.session_time, 95, stats.completed)}',
+            f'{growth:.2f}x' if growth is not None else '-',
+            f'{slope * 1000:.1f}' if slope is not None else '-',
+            _ratio(stats.cache_ratio()),
+            f'{_seconds(stats.ttft_cached, 50, stats.ttft_cached.count)}/'
+            f'{_seconds(stats.ttft_uncached, 50, stats.ttft_uncached.count)}'
+        ])
+    return rows
+
+
+SUMMARY_HEADERS = [
+    '平台', '完成会话', '会话总耗时 p50/p95(秒)', '首token增长(末轮/首轮p50)', '首token斜率(毫秒/千输入token)',
+    '缓存命中率(第2轮起)', '首token p50 命中/未命中缓存(秒)'
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多轮对话基准测试')
+    parser.add_argument('--providers', default='mock', help='平台名称，逗号分隔')
+    parser.add_argument('--sessions', type=int, default=3, help='每个平台的会话数')
+    parser.add_argument('--turns', type=int, default=5, help='每个会话的轮数')
+    parser.add_argument('--concurrency', type=int, default=1, help='每个平台同时进行的会话数')
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--prompt', default=DEFAULT_MESSAGES[0]['content'], help='第1轮的用户消息')
+    parser.add_argument('--system', help='所有会话共享的系统提示词')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    parser.add_argument('--output', help='将每一轮的样本保存为JSON文件')
+    add_timeout_arguments(parser)
+    args = parser.parse_args()
+
+    providers = [resolve_provider(name.strip(), args.mock_url) for name in args.providers.split(',') if name.strip()]
+    samples = [] if args.output else None
+
+    print("===== 多轮对话基准测试 =====")
+    print(f"平台: {', '.join(provider['name'] for provider in providers)}, 每个平台{args.sessions}个会话 × {args.turns}轮, "
+          f"并发{args.concurrency}\n")
+    results = asyncio.run(run_sessions(providers, args.sessions, args.turns, args.concurrency, args.prompt,
+                                       args.max_tokens, args.system, timeouts_from_args(args), samples))
+
+    from tabulate import tabulate
+
+    print("\n各轮次结果：")
+    print(tabulate(turn_rows(results), headers=TURN_HEADERS, tablefmt='grid', disable_numparse=True))
+    print("\n会话汇总：")
+    print(tabulate(summary_rows(results), headers=SUMMARY_HEADERS, tablefmt='grid', disable_numparse=True))
+    for name, stats in results.items():
+        if stats.errors:
+            print(f"- {name} 错误分布: {describe_errors(stats.errors)}")
+    print("\n说明：输入token和缓存命中使用平台返回的usage（未返回时按字节估算、缓存计为0）；"
+          "首token斜率为所有成功轮次的首token延迟对输入token数的线性回归")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(samples, f, ensure_ascii=False)
+        print(f'\n样本数据已保存到文件: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+'''
+长时间稳定性（soak）测试
+
+功能说明：
+- 每个平台保持固定数量的长文本生成流持续运行数小时：一个流结束后立即发起下一个
+- 按时间段（默认5分钟）分桶统计，每个时间段结束时立即输出，便于长时间运行中途查看：
+  完成的请求数和成功率、中途停顿（相邻数据块间隔超过阈值）、中途断开、超时、
+  新建连接数（连接流失）、首token和token间隔分位数、输出速度
+- 同时记录客户端自身的稳定性：每个时间段的当前RSS、打开的socket数，以及在途流已累积的文本字节数
+  （逐块 content += 的客户端需要常驻的内存）；结束时按RSS随时间的斜率判断客户端是否存在内存增长
+- 请求失败后先等待再重发：429按Retry-After，其他错误按指数退避（RETRY_BACKOFF起，最长MAX_RETRY_BACKOFF），
+  避免平台故障或限流期间密集重试，既干扰平台也让报告充满噪声
+- 默认不保留生成的文本，只计数；--keep-text 让每个流保留完整文本，用于观察累积文本对客户端内存的影响
+- 样本不逐条保存，只保留各时间段的汇总，运行时长不影响内存占用
+
+运行命令：
+python soak.py --providers ark,aliyun --streams 2 --duration 28800
+python soak.py --providers mock --streams 8 --duration 600 --bucket 60 --output soak.json
+
+配置参数：
+⭐ --streams：每个平台同时保持的生成流数量
+⭐ --duration：测试时长（秒），到时后不再发起新请求，等待在途请求结束
+⭐ --bucket：统计时间段的长度（秒）
+⭐ --stall：相邻数据块间隔超过该值（秒）记为一次中途停顿
+⭐ --rss-growth-limit：RSS增长斜率超过该值（MB/小时）时判定客户端存在内存增长
+'''
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from histogram import LatencyHistogram
+from loadgen import MOCK_BASE_URL, add_timeout_arguments, describe_errors, resolve_provider, timeouts_from_args
+from rate_limit import parse_retry_after
+from resource_monitor import current_rss_mb, open_sockets
+from stream_client import ConnectionPool, stream_chat
+
+DEFAULT_PROMPT = "请写一篇尽可能详细的长文，系统介绍中国古代科技史，按朝代分章节展开，每章不少于1000字。"
+
+# 在途文本字节数的采样周期（秒）
+TEXT_SAMPLE_INTERVAL = 1.0
+# 判断RSS趋势至少需要的统计时长（小时），时间太短时斜率主要反映噪声
+MIN_TREND_HOURS = 0.25
+# 失败后重发前的等待（秒），连续失败时加倍，最长MAX_RETRY_BACKOFF
+RETRY_BACKOFF = 1.0
+MAX_RETRY_BACKOFF = 60.0
+
+
+class SoakCounters:
+    """一个平台在一个时间段内的统计，可合并"""
+
+    def __init__(self):
+        self.requests = 0
+        self.ok = 0
+        self.errors = {}
+        self.stalls = 0
+        self.stalled_requests = 0
+        self.disconnects = 0
+        self.timeouts = 0
+        self.new_connections = 0
+        self.output_tokens = 0
+        self.output_time = 0.0
+        self.ttft = LatencyHistogram()
+        self.itl = LatencyHistogram()
+
+    def record(self, sample, stall_threshold):
+        self.requests += 1
+        # 只统计实际建立的新连接：连接失败时connect_time为0
+        if not sample['reused'] and sample['connect_time'] > 0:
+            self.new_connections += 1
+        stalls = sum(1 for gap in sample['itl'] if gap > stall_threshold)
+        self.stalls += stalls
+        self.stalled_requests += stalls > 0
+        for gap in sample['itl']:
+            self.itl.record(gap)
+        if sample['first_token_time']:
+            self.ttft.record(sample['first_token_time'])
+        self.output_tokens += sample['output_tokens']
+        self.output_time += sample['output_time']
+        if sample['ok'] and not sample['error_type']:
+            self.ok += 1
+            return
+        kind = sample['error_type'] or 'error'
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        self.disconnects += kind == 'disconnect'
+        self.timeouts += kind == 'timeout'
+
+    def merge(self, other):
+        for key in ('requests', 'ok', 'stalls', 'stalled_requests', 'disconnects', 'timeouts', 'new_connections',
+                    'output_tokens', 'output_time'):
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+        self.ttft.merge(other.ttft)
+        self.itl.merge(other.itl)
+        return self
+
+    def to_dict(self):
+        data = {key: value for key, value in vars(self).items() if key not in ('ttft', 'itl')}
+        data['ttft'] = self.ttft.to_dict()
+        data['itl'] = self.itl.to_dict()
+        return data
+
+
+class SoakBucket:
+    """一个时间段的统计：各平台的SoakCounters和客户端资源占用"""
+
+    def __init__(self, index, start, names):
+        self.index = index
+        self.start = start
+        self.end = start
+        self.providers = {name: SoakCounters() for name in names}
+        self.rss_mb = 0.0
+        self.sockets = 0
+        self.text_peak = 0
+        self.stream_text_peak = 0
+
+    def label(self):
+        return '-'.join(time.strftime('%H:%M:%S', time.gmtime(offset)) for offset in (self.start, self.end))
+
+    def to_dict(self):
+        return {
+            'index': self.index, 'start': self.start, 'end': self.end, 'rss_mb': self.rss_mb, 'sockets': self.sockets,
+            'text_peak': self.text_peak, 'stream_text_peak': self.stream_text_peak,
+            'providers': {name: counters.to_dict() for name, counters in self.providers.items()}
+        }
+
+
+async def soak(providers, streams, duration, bucket_seconds, messages, max_tokens, stall_threshold=5.0,
+               keep_text=False, timeouts=None, on_bucket=None):
+    """运行soak测试，返回SoakBucket列表；on_bucket(bucket)在每个时间段结束时调用"""
+    names = [provider['name'] for provider in providers]
+    pool = ConnectionPool()
+    start = time.perf_counter()
+    deadline = start + duration
+    buckets = []
+    current = SoakBucket(0, 0.0, names)
+    # 在途流的progress字典，output_tokens为该流已收到的文本字节数
+    active = {}
+    retained = {}
+
+    def retry_delay(sample, failures):
+        if sample['http_status'] == 429:
+            delay = parse_retry_after(sample['rate_limit_headers'])
+            if delay is not None:
+                return delay
+        return min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2 ** (failures - 1))
+
+    async def stream_slot(provider, slot):
+        failures = 0
+        while time.perf_counter() < deadline:
+            progress = {}
+            active[(provider['name'], slot)] = progress
+            sample = await stream_chat(pool, provider, messages, max_tokens, keep_text=keep_text, progress=progress,
+                                       timeouts=timeouts)
+            active.pop((provider['name'], slot), None)
+            # 只保留最近一次的完整文本，模拟调用方持有上一个回答
+            if keep_text:
+                retained[(provider['name'], slot)] = sample.pop('content')
+            current.providers[provider['name']].record(sample, stall_threshold)
+            if sample['ok'] and not sample['error_type']:
+                failures = 0
+                continue
+            failures += 1
+            delay = min(retry_delay(sample, failures), deadline - time.perf_counter())
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def close_bucket(now):
+        nonlocal current
+        current.end = now - start
+        current.rss_mb = current_rss_mb()
+        current.sockets = open_sockets()
+        buckets.append(current)
+        if on_bucket:
+            on_bucket(current)
+        current = SoakBucket(len(buckets), now - start, names)
+
+    async def ticker():
+        next_close = start + bucket_seconds
+        while True:
+            await asyncio.sleep(TEXT_SAMPLE_INTERVAL)
+            sizes = [progress.get('output_tokens', 0) for progress in active.values()]
+            current.text_peak = max(current.text_peak, sum(sizes))
+            current.stream_text_peak = max([current.stream_text_peak] + sizes)
+            now = time.perf_counter()
+            if now >= next_close:
+                close_bucket(now)
+                next_close += bucket_seconds
+
+    monitor = asyncio.ensure_future(ticker())
+    try:
+        await asyncio.gather(*[stream_slot(provider, slot) for provider in providers for slot in range(streams)])
+    finally:
+        monitor.cancel()
+        await asyncio.gather(monitor, return_exceptions=True)
+        await pool.close()
+    if any(counters.requests for counters in current.providers.values()):
+        close_bucket(time.perf_counter())
+    return buckets
+
+
+def _ms(hist, p):
+    return f'{hist.percentile(p) * 1000:.0f}' if hist.count else '-'
+
+
+def bucket_rows(label, counters_by_name):
+    rows = []
+    for name, counters in counters_by_name.items():
+        requests = counters.requests or 1
+        rows.append([
+            label, name, counters.requests,
+            f'{counters.ok / requests:.0%}' if counters.requests else '-',
+            f'{counters.stalls}/{counters.stalled_requests / requests:.0%}' if counters.requests else '-',
+            counters.disconnects, counters.timeouts, counters.new_connections,
+            f'{counters.ttft.percentile(50):.2f}' if counters.ttft.count else '-',
+            f'{_ms(counters.itl, 50)}/{_ms(counters.itl, 99)}',
+            f'{counters.output_tokens / counters.output_time:.1f}' if counters.output_time else '-'
+        ])
+    return rows
+
+
+BUCKET_HEADERS = [
+    '时间段', '平台', '完成请求', '成功率', '中途停顿(次数/请求占比)', '中途断开', '超时', '新建连接',
+    '首token p50(秒)', 'token间隔 p50/p99(毫秒)', '输出token/s'
+]
+
+
+def resource_row(bucket):
+    return [bucket.label(), f'{bucket.rss_mb:.1f}', bucket.sockets, f'{bucket.text_peak / 1024:.1f}',
+            f'{bucket.stream_text_peak / 1024:.1f}']
+
+
+RESOURCE_HEADERS = ['时间段', 'RSS(MB)', 'socket数', '在途文本峰值(KB)', '单个流文本峰值(KB)']
+
+
+def rss_growth(buckets):
+    """RSS随时间的线性回归斜率（MB/小时）；第一个时间段含预热，不参与；统计时长不足时返回None"""
+    points = [(bucket.end / 3600, bucket.rss_mb) for bucket in buckets[1:]]
+    if len(points) < 2 or points[-1][0] - points[0][0] < MIN_TREND_HOURS:
+        return None
+    slope, _ = statistics.linear_regression([x for x, _ in points], [y for _, y in points])
+    return slope
+
+
+def bucket_printer(stall_threshold, output=None):
+    """返回on_bucket回调：每个时间段结束时打印统计，并在指定output时覆盖写入JSON文件"""
+    from tabulate import tabulate
+
+    history = []
+
+    def on_bucket(bucket):
+        history.append(bucket.to_dict())
+        print(f"\n[{time.strftime('%H:%M:%S')}] 时间段 {bucket.label()}（停顿阈值{stall_threshold}秒）：")
+        print(tabulate(bucket_rows(bucket.label(), bucket.providers), headers=BUCKET_HEADERS, tablefmt='grid',
+                       disable_numparse=True))
+        print(f"客户端: RSS {bucket.rss_mb:.1f}MB, socket {bucket.sockets}个, "
+              f"在途文本峰值 {bucket.text_peak / 1024:.1f}KB（单个流最多 {bucket.stream_text_peak / 1024:.1f}KB）")
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump({'stall_threshold': stall_threshold, 'buckets': history}, f, ensure_ascii=False)
+
+    return on_bucket
+
+
+def print_summary(buckets, rss_growth_limit):
+    from tabulate import tabulate
+
+    totals = {}
+    for bucket in buckets:
+        for name, counters in bucket.providers.items():
+            totals.setdefault(name, SoakCounters()).merge(counters)
+    print("\n===== soak测试汇总 =====")
+    print(tabulate(bucket_rows('全部', totals), headers=BUCKET_HEADERS, tablefmt='grid', disable_numparse=True))
+    for name, counters in totals.items():
+        if counters.errors:
+            print(f"- {name} 错误分布: {describe_errors(counters.errors)}")
+    print("\n客户端资源随时间的变化：")
+    print(tabulate([resource_row(bucket) for bucket in buckets], headers=RESOURCE_HEADERS, tablefmt='grid',
+                   disable_numparse=True))
+    growth = rss_growth(buckets)
+    if growth is None:
+        print(f"\n统计时长不足{MIN_TREND_HOURS * 60:.0f}分钟，无法判断客户端内存趋势")
+    elif growth > rss_growth_limit:
+        print(f"\n⚠️ 客户端RSS持续增长：{growth:.1f}MB/小时（阈值{rss_growth_limit}MB/小时），长时间运行可能耗尽内存")
+    else:
+        print(f"\n客户端内存稳定：RSS变化 {growth:+.1f}MB/小时（阈值{rss_growth_limit}MB/小时）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='长时间稳定性（soak）测试')
+    parser.add_argument('--providers', default='mock', help='平台名称，逗号分隔')
+    parser.add_argument('--streams', type=int, default=2, help='每个平台同时保持的生成流数量')
+    parser.add_argument('--duration', type=float, default=3600, help='测试时长（秒）')
+    parser.add_argument('--bucket', type=float, default=300, help='统计时间段的长度（秒）')
+    parser.add_argument('--stall', type=float, default=5.0, help='中途停顿的判定阈值（秒）')
+    parser.add_argument('--max-tokens', type=int, default=8192)
+    parser.add_argument('--prompt', default=DEFAULT_PROMPT, help='测试消息（应能引出长文本生成）')
+    parser.add_argument('--keep-text', action='store_true', help='每个流保留完整的生成文本')
+    parser.add_argument('--rss-growth-limit', type=float, default=20.0, help='判定内存增长的RSS斜率（MB/小时）')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    parser.add_argument('--output', help='每个时间段结束时将统计写入JSON文件')
+    add_timeout_arguments(parser)
+    args = parser.parse_args()
+
+    providers = [resolve_provider(name.strip(), args.mock_url) for name in args.providers.split(',') if name.strip()]
+    messages = [{"role": "user", "content": args.prompt}]
+
+    print("===== 长时间稳定性（soak）测试 =====")
+    print(f"平台: {', '.join(provider['name'] for provider in providers)}, 每个平台{args.streams}个流, "
+          f"时长{args.duration / 3600:.2f}小时, 每{args.bucket:.0f}秒统计一次")
+    buckets = asyncio.run(soak(providers, args.streams, args.duration, args.bucket, messages, args.max_tokens,
+                               args.stall, args.keep_text, timeouts_from_args(args),
+                               bucket_printer(args.stall, args.output)))
+    print_summary(buckets, args.rss_growth_limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+'''
+启动耗时基准测试
+
+功能说明：
+- 在全新的子进程中多次启动各入口，测量从脚本开始执行到可以发出第一个请求的耗时
+- 同时记录包含解释器启动在内的总耗时，并以空载解释器作为基线
+- 单平台探测（loadgen + 一个平台配置）的目标为100毫秒以内
+- --imports 列出单平台探测中最耗时的顶层模块导入（python -X importtime）
+
+运行命令：
+python startup_bench.py
+python startup_bench.py --provider ark --runs 20 --imports
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 单平台探测的目标启动耗时（秒，不含解释器启动）
+PROBE_TARGET = 0.1
+
+PROBE = "import loadgen; loadgen.make_plan([loadgen.resolve_provider({provider!r})], requests=1)"
+
+CASES = [
+    ('空载解释器', 'pass'),
+    ('单平台探测（loadgen）', PROBE),
+    ('解析全部平台配置', 'from config import config; config.providers()'),
+    ('run_tests.py', 'import run_tests'),
+    ('OpenAI SDK客户端', "from openai import OpenAI; OpenAI(api_key='x', base_url='http://127.0.0.1:8000/v1')")
+]
+
+WRAPPER = "import time; _start = time.perf_counter()\n{code}\nprint(time.perf_counter() - _start)"
+
+
+def measure(code, runs):
+    """返回(脚本内耗时列表, 含解释器启动的总耗时列表)；失败时返回错误信息"""
+    inside, wall = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', WRAPPER.format(code=code)],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        inside.append(float(result.stdout.strip().splitlines()[-1]))
+        wall.append(elapsed)
+    return inside, wall
+
+
+def slowest_imports(code, limit=10):
+    """返回单次启动中累计耗时最多的顶层模块[(模块, 毫秒)]"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() == 'site':
+            # site及其依赖在解释器启动阶段导入，不计入脚本启动耗时
+            modules = []
+            continue
+        # 只统计入口直接导入的模块及其下一层
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时基准测试')
+    parser.add_argument('--provider', default='mock', help='单平台探测使用的平台')
+    parser.add_argument('--runs', type=int, default=10, help='每个入口启动的次数')
+    parser.add_argument('--imports', action='store_true', help='列出单平台探测中最耗时的模块导入')
+    args = parser.parse_args()
+
+    from tabulate import tabulate
+
+    print("===== 启动耗时基准测试 =====")
+    print(f"平台: {args.provider}, 每个入口启动 {args.runs} 次\n")
+    rows = []
+    probe_median = None
+    for name, template in CASES:
+        code = template.format(provider=args.provider)
+        inside, wall = measure(code, args.runs)
+        if inside is None:
+            rows.append([name, '-', '-', '-', f'失败: {wall}'])
+            continue
+        median = statistics.median(inside)
+        if template == PROBE:
+            probe_median = median
+        rows.append([name, f'{median * 1000:.1f}', f'{min(inside) * 1000:.1f}', f'{statistics.median(wall) * 1000:.1f}', ''])
+    print(tabulate(rows, headers=['入口', '脚本内中位数(毫秒)', '脚本内最小值(毫秒)', '含解释器启动中位数(毫秒)', '备注'],
+                   tablefmt='grid', disable_numparse=True))
+
+    if probe_median is not None:
+        verdict = '达标' if probe_median < PROBE_TARGET else '未达标'
+        print(f"\n单平台探测启动耗时 {probe_median * 1000:.1f} 毫秒，目标 {PROBE_TARGET * 1000:.0f} 毫秒以内：{verdict}")
+
+    if args.imports:
+        print("\n单平台探测中最耗时的顶层模块导入：")
+        modules = slowest_imports(PROBE.format(provider=args.provider))
+        print(tabulate(modules, headers=['模块', '累计耗时(毫秒)'], tablefmt='grid', floatfmt=".1f"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,862 @@
+# -*- coding: utf-8 -*-
+
+'''
+异步流式请求客户端
+
+功能说明：
+- 基于asyncio标准库实现的HTTP/1.1客户端，无需额外依赖
+- 按主机维护keep-alive连接池，压测时复用连接
+- 解析OpenAI兼容接口的SSE流式响应
+- 提供/embeddings接口的请求函数，向量解码使用NumPy（仅在调用时导入）
+- 使用time.perf_counter记录各阶段耗时（连接、响应头、首token、输出）
+
+样本字段说明：
+- network_latency：从发送请求到收到响应头的时间
+- first_token_time：从发送请求到收到第一个非空内容的时间
+- output_time：从第一个token到最后一个token的时间
+- total_time：整个请求的完整时间
+- itl：相邻两个内容块之间的间隔列表
+- rate_limit_headers：响应中与限流相关的响应头，HTTP 429记为throttled而非普通错误
+- bytes_sent / bytes_received：请求和响应在HTTP层的字节数（含请求行、响应头和分块编码）
+- cached_tokens：命中缓存的输入token数；usage_reported：token数是否来自平台返回的usage（否则为字节数估算）
+- tool_calls：由delta.tool_calls片段拼接出的工具调用（id、name、arguments）；工具调用片段同样计为输出token
+- first_tool_call_time：从发送请求到收到第一个tool_calls片段的时间
+- structured_time：从发送请求到结构化输出完整的时间：所有工具调用的参数JSON已闭合，
+  或JSON模式（response_format）下回答正文的JSON已闭合
+- error_type：失败的分类，见ERROR_TYPES（连接失败、TLS、HTTP 4xx/429/5xx、中途断开、超时、SSE格式错误等）
+- timeout_phase：超过截止时间的阶段（connect/ttft/idle/total），此时error_type为timeout，
+  已收到的内容仍计入首token、输出耗时和token数
+
+超时说明：
+- connect：获取连接（TCP连接和TLS握手）的截止时间
+- ttft：从发送请求到收到第一个token的截止时间
+- idle：相邻两个数据块之间的最长间隔
+- total：整个请求的截止时间
+超时的请求会被立即取消，连接关闭并归还连接池的并发名额，不会占用socket
+'''
+
+import asyncio
+import json
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from config import TIMEOUTS
+from rate_limit import is_rate_limit_header
+
+PHASE_NAMES = {'connect': '建立连接', 'ttft': '等待首token', 'idle': '等待数据块', 'total': '整个请求'}
+
+# 错误分类及其中文名称
+ERROR_TYPES = {
+    'connect': '连接失败',
+    'tls': 'TLS握手失败',
+    'http_4xx': 'HTTP 4xx',
+    'throttled': 'HTTP 429限流',
+    'http_5xx': 'HTTP 5xx',
+    'disconnect': '中途断开',
+    'timeout': '超时',
+    'malformed_sse': 'SSE格式错误',
+    'empty': '无输出内容',
+    'client_disconnect': '客户端提前断开',
+    'error': '其他错误'
+}
+
+
+def http_error_type(status):
+    if status == 429:
+        return 'throttled'
+    return 'http_5xx' if status >= 500 else 'http_4xx'
+
+
+def _exception_chain(exc):
+    chain = []
+    while exc is not None and exc not in chain:
+        chain.append(exc)
+        exc = exc.__cause__ or exc.__context__
+    return chain
+
+
+def classify_error(exc, phase='stream'):
+    """把异常归入ERROR_TYPES中的一类
+
+    phase为出错时所处的阶段：connect（建立连接）、request（等待响应头）或stream（读取响应流）。
+    同时适用于requests和OpenAI SDK抛出的异常：按异常链中的标准库异常类型判断，
+    第三方库的超时和TLS异常按类名识别。
+    """
+    chain = _exception_chain(exc)
+    names = [type(e).__name__ for e in chain]
+    if any(isinstance(e, EmptyResponseError) for e in chain):
+        return 'empty'
+    if any(isinstance(e, (StreamTimeout, TimeoutError)) for e in chain) or any('Timeout' in n for n in names):
+        return 'timeout'
+    status = getattr(exc, 'status', None) or getattr(exc, 'status_code', None)
+    if isinstance(status, int) and status >= 400:
+        return http_error_type(status)
+    if any(isinstance(e, (TLSHandshakeError, ssl.SSLError)) for e in chain) or any('SSL' in n for n in names):
+        return 'tls'
+    if phase == 'connect':
+        return 'connect'
+    if any(isinstance(e, ValueError) for e in chain):
+        # JSON解析失败、非UTF-8内容、分块长度无法解析等
+        return 'malformed_sse'
+    if any(isinstance(e, (OSError, EOFError)) for e in chain) or any('Connection' in n or 'Protocol' in n for n in names):
+        return 'disconnect'
+    return 'error'
+
+
+class HTTPStatusError(Exception):
+    """HTTP状态码非200时抛出"""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        super().__init__(f'API请求失败: HTTP {status} - {body[:200]}')
+
+
+class EmptyResponseError(Exception):
+    """响应流正常结束但没有任何输出内容时抛出（只有role的数据块不算内容）"""
+
+
+class TLSHandshakeError(ConnectionError):
+    """TCP连接已建立但TLS握手失败时抛出"""
+
+
+class StreamTimeout(Exception):
+    """某个阶段超过截止时间时抛出"""
+
+    def __init__(self, phase, limit):
+        self.phase = phase
+        self.limit = limit
+        super().__init__(f'{PHASE_NAMES[phase]}超时（{limit:g}秒）')
+
+
+class Deadlines:
+    """一次请求各阶段的截止时间；limits中的值为秒数，0或None表示不限制"""
+
+    def __init__(self, limits=None, start=None):
+        self.limits = dict(TIMEOUTS, **(limits or {}))
+        self.start = time.perf_counter() if start is None else start
+
+    def remaining(self, connecting=False, first_token=None, last_activity=None):
+        """返回(距离最近截止时间的秒数, 阶段)，没有任何限制时返回(None, None)"""
+        now = time.perf_counter()
+        candidates = []
+
+        def add(phase, since):
+            if self.limits.get(phase):
+                candidates.append((since + self.limits[phase] - now, phase))
+
+        add('total', self.start)
+        if connecting:
+            add('connect', self.start)
+        elif first_token is None:
+            add('ttft', self.start)
+        if last_activity is not None:
+            add('idle', last_activity)
+        if not candidates:
+            return None, None
+        remaining, phase = min(candidates)
+        return max(0.0, remaining), phase
+
+    async def wait(self, awaitable, **state):
+        """在最近的截止时间之前等待awaitable完成，超时则取消它并抛出StreamTimeout"""
+        timeout, phase = self.remaining(**state)
+        if phase is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise StreamTimeout(phase, self.limits[phase]) from None
+
+
+def check_deadlines(timeouts, start_time, first_token_time, last_chunk_time):
+    """同步的单平台脚本在处理每个数据块前调用，超过截止时间时抛出TimeoutError
+
+    时刻均为time.perf_counter()的读数；连接和读取的阻塞等待由HTTP客户端的timeout参数限制，
+    这里检查首token、数据块间隔和总耗时。
+    """
+    now = time.perf_counter()
+    if timeouts['total'] and now - start_time > timeouts['total']:
+        raise TimeoutError(f"请求超时：总耗时超过{timeouts['total']:g}秒")
+    if first_token_time is None and timeouts['ttft'] and now - start_time > timeouts['ttft']:
+        raise TimeoutError(f"请求超时：{timeouts['ttft']:g}秒内未收到首token")
+    if last_chunk_time is not None and timeouts['idle'] and now - last_chunk_time > timeouts['idle']:
+        raise TimeoutError(f"请求超时：数据块间隔超过{timeouts['idle']:g}秒")
+
+
+class _Connection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+        self.connect_time = 0.0
+        self.tls_time = 0.0
+
+    def usable(self):
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+
+class ConnectionPool:
+    """按(scheme, host, port)维护的keep-alive连接池"""
+
+    def __init__(self, max_per_host=512):
+        self.max_per_host = max_per_host
+        self._idle = {}
+        self._limits = {}
+        self._ssl_context = None
+        self.stats = {'opened': 0, 'reused': 0, 'closed': 0}
+
+    def _get_ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    async def acquire(self, key):
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.max_per_host)
+        await limit.acquire()
+        try:
+            idle = self._idle.get(key)
+            while idle:
+                conn = idle.pop()
+                if conn.usable():
+                    conn.reused = True
+                    conn.connect_time = conn.tls_time = 0.0
+                    self.stats['reused'] += 1
+                    return conn
+                self._close(conn)
+            return await self._open(key)
+        except BaseException:
+            limit.release()
+            raise
+
+    async def _open(self, key):
+        scheme, host, port = key
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(host, port)
+        connected = time.perf_counter()
+        conn = _Connection(key, reader, writer)
+        conn.connect_time = connected - start
+        if scheme == 'https':
+            # 单独进行TLS握手，以便区分TCP连接与TLS耗时
+            try:
+                await writer.start_tls(self._get_ssl_context(), server_hostname=host)
+            except Exception as e:
+                writer.close()
+                raise TLSHandshakeError(f'{e.__class__.__name__}: {e}'.rstrip(': ')) from e
+            except BaseException:
+                writer.close()
+                raise
+            conn.tls_time = time.perf_counter() - connected
+        self.stats['opened'] += 1
+        return conn
+
+    def _close(self, conn):
+        conn.writer.close()
+        self.stats['closed'] += 1
+
+    def release(self, conn, reusable):
+        """归还连接；响应未完整读取的连接不能复用，直接关闭"""
+        if reusable and conn.usable():
+            self._idle.setdefault(conn.key, []).append(conn)
+        else:
+            self._close(conn)
+        self._limits[conn.key].release()
+
+    async def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                self._close(conn)
+        self._idle = {}
+
+
+def parse_url(url):
+    parts = urlsplit(url)
+    scheme = parts.scheme or 'http'
+    port = parts.port or (443 if scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return (scheme, parts.hostname, port), path
+
+
+class SSEParser:
+    """增量解析SSE字节流，返回每个data字段的内容"""
+
+    def __init__(self):
+        self._buffer = b''
+
+    def feed(self, data):
+        self._buffer += data
+        lines = self._buffer.split(b'\n')
+        self._buffer = lines.pop()
+        events = []
+        for line in lines:
+            if line.startswith(b'data:'):
+                events.append(line[5:].strip().decode('utf-8'))
+        return events
+
+
+class JSONProgress:
+    """增量判断流式到达的JSON文本的顶层值是否已经闭合
+
+    只跟踪括号深度和字符串/转义状态，不做完整解析；闭合后是否为合法JSON由调用方在结束时用json.loads检查。
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.complete = False
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        """追加一段文本，返回顶层值是否已闭合"""
+        for char in text:
+            if self.complete:
+                break
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self.depth += 1
+                self.started = True
+            elif char in '}]':
+                self.depth -= 1
+                self.complete = self.started and self.depth == 0
+        return self.complete
+
+
+class ToolCallAssembler:
+    """按index拼接流式响应中delta.tool_calls的片段，并记录每个调用的参数JSON闭合的时刻"""
+
+    def __init__(self):
+        self._calls = {}
+
+    def feed(self, deltas, now):
+        """合并一个数据块中的tool_calls片段，返回本次收到的参数文本"""
+        received = []
+        for delta in deltas:
+            call = self._calls.setdefault(delta.get('index', 0), {
+                'id': None, 'name': '', 'parts': [], 'progress': JSONProgress(), 'complete_at': None
+            })
+            if delta.get('id'):
+                call['id'] = delta['id']
+            function = delta.get('function') or {}
+            if function.get('name'):
+                call['name'] += function['name']
+            arguments = function.get('arguments') or ''
+            if arguments:
+                call['parts'].append(arguments)
+                received.append(arguments)
+                if call['complete_at'] is None and call['progress'].feed(arguments):
+                    call['complete_at'] = now
+        return ''.join(received)
+
+    def complete_at(self):
+        """所有调用的参数JSON都已闭合的时刻；没有调用或尚未闭合时返回None"""
+        times = [call['complete_at'] for call in self._calls.values()]
+        return max(times) if times and None not in times else None
+
+    def calls(self):
+        return [
+            {'id': call['id'], 'name': call['name'], 'arguments': ''.join(call['parts'])}
+            for _, call in sorted(self._calls.items())
+        ]
+
+
+class ChatStream:
+    """一次OpenAI兼容接口请求，负责连接获取、请求发送和响应读取"""
+
+    def __init__(self, pool, provider, payload, extra_headers=None, path='/chat/completions'):
+        self.pool = pool
+        self.provider = provider
+        self.payload = payload
+        self.extra_headers = extra_headers or {}
+        self.key, self.path = parse_url(provider['base_url'].rstrip('/') + path)
+        self.conn = None
+        self.status = None
+        self.headers = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._complete = False
+        self._keep_alive = True
+
+    async def open(self):
+        await self.connect()
+        await self.send()
+
+    async def connect(self):
+        self.conn = await self.pool.acquire(self.key)
+
+    async def send(self):
+        """发送请求并读取响应头"""
+        body = json.dumps(self.payload, ensure_ascii=False).encode('utf-8')
+        host = self.key[1]
+        lines = [
+            f'POST {self.path} HTTP/1.1',
+            f'Host: {host}',
+            f'Authorization: Bearer {self.provider.get("api_key") or ""}',
+            'Content-Type: application/json',
+            'Accept: text/event-stream' if self.payload.get('stream') else 'Accept: application/json',
+            f'Content-Length: {len(body)}',
+            'Connection: keep-alive'
+        ]
+        lines += [f'{name}: {value}' for name, value in self.extra_headers.items()]
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + body
+        self.bytes_sent += len(request)
+        self.conn.writer.write(request)
+        await self.conn.writer.drain()
+
+        # 读取状态行和响应头
+        reader = self.conn.reader
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('服务器在返回响应头之前关闭了连接')
+        self.bytes_received += len(status_line)
+        self.status = int(status_line.split()[1])
+        while True:
+            line = await reader.readline()
+            self.bytes_received += len(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        if self.headers.get('connection', '').lower() == 'close':
+            self._keep_alive = False
+
+        if self.status != 200:
+            body = await self.read_body()
+            raise HTTPStatusError(self.status, self.headers, body.decode('utf-8', 'replace'))
+
+    async def iter_raw(self):
+        """按到达顺序返回响应体的原始字节块"""
+        reader = self.conn.reader
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size_line = await reader.readline()
+                if not size_line:
+                    raise ConnectionError('流式响应中途断开')
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # 跳过可能存在的trailer
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                data = await reader.readexactly(size + 2)
+                self.bytes_received += len(size_line) + size + 2
+                yield data[:-2]
+        elif 'content-length' in self.headers:
+            remaining = int(self.headers['content-length'])
+            while remaining > 0:
+                data = await reader.read(min(remaining, 65536))
+                if not data:
+                    raise ConnectionError('响应体未读取完整连接即被关闭')
+                remaining -= len(data)
+                self.bytes_received += len(data)
+                yield data
+        else:
+            self._keep_alive = False
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                self.bytes_received += len(data)
+                yield data
+        self._complete = True
+
+    async def read_body(self):
+        chunks = []
+        async for data in self.iter_raw():
+            chunks.append(data)
+        return b''.join(chunks)
+
+    async def events(self):
+        """返回(到达时间, 解析后的JSON)；遇到[DONE]结束"""
+        parser = SSEParser()
+        async for data in self.iter_raw():
+            now = time.perf_counter()
+            for event in parser.feed(data):
+                if event == '[DONE]':
+                    continue
+                yield now, json.loads(event)
+
+    async def close(self):
+        if self.conn is not None:
+            self.pool.release(self.conn, self._complete and self._keep_alive)
+            self.conn = None
+
+
+def calculate_input_tokens(messages):
+    # 与各测试脚本一致：使用UTF-8编码字节长度估算
+    return sum(len(message['content'].encode('utf-8')) for message in messages)
+
+
+def cached_prompt_tokens(usage):
+    """usage中命中缓存的输入token数：DeepSeek为prompt_cache_hit_tokens，OpenAI兼容格式为prompt_tokens_details.cached_tokens"""
+    if usage.get('prompt_cache_hit_tokens') is not None:
+        return usage['prompt_cache_hit_tokens']
+    details = usage.get('prompt_tokens_details') or {}
+    return details.get('cached_tokens') or 0
+
+
+def build_payload(provider, messages, max_tokens=512, stream=True, extra_body=None):
+    payload = {
+        'model': provider['model'],
+        'messages': messages,
+        'stream': stream,
+        'max_tokens': max_tokens
+    }
+    if stream:
+        # 请求在最后一个数据块中返回真实的token用量
+        payload['stream_options'] = {'include_usage': True}
+    if extra_body:
+        payload.update(extra_body)
+    return payload
+
+
+def new_sample(provider, start):
+    return {
+        'provider': provider['name'],
+        'model': provider['model'],
+        'ok': False,
+        'error': None,
+        'error_type': None,
+        'http_status': None,
+        'start': start,
+        'reused': False,
+        'connect_time': 0.0,
+        'tls_time': 0.0,
+        'network_latency': 0.0,
+        'first_token_time': 0.0,
+        'output_time': 0.0,
+        'total_time': 0.0,
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'cached_tokens': 0,
+        'usage_reported': False,
+        'bytes_sent': 0,
+        'bytes_received': 0,
+        'output_speed': 0.0,
+        'itl': [],
+        'rate_limit_headers': {},
+        'timeout_phase': None,
+        'tool_calls': [],
+        'first_tool_call_time': 0.0,
+        'structured_time': 0.0,
+        'content': ''
+    }
+
+
+async def stream_chat(pool, provider, messages, max_tokens=512, extra_body=None, keep_text=False, progress=None,
+                      timeouts=None):
+    """发送一次流式请求并返回性能样本字典
+
+    progress为可选的字典，流式过程中实时写入first_token（到达时刻）和output_tokens，
+    若其中包含'event'（asyncio.Event），收到首token时会被set，便于调用方在请求完成前做出反应。
+    timeouts为各阶段超时（秒）的字典，未指定的阶段使用config.TIMEOUTS中的默认值。
+    keep_text为True时sample['content']保存回答正文（不含reasoning_content），可作为多轮对话的assistant消息。
+    """
+    start = time.perf_counter()
+    deadlines = Deadlines(timeouts, start)
+    sample = new_sample(provider, start)
+    payload = build_payload(provider, messages, max_tokens, True, extra_body)
+    stream = ChatStream(pool, provider, payload)
+    first_token = None
+    last_token = None
+    output_bytes = 0
+    usage = None
+    parts = []
+    tools = ToolCallAssembler()
+    first_tool_call = None
+    response_format = payload.get('response_format') or {}
+    json_content = JSONProgress() if response_format.get('type') in ('json_object', 'json_schema') else None
+    structured = None
+    phase = 'connect'
+    try:
+        await deadlines.wait(stream.connect(), connecting=True)
+        phase = 'request'
+        await deadlines.wait(stream.send())
+        phase = 'stream'
+        sample['network_latency'] = time.perf_counter() - start
+        # 收到第一个数据块之前由ttft限制，之后由idle限制相邻数据块的间隔
+        last_activity = None
+        sample['http_status'] = stream.status
+        events = stream.events()
+        while True:
+            try:
+                now, data = await deadlines.wait(events.__anext__(), first_token=first_token,
+                                                 last_activity=last_activity)
+            except StopAsyncIteration:
+                break
+            last_activity = now
+            if data.get('usage'):
+                usage = data['usage']
+            choices = data.get('choices')
+            if not choices:
+                continue
+            delta = choices[0].get('delta') or {}
+            # 只包含role的数据块不计为首token
+            text = delta.get('content') or delta.get('reasoning_content')
+            if delta.get('tool_calls'):
+                if first_tool_call is None:
+                    first_tool_call = now
+                text = (text or '') + tools.feed(delta['tool_calls'], now)
+            if json_content is not None and delta.get('content') and structured is None \
+                    and json_content.feed(delta['content']):
+                structured = now
+            if not text:
+                continue
+            if first_token is None:
+                first_token = now
+                if progress is not None:
+                    progress['first_token'] = now
+                    if progress.get('event') is not None:
+                        progress['event'].set()
+            else:
+                sample['itl'].append(now - last_token)
+            last_token = now
+            output_bytes += len(text.encode('utf-8'))
+            if progress is not None:
+                progress['output_tokens'] = output_bytes
+            if keep_text and delta.get('content'):
+                parts.append(delta['content'])
+        sample['ok'] = first_token is not None
+        if not sample['ok']:
+            sample['error'] = '响应流中没有任何输出内容'
+            sample['error_type'] = 'empty'
+    except StreamTimeout as e:
+        sample['error'] = str(e)
+        sample['error_type'] = 'timeout'
+        sample['timeout_phase'] = e.phase
+    except HTTPStatusError as e:
+        sample['http_status'] = e.status
+        sample['error'] = str(e)
+        sample['error_type'] = http_error_type(e.status)
+    except Exception as e:
+        sample['error'] = f'{e.__class__.__name__}: {e}' if str(e) else e.__class__.__name__
+        sample['error_type'] = classify_error(e, phase)
+    finally:
+        sample['rate_limit_headers'] = {
+            name: value for name, value in stream.headers.items() if is_rate_limit_header(name)
+        }
+        sample['bytes_sent'] = stream.bytes_sent
+        sample['bytes_received'] = stream.bytes_received
+        if stream.conn is not None:
+            sample['reused'] = stream.conn.reused
+            sample['connect_time'] = stream.conn.connect_time
+            sample['tls_time'] = stream.conn.tls_time
+        await stream.close()
+
+    end = time.perf_counter()
+    sample['total_time'] = end - start
+    if first_token is not None:
+        sample['first_token_time'] = first_token - start
+        sample['output_time'] = last_token - first_token
+    sample['input_tokens'] = calculate_input_tokens(messages)
+    sample['output_tokens'] = output_bytes
+    if usage:
+        sample['input_tokens'] = usage.get('prompt_tokens', sample['input_tokens'])
+        sample['output_tokens'] = usage.get('completion_tokens', sample['output_tokens'])
+        sample['cached_tokens'] = cached_prompt_tokens(usage)
+        sample['usage_reported'] = True
+    if sample['output_time'] > 0:
+        sample['output_speed'] = sample['output_tokens'] / sample['output_time']
+    sample['tool_calls'] = tools.calls()
+    if first_tool_call is not None:
+        sample['first_tool_call_time'] = first_tool_call - start
+        structured = tools.complete_at()
+    if structured is not None:
+        sample['structured_time'] = structured - start
+    if keep_text:
+        sample['content'] = ''.join(parts)
+    return sample
+
+
+async def complete_chat(pool, provider, messages, max_tokens=512, extra_body=None, timeouts=None):
+    """发送一次非流式请求并返回性能样本字典（字段与stream_chat一致）
+
+    非流式响应在生成结束后一次性返回，first_token_time与total_time相同；
+    只使用connect和total两个截止时间，ttft和idle不适用。
+    """
+    start = time.perf_counter()
+    deadlines = Deadlines(dict(timeouts or {}, ttft=0, idle=0), start)
+    sample = new_sample(provider, start)
+    payload = build_payload(provider, messages, max_tokens, False, extra_body)
+    stream = ChatStream(pool, provider, payload)
+    phase = 'connect'
+    data = None
+    try:
+        await deadlines.wait(stream.connect(), connecting=True)
+        phase = 'request'
+        await deadlines.wait(stream.send())
+        sample['network_latency'] = time.perf_counter() - start
+        sample['http_status'] = stream.status
+        phase = 'stream'
+        data = json.loads(await deadlines.wait(stream.read_body()))
+        message = (data.get('choices') or [{}])[0].get('message') or {}
+        text = (message.get('reasoning_content') or '') + (message.get('content') or '')
+        for call in message.get('tool_calls') or []:
+            function = call.get('function') or {}
+            sample['tool_calls'].append(
+                {'id': call.get('id'), 'name': function.get('name', ''), 'arguments': function.get('arguments', '')}
+            )
+            text += function.get('arguments', '')
+        sample['ok'] = bool(text)
+        sample['output_tokens'] = len(text.encode('utf-8'))
+        if not sample['ok']:
+            sample['error'] = '响应中没有任何输出内容'
+            sample['error_type'] = 'empty'
+    except StreamTimeout as e:
+        sample['error'] = str(e)
+        sample['error_type'] = 'timeout'
+        sample['timeout_phase'] = e.phase
+    except HTTPStatusError as e:
+        sample['http_status'] = e.status
+        sample['error'] = str(e)
+        sample['error_type'] = http_error_type(e.status)
+    except Exception as e:
+        sample['error'] = f'{e.__class__.__name__}: {e}' if str(e) else e.__class__.__name__
+        sample['error_type'] = classify_error(e, phase)
+    finally:
+        sample['rate_limit_headers'] = {
+            name: value for name, value in stream.headers.items() if is_rate_limit_header(name)
+        }
+        sample['bytes_sent'] = stream.bytes_sent
+        sample['bytes_received'] = stream.bytes_received
+        if stream.conn is not None:
+            sample['reused'] = stream.conn.reused
+            sample['connect_time'] = stream.conn.connect_time
+            sample['tls_time'] = stream.conn.tls_time
+        await stream.close()
+
+    sample['total_time'] = time.perf_counter() - start
+    sample['input_tokens'] = calculate_input_tokens(messages)
+    usage = (data or {}).get('usage') if isinstance(data, dict) else None
+    if usage:
+        sample['input_tokens'] = usage.get('prompt_tokens', sample['input_tokens'])
+        sample['output_tokens'] = usage.get('completion_tokens', sample['output_tokens'])
+        sample['cached_tokens'] = cached_prompt_tokens(usage)
+        sample['usage_reported'] = True
+    if sample['ok']:
+        # 非流式无法区分首token和输出阶段，输出速度按整个请求的耗时计算
+        sample['first_token_time'] = sample['total_time']
+        sample['output_speed'] = sample['output_tokens'] / sample['total_time']
+    return sample
+
+
+def decode_embeddings(items):
+    """将/embeddings响应中的data解码为float32的NumPy矩阵（按index排序）
+
+    base64格式直接把小端float32字节解释为数组并写入预分配的矩阵，不经过Python浮点对象；
+    平台忽略encoding_format而返回浮点数列表时整体转换一次。
+    """
+    import base64
+
+    import numpy as np
+
+    items = sorted(items, key=lambda item: item.get('index', 0))
+    if not items:
+        return np.empty((0, 0), dtype=np.float32)
+    if not isinstance(items[0]['embedding'], str):
+        return np.asarray([item['embedding'] for item in items], dtype=np.float32)
+    first = np.frombuffer(base64.b64decode(items[0]['embedding']), dtype='<f4')
+    matrix = np.empty((len(items), first.size), dtype=np.float32)
+    matrix[0] = first
+    for row, item in enumerate(items[1:], 1):
+        matrix[row] = np.frombuffer(base64.b64decode(item['embedding']), dtype='<f4')
+    return matrix
+
+
+async def embed(pool, provider, inputs, encoding_format='base64', dimensions=None, timeouts=None, keep_vectors=False):
+    """发送一次/embeddings请求并返回性能样本字典
+
+    provider['model']为embedding模型。total_time为收到完整响应体的时间，
+    decode_time为解析JSON和解码向量的客户端耗时，不计入total_time。
+    keep_vectors为True时sample['embeddings']保存解码后的float32矩阵。
+    """
+    start = time.perf_counter()
+    deadlines = Deadlines(dict(timeouts or {}, ttft=0, idle=0), start)
+    sample = {
+        'provider': provider['name'],
+        'model': provider['model'],
+        'ok': False,
+        'error': None,
+        'error_type': None,
+        'http_status': None,
+        'start': start,
+        'reused': False,
+        'connect_time': 0.0,
+        'tls_time': 0.0,
+        'network_latency': 0.0,
+        'total_time': 0.0,
+        'decode_time': 0.0,
+        'batch': len(inputs),
+        'vectors': 0,
+        'dim': 0,
+        'input_tokens': sum(len(text.encode('utf-8')) for text in inputs),
+        'usage_reported': False,
+        'bytes_sent': 0,
+        'bytes_received': 0,
+        'embeddings': None
+    }
+    payload = {'model': provider['model'], 'input': list(inputs), 'encoding_format': encoding_format}
+    if dimensions:
+        payload['dimensions'] = dimensions
+    stream = ChatStream(pool, provider, payload, path='/embeddings')
+    phase = 'connect'
+    try:
+        await deadlines.wait(stream.connect(), connecting=True)
+        phase = 'request'
+        await deadlines.wait(stream.send())
+        sample['network_latency'] = time.perf_counter() - start
+        sample['http_status'] = stream.status
+        phase = 'stream'
+        body = await deadlines.wait(stream.read_body())
+        sample['total_time'] = time.perf_counter() - start
+        decode_start = time.perf_counter()
+        data = json.loads(body)
+        matrix = decode_embeddings(data.get('data') or [])
+        sample['decode_time'] = time.perf_counter() - decode_start
+        sample['vectors'], sample['dim'] = matrix.shape
+        usage = data.get('usage') or {}
+        if usage.get('prompt_tokens') is not None:
+            sample['input_tokens'] = usage['prompt_tokens']
+            sample['usage_reported'] = True
+        if keep_vectors:
+            sample['embeddings'] = matrix
+        sample['ok'] = sample['vectors'] == len(inputs) and sample['dim'] > 0
+        if not sample['ok']:
+            sample['error'] = f"返回{sample['vectors']}个向量，请求{len(inputs)}个"
+            sample['error_type'] = 'empty'
+    except StreamTimeout as e:
+        sample['error'] = str(e)
+        sample['error_type'] = 'timeout'
+    except HTTPStatusError as e:
+        sample['http_status'] = e.status
+        sample['error'] = str(e)
+        sample['error_type'] = http_error_type(e.status)
+    except Exception as e:
+        sample['error'] = f'{e.__class__.__name__}: {e}' if str(e) else e.__class__.__name__
+        sample['error_type'] = classify_error(e, phase)
+    finally:
+        sample['bytes_sent'] = stream.bytes_sent
+        sample['bytes_received'] = stream.bytes_received
+        if stream.conn is not None:
+            sample['reused'] = stream.conn.reused
+            sample['connect_time'] = stream.conn.connect_time
+            sample['tls_time'] = stream.conn.tls_time
+        await stream.close()
+
+    if not sample['total_time']:
+        sample['total_time'] = time.perf_counter() - start
+    return sample
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+'''
+流式与非流式端到端对比
+
+功能说明：
+- 对每个平台用相同的消息和max_tokens分别发送流式(stream=true)和非流式请求
+- 两种方式交替进行，每轮随机决定先后顺序，避免时段和连接预热带来的偏差
+- 请求逐个串行发送，每个请求前后读取进程CPU时间，得到单个请求的客户端CPU开销
+- 按平台对比两种方式的完整响应耗时、HTTP层收发字节数和客户端CPU，
+  判断SSE流式传输在该平台上是节省还是增加了端到端耗时（批处理任务不需要逐token输出）
+
+运行命令：
+python stream_compare.py --providers ark,aliyun --requests 10
+python stream_compare.py --providers mock --requests 20 --max-tokens 256
+
+配置参数：
+⭐ --providers：平台名称，逗号分隔（与loadgen.py相同，mock为本地模拟服务器）
+⭐ --requests：每个平台每种方式的请求数
+⭐ --max-tokens / --prompt：请求的最大输出token数和测试消息
+⭐ --seed：随机种子，便于复现先后顺序
+'''
+
+import argparse
+import asyncio
+import random
+import time
+
+from histogram import LatencyHistogram
+from loadgen import DEFAULT_MESSAGES, MOCK_BASE_URL, describe_errors, resolve_provider
+from stream_client import ConnectionPool, complete_chat, stream_chat
+
+MODES = {'流式': stream_chat, '非流式': complete_chat}
+
+
+class ModeStats:
+    """单个平台单种方式的汇总"""
+
+    def __init__(self):
+        self.total = LatencyHistogram()
+        self.ttft = LatencyHistogram()
+        self.ok = 0
+        self.errors = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.output_tokens = 0
+        self.cpu_time = 0.0
+
+    def record(self, sample, cpu_time):
+        if not sample['ok']:
+            kind = sample['error_type'] or 'error'
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            return
+        self.ok += 1
+        self.total.record(sample['total_time'])
+        self.ttft.record(sample['first_token_time'])
+        self.bytes_sent += sample['bytes_sent']
+        self.bytes_received += sample['bytes_received']
+        self.output_tokens += sample['output_tokens']
+        self.cpu_time += cpu_time
+
+
+async def compare(providers, requests, messages, max_tokens, seed=None):
+    """返回 {平台名称: {方式: ModeStats}}"""
+    rng = random.Random(seed)
+    pool = ConnectionPool()
+    results = {provider['name']: {mode: ModeStats() for mode in MODES} for provider in providers}
+    try:
+        for round_index in range(requests):
+            for provider in providers:
+                order = list(MODES)
+                rng.shuffle(order)
+                for mode in order:
+                    # 串行执行，请求前后的进程CPU时间之差即为该请求的客户端CPU开销
+                    cpu_start = time.process_time()
+                    sample = await MODES[mode](pool, provider, messages, max_tokens)
+                    cpu_time = time.process_time() - cpu_start
+                    results[provider['name']][mode].record(sample, cpu_time)
+                    status = f"{sample['total_time']:.2f}秒" if sample['ok'] else f"失败({sample['error_type']})"
+                    print(f"[{round_index + 1}/{requests}] {provider['name']} {mode}: {status}")
+    finally:
+        await pool.close()
+    return results
+
+
+def compare_rows(results):
+    rows = []
+    for name, modes in results.items():
+        for mode, stats in modes.items():
+            ok = stats.ok or 1
+            rows.append([
+                name, mode,
+                f'{stats.ok}/{stats.ok + sum(stats.errors.values())}',
+                f'{stats.ttft.percentile(50):.2f}' if stats.ok and mode == '流式' else '-',
+                f'{stats.total.percentile(50):.2f}' if stats.ok else '-',
+                f'{stats.total.percentile(95):.2f}' if stats.ok else '-',
+                f'{stats.bytes_received / ok / 1024:.1f}' if stats.ok else '-',
+                f'{stats.bytes_received / stats.output_tokens:.1f}' if stats.output_tokens else '-',
+                f'{stats.bytes_sent / ok:.0f}' if stats.ok else '-',
+                f'{stats.cpu_time / ok * 1000:.2f}' if stats.ok else '-'
+            ])
+    return rows
+
+
+COMPARE_HEADERS = [
+    '平台', '方式', '成功', '首token p50(秒)', '总耗时 p50(秒)', '总耗时 p95(秒)',
+    '接收KB/请求', '接收字节/输出token', '发送字节/请求', '客户端CPU(毫秒/请求)'
+]
+
+
+def verdicts(results):
+    """按总耗时p50比较两种方式，返回每个平台的结论"""
+    lines = []
+    for name, modes in results.items():
+        streaming, blocking = modes['流式'], modes['非流式']
+        if not streaming.ok or not blocking.ok:
+            lines.append(f"- {name}: 有一种方式没有成功的请求，无法比较")
+            continue
+        diff = blocking.total.percentile(50) - streaming.total.percentile(50)
+        faster = '非流式更快' if diff < 0 else '流式更快'
+        extra_bytes = streaming.bytes_received / streaming.ok - blocking.bytes_received / blocking.ok
+        extra_cpu = (streaming.cpu_time / streaming.ok - blocking.cpu_time / blocking.ok) * 1000
+        lines.append(f"- {name}: {faster}，总耗时p50相差{abs(diff):.2f}秒；"
+                     f"流式每个请求多接收{extra_bytes / 1024:.1f}KB，多消耗客户端CPU {extra_cpu:.2f}毫秒")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式与非流式端到端对比')
+    parser.add_argument('--providers', default='mock', help='平台名称，逗号分隔')
+    parser.add_argument('--requests', type=int, default=5, help='每个平台每种方式的请求数')
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--prompt', default=DEFAULT_MESSAGES[0]['content'], help='测试消息')
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    parser.add_argument('--seed', type=int, help='随机种子')
+    args = parser.parse_args()
+
+    providers = [resolve_provider(name.strip(), args.mock_url) for name in args.providers.split(',') if name.strip()]
+    messages = [{"role": "user", "content": args.prompt}]
+
+    print("===== 流式与非流式对比 =====")
+    print(f"平台: {', '.join(provider['name'] for provider in providers)}, 每种方式{args.requests}个请求, "
+          f"max_tokens {args.max_tokens}\n")
+    results = asyncio.run(compare(providers, args.requests, messages, args.max_tokens, args.seed))
+
+    from tabulate import tabulate
+
+    print("\n对比结果：")
+    print(tabulate(compare_rows(results), headers=COMPARE_HEADERS, tablefmt='grid', disable_numparse=True))
+    print("\n结论：")
+    for line in verdicts(results):
+        print(line)
+    for name, modes in results.items():
+        for mode, stats in modes.items():
+            if stats.errors:
+                print(f"- {name} {mode} 错误分布: {describe_errors(stats.errors)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -20,13 +20,24 @@ python tencent_test.py
 
 import sys
 import time
-from openai import OpenAI
+from openai import OpenAI, Timeout
 from config import config
+from stream_client import EmptyResponseError, check_deadlines, classify_error
 
-# 初始化OpenAI客户端
+# 各阶段超时（秒），默认值见config.py中的TIMEOUTS，可用STREAM_*_TIMEOUT环境变量覆盖
+timeouts = config.timeouts()
+
+# 读取超时同时限制等待响应头和相邻数据块之间的间隔，且不超过总超时
+read_timeout = max(timeouts['ttft'], timeouts['idle'])
+if timeouts['total']:
+    read_timeout = min(read_timeout or timeouts['total'], timeouts['total'])
+
+# 初始化OpenAI客户端（关闭自动重试，超时即记为失败）
 client = OpenAI(
     api_key=config.tencent['api_key'],
-    base_url=config.tencent['base_url']
+    base_url=config.tencent['base_url'],
+    timeout=Timeout(timeouts['connect'] or None, read=read_timeout or None),
+    max_retries=0
 )
 
 # 测试消息
@@ -59,12 +70,14 @@ def write_stream_content(text):
 print("正在发送API请求...")
 
 try:
-    # 记录开始时间
-    start_time = time.time()
+    # 记录开始时间（perf_counter为单调高精度时钟，不受系统时间调整影响）
+    start_time = time.perf_counter()
     first_token_time = None
     network_latency = None
     content = ""
     reasoning_content = ""
+    last_chunk_time = None
+    response = None
     
     # 发送流式请求
     response = client.chat.completions.create(
@@ -74,15 +87,18 @@ try:
     )
     
     # 获取首次网络连接时间
-    network_latency = time.time() - start_time
+    network_latency = time.perf_counter() - start_time
     
     print("\n🔍 开始接收响应流：")
     
     # 处理流式响应
     for chunk in response:
-        # 记录首个token的时间
-        if first_token_time is None:
-            first_token_time = time.time()
+        check_deadlines(timeouts, start_time, first_token_time, last_chunk_time)
+        last_chunk_time = time.perf_counter()
+        # 记录首个token的时间：第一个数据块通常只包含role、没有内容，不能计为首token
+        delta = chunk.choices[0].delta if chunk.choices else None
+        if first_token_time is None and delta is not None and (getattr(delta, 'reasoning_content', None) or delta.content):
+            first_token_time = last_chunk_time
             print("首个token响应时间：{:.2f}秒".format(first_token_time - start_time))
         
         # 处理推理内容
@@ -95,11 +111,13 @@ try:
             write_stream_content(chunk.choices[0].delta.content)
     
     # 计算结束时间和总耗时
-    end_time = time.time()
+    end_time = time.perf_counter()
     total_time = end_time - start_time
+    if first_token_time is None:
+        raise EmptyResponseError('响应流中没有任何输出内容')
     
-    # 计算实际输出耗时（总时间 - 首个token时间 - 网络延迟）
-    output_time = total_time - (first_token_time - start_time) - network_latency
+    # 计算实际输出耗时（从首个token到响应结束；首token时间已包含网络延迟，不再重复扣除）
+    output_time = end_time - first_token_time
     
     # 计算token使用情况
     input_tokens = calculate_input_tokens(messages)
@@ -122,4 +140,23 @@ try:
 
 except Exception as e:
     print("\n❌ 发生错误：{}".format(str(e)))
+    # 错误分类，run_tests.py据此识别失败的样本，不再按补零后的数值参与排名
+    print("错误类型：{}".format(classify_error(e, 'connect' if network_latency is None else 'stream')))
+    
+    # 超时或出错时立即关闭连接，不再等待剩余的响应
+    if response is not None:
+        response.close()
+    
+    # 输出已获得的部分指标
+    if network_latency is not None:
+        end_time = time.perf_counter()
+        print("\n📊 部分性能统计：")
+        print("网络延迟：{:.2f}秒".format(network_latency))
+        if first_token_time is not None:
+            print("首个token响应：{:.2f}秒".format(first_token_time - start_time))
+            print("实际输出耗时：{:.2f}秒".format(end_time - first_token_time))
+        print("总耗时：{:.2f}秒".format(end_time - start_time))
+        print("\n📝 部分Token统计：")
+        print("输入Token：{}".format(calculate_input_tokens(messages)))
+        print("输出Token：{}".format(calculate_output_tokens(content)))
     exit(1)
\ No newline at end of file
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+'''
+工具调用与JSON模式延迟基准测试
+
+功能说明：
+- tools负载：请求带有tools（function calling），测量收到第一个delta.tool_calls片段的时间，
+  以及流式拼接的参数JSON闭合（完整）的时间
+- json负载：请求使用response_format={"type": "json_object"}，测量首token时间和回答正文JSON闭合的时间
+- 结束后解析工具参数/回答正文，统计每个平台的JSON解析成功率和必填字段完整率
+- 智能体的每一步都要等工具调用的参数完整后才能执行，这里的“参数完整”延迟比普通首token更能反映真实等待时间
+
+运行命令：
+python tool_bench.py --providers ark,siliconflow,deepseek --requests 20 --concurrency 4
+python tool_bench.py --providers mock --workloads tools --requests 50
+
+配置参数：
+⭐ --workloads：tools、json，逗号分隔
+⭐ --requests / --concurrency：每个“平台 × 负载”的请求数和并发数
+
+注意：推理模型（如deepseek-r1）在部分平台上不支持工具调用或JSON模式，此时请求会以HTTP 4xx失败，
+可通过<前缀>_MODEL_ID切换到对应平台的通用模型
+'''
+
+import argparse
+import asyncio
+import json
+
+from histogram import LatencyHistogram
+from loadgen import MOCK_BASE_URL, add_timeout_arguments, describe_errors, resolve_provider, timeouts_from_args
+from stream_client import ConnectionPool, stream_chat
+
+WEATHER_TOOL = {
+    'type': 'function',
+    'function': {
+        'name': 'get_weather',
+        'description': '查询指定城市当前的天气',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'city': {'type': 'string', 'description': '城市名称，例如：北京'},
+                'unit': {'type': 'string', 'enum': ['celsius', 'fahrenheit'], 'description': '温度单位'}
+            },
+            'required': ['city']
+        }
+    }
+}
+
+# 负载名称 -> 消息、附加请求参数和结构化输出中的必填字段
+WORKLOADS = {
+    'tools': {
+        'messages': [{"role": "user", "content": "北京现在天气怎么样？请调用工具查询。"}],
+        'extra_body': {'tools': [WEATHER_TOOL], 'tool_choice': 'auto'},
+        'required': ['city']
+    },
+    'json': {
+        'messages': [
+            {"role": "system", "content": "你是一个只输出JSON的助手。"},
+            {"role": "user", "content": "请用JSON对象介绍北京，包含字段name（字符串）、population（数字）、landmarks（字符串数组）。"}
+        ],
+        'extra_body': {'response_format': {'type': 'json_object'}},
+        'required': ['name', 'population', 'landmarks']
+    }
+}
+
+
+def check_output(sample, workload):
+    """返回(是否收到结构化输出, JSON是否可解析, 必填字段是否齐全)"""
+    if workload == 'tools':
+        if not sample['tool_calls']:
+            return False, False, False
+        texts = [call['arguments'] or '{}' for call in sample['tool_calls']]
+    else:
+        if not sample['content']:
+            return False, False, False
+        texts = [sample['content']]
+    try:
+        values = [json.loads(text) for text in texts]
+    except ValueError:
+        return True, False, False
+    if not all(isinstance(value, dict) for value in values):
+        return True, False, False
+    required = WORKLOADS[workload]['required']
+    return True, True, all(field in values[0] for field in required)
+
+
+class StructuredStats:
+    """一个“平台 × 负载”的汇总"""
+
+    def __init__(self, name, workload):
+        self.name = name
+        self.workload = workload
+        # tools负载为第一个tool_calls片段，json负载为首token
+        self.first = LatencyHistogram()
+        self.structured = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self.attempts = 0
+        self.ok = 0
+        self.received = 0
+        self.valid = 0
+        self.complete_fields = 0
+        self.errors = {}
+
+    def record(self, sample):
+        self.attempts += 1
+        if not sample['ok']:
+            kind = sample['error_type'] or 'error'
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            return
+        self.ok += 1
+        self.total.record(sample['total_time'])
+        received, valid, complete_fields = check_output(sample, self.workload)
+        if not received:
+            return
+        self.received += 1
+        self.valid += valid
+        self.complete_fields += complete_fields
+        self.first.record(sample['first_tool_call_time'] if self.workload == 'tools' else sample['first_token_time'])
+        if sample['structured_time']:
+            self.structured.record(sample['structured_time'])
+
+
+async def run_cell(pool, provider, workload, requests, concurrency, max_tokens, timeouts):
+    stats = StructuredStats(provider['name'], workload)
+    spec = WORKLOADS[workload]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one():
+        async with semaphore:
+            sample = await stream_chat(pool, provider, spec['messages'], max_tokens, spec['extra_body'],
+                                       keep_text=True, timeouts=timeouts)
+        stats.record(sample)
+
+    await asyncio.gather(*[one() for _ in range(requests)])
+    return stats
+
+
+async def run_all(providers, workloads, requests, concurrency, max_tokens=512, timeouts=None):
+    """各“平台 × 负载”同时运行，返回StructuredStats列表"""
+    pool = ConnectionPool()
+    try:
+        cells = await asyncio.gather(*[
+            run_cell(pool, provider, workload, requests, concurrency, max_tokens, timeouts)
+            for provider in providers for workload in workloads
+        ])
+    finally:
+        await pool.close()
+    return cells
+
+
+def _percentiles(hist, count):
+    return f'{hist.percentile(50):.2f}/{hist.percentile(95):.2f}' if count else '-'
+
+
+def _rate(part, whole):
+    return f'{part / whole:.0%}' if whole else '-'
+
+
+def cell_rows(cells):
+    rows = []
+    for cell in cells:
+        rows.append([
+            cell.name, cell.workload, f'{cell.ok}/{cell.attempts}',
+            _rate(cell.received, cell.ok),
+            _percentiles(cell.first, cell.first.count),
+            _percentiles(cell.structured, cell.structured.count),
+            _percentiles(cell.total, cell.ok),
+            _rate(cell.valid, cell.received),
+            _rate(cell.complete_fields, cell.received)
+        ])
+    return rows
+
+
+CELL_HEADERS = [
+    '平台', '负载', '成功', '结构化输出率', '首个片段 p50/p95(秒)', '参数/JSON完整 p50/p95(秒)',
+    '总耗时 p50/p95(秒)', 'JSON解析成功率', '必填字段完整率'
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='工具调用与JSON模式延迟基准测试')
+    parser.add_argument('--providers', default='mock', help='平台名称，逗号分隔')
+    parser.add_argument('--workloads', default='tools,json', help='负载名称，逗号分隔（tools、json）')
+    parser.add_argument('--requests', type=int, default=10, help='每个“平台 × 负载”的请求数')
+    parser.add_argument('--concurrency', type=int, default=2, help='每个“平台 × 负载”的并发数')
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--mock-url', default=MOCK_BASE_URL, help='mock平台的API地址')
+    add_timeout_arguments(parser)
+    args = parser.parse_args()
+
+    workloads = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"未知的负载: {', '.join(unknown)}")
+    providers = [resolve_provider(name.strip(), args.mock_url) for name in args.providers.split(',') if name.strip()]
+
+    print("===== 工具调用与JSON模式延迟测试 =====")
+    print(f"平台: {', '.join(provider['name'] for provider in providers)}, 负载: {', '.join(workloads)}, "
+          f"每格{args.requests}个请求, 并发{args.concurrency}\n")
+    cells = asyncio.run(run_all(providers, workloads, args.requests, args.concurrency, args.max_tokens,
+                                timeouts_from_args(args)))
+
+    from tabulate import tabulate
+
+    print(tabulate(cell_rows(cells), headers=CELL_HEADERS, tablefmt='grid', disable_numparse=True))
+    for cell in cells:
+        if cell.errors:
+            print(f"- {cell.name} {cell.workload} 错误分布: {describe_errors(cell.errors)}")
+    print("\n说明：首个片段在tools负载下为第一个delta.tool_calls片段，在json负载下为首token；"
+          "结构化输出率为返回了工具调用（tools）或非空正文（json）的成功请求占比")
+
+
+if __name__ == '__main__':
+    main()